@@ -1,2 +1,53 @@
+import importlib
+
+# パッケージの公開API (名前: 定義しているモジュール)
+# 重い依存ライブラリを読み込まないよう、最初に参照されたときにモジュールを読み込む
+_LAZY_ATTRIBUTES = {
+    "make_client": "cryptolens.api",
+    "load_api_key": "cryptolens.api",
+    "load_api_keys": "cryptolens.api",
+    "open_stores": "cryptolens.api",
+    "load_latest": "cryptolens.api",
+    "refresh_data": "cryptolens.api",
+    "fetch_data": "cryptolens.api",
+    "apply_price_changes": "cryptolens.api",
+    "analyze_data": "cryptolens.api",
+    "export_data": "cryptolens.api",
+    "quality_rules": "cryptolens.api",
+    "screen_coins": "cryptolens.api",
+    "record_changes": "cryptolens.api",
+    "CategoryIndex": "cryptolens.categories",
+    "HttpClient": "cryptolens.client",
+    "crawl_detail_info": "cryptolens.crawl",
+    "Threshold": "cryptolens.diff",
+    "diff_tables": "cryptolens.diff",
+    "export_frames": "cryptolens.export",
+    "run_pipeline": "cryptolens.pipeline",
+    "CoinIdResolver": "cryptolens.resolver",
+    "Scheduler": "cryptolens.scheduler",
+    "FeatureMatrix": "cryptolens.screening",
+    "Filter": "cryptolens.screening",
+    "Screen": "cryptolens.screening",
+    "Term": "cryptolens.screening",
+    "HistoryStore": "cryptolens.store",
+    "Rule": "cryptolens.validation",
+    "validate": "cryptolens.validation",
+}
+
+__all__ = ["hello"] + list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
 def hello() -> str:
     return "Hello from cryptolens!"
@@ -0,0 +1,353 @@
+import os
+from datetime import datetime, timedelta
+from functools import partial
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+from cryptolens import config
+from cryptolens.cache import ResponseCache
+from cryptolens.categories import CategoryIndex
+from cryptolens.client import HttpClient
+from cryptolens.crawl import crawl_detail_info
+from cryptolens.diff import DEFAULT_THRESHOLDS, update_change_feed
+from cryptolens.export import export_frames
+from cryptolens.journal import CrawlJournal
+from cryptolens.klines import (
+    PRICE_CHANGE_HORIZONS,
+    KlineStore,
+    backfill_klines,
+    compute_kline_metrics,
+)
+from cryptolens.metrics import RunMetrics
+from cryptolens.pipeline import run_pipeline
+from cryptolens.ratios import RatioHistory, backfill_ratios
+from cryptolens.refresh import (
+    import_feather_snapshots,
+    refresh_category_data,
+    refresh_coin_data,
+    update_by_key,
+)
+from cryptolens.resolver import CoinIdResolver
+from cryptolens.schema import CATEGORIES_SCHEMA, COINS_SCHEMA
+from cryptolens.screening import DEFAULT_SCREENS, FeatureMatrix
+from cryptolens.store import HistoryStore
+from cryptolens.validation import Rule, validate
+
+
+# APIの呼び出しに共通で使うHTTPクライアントを作る関数 (ホストごとにコネクションを使い回し、レート制限する)
+# レスポンスはエンドポイントごとの有効期間でキャッシュし、再実行時は通信しない
+# (config.CACHE_MAX_AGEより古いレスポンスは作るときに削除する)
+# replay=Trueのときはキャッシュだけを使い、一切通信しない (Noneの場合は環境変数CRYPTOLENS_REPLAY=1で判定する)
+# metricsにRunMetricsを渡すとリクエストごとの応答時間・受信バイト数・待機時間を記録する
+# base_urlsを渡すとAPIの代わりにそのURLに送信する (ローカルのスタンドインサーバーでのベンチマーク用)
+# bucketsを渡すと指定したホストはrate_limitsの代わりにそのトークンバケットで制限する
+def make_client(
+    data_dir=config.DATA_DIR,
+    replay=None,
+    metrics=None,
+    base_urls=None,
+    rate_limits=config.RATE_LIMITS,
+    buckets=None,
+):
+    if replay is None:
+        replay = os.getenv("CRYPTOLENS_REPLAY") == "1"
+    return HttpClient(
+        rate_limits=rate_limits,
+        cache=ResponseCache(
+            os.path.join(data_dir, "http_cache.sqlite"),
+            ttls=config.CACHE_TTLS,
+            replay=replay,
+            max_age=config.CACHE_MAX_AGE,
+        ),
+        metrics=metrics,
+        base_urls=base_urls,
+        buckets=buckets,
+    )
+
+
+# .envファイルからCoinGeckoのAPIキーを読み込む関数 (環境変数に設定済みならそれを使う)
+def load_api_key(env_path=config.ENV_PATH):
+    load_dotenv(env_path)
+    return os.getenv("COINGECKO_API_KEY")
+
+
+# .envファイルからCoinGeckoのAPIキーのリストを読み込む関数
+# COINGECKO_API_KEYS (カンマ区切り) があればそれを、なければCOINGECKO_API_KEYの1つを使う
+def load_api_keys(env_path=config.ENV_PATH):
+    load_dotenv(env_path)
+    keys = os.getenv("COINGECKO_API_KEYS")
+    if keys:
+        return [key.strip() for key in keys.split(",") if key.strip()]
+    key = os.getenv("COINGECKO_API_KEY")
+    return [key] if key else []
+
+
+# 仮想通貨データとカテゴリデータの履歴ストア (取得日ごとのArrow IPC + manifest) を開く関数
+# 書き込むスナップショットの列の型はそれぞれのスキーマに合わせる
+# 以前のfeatherファイルのスナップショットがあれば取り込む (初回のみ)
+def open_stores(data_dir=config.DATA_DIR):
+    coins_store = HistoryStore(data_dir, config.COINS_STORE, COINS_SCHEMA)
+    categories_store = HistoryStore(
+        data_dir, config.CATEGORIES_STORE, CATEGORIES_SCHEMA
+    )
+    import_feather_snapshots(coins_store, data_dir, "df_coins_*.feather")
+    import_feather_snapshots(categories_store, data_dir, "df_categories_*.feather")
+    return coins_store, categories_store
+
+
+# 最新のスナップショットを読み込む関数 (manifestに記録されたファイルだけを読む)
+def load_latest(data_dir=config.DATA_DIR):
+    coins_store, categories_store = open_stores(data_dir)
+    return coins_store.load_latest(), categories_store.load_latest()
+
+
+# 仮想通貨データの履歴ストアのうち、まだ記録していないスナップショットと1つ前のスナップショットの差分
+# (新規上場・上場廃止・カテゴリの追加と削除・しきい値をまたいだ値) を<data_dir>/change_feed.jsonlに追記する関数
+# 返り値は追記した変化のテーブルのリスト
+def record_changes(data_dir=config.DATA_DIR, thresholds=DEFAULT_THRESHOLDS):
+    coins_store = HistoryStore(data_dir, config.COINS_STORE, COINS_SCHEMA)
+    l_events = update_change_feed(
+        coins_store, os.path.join(data_dir, "change_feed.jsonl"), thresholds
+    )
+    for events in l_events:
+        counts = events.group_by("type").aggregate([("type", "count")]).to_pylist()
+        summary = ", ".join(f"{c['type']}={c['type_count']}" for c in counts)
+        print(f"Changes recorded: {events.num_rows} ({summary})")
+    return l_events
+
+
+# 仮想通貨データとカテゴリデータを差分更新し、更新があれば履歴ストアに追記する関数
+# 詳細情報は1件ごとに<data_dir>/detail_journal.jsonlに記録し、中断した後の再実行では続きから取得する
+# 仮想通貨データを追記したら前回のスナップショットとの差分を<data_dir>/change_feed.jsonlに追記する
+# api_keysに複数のAPIキーを渡す (またはworkers_per_keyを2以上にする) と、詳細情報は
+# (APIキーの数 × workers_per_key) 個のプロセスに分けて取得する (APIキーごとの上限はプロセス間で共有する)
+# 返り値は (df_coins, df_categories, 更新があったかどうか)
+def refresh_data(
+    client,
+    api_key,
+    data_dir=config.DATA_DIR,
+    ttl=config.TTL,
+    overrides=None,
+    metrics=None,
+    api_keys=None,
+    workers_per_key=1,
+):
+    if metrics is None:
+        metrics = RunMetrics()
+    coins_store, categories_store = open_stores(data_dir)
+    # ByBitのsymbolとCoinGeckoのidの対応表 (バージョン付き、手動の指定を優先する)
+    resolver = CoinIdResolver(
+        os.path.join(data_dir, "coin_id_map.json"),
+        overrides=overrides,
+        ttl=ttl["detail"],
+    )
+
+    crawl = None
+    if api_keys and len(api_keys) * workers_per_key > 1:
+        crawl = partial(
+            crawl_detail_info,
+            client,
+            api_keys=api_keys,
+            data_dir=data_dir,
+            workers_per_key=workers_per_key,
+        )
+
+    # 詳細情報の取得のチェックポイント (中断した後の再実行では取得済みのidを取得しない)
+    with CrawlJournal(
+        os.path.join(data_dir, "detail_journal.jsonl"), max_age=ttl["detail"]
+    ) as journal:
+        df_coins, coins_updated = refresh_coin_data(
+            client,
+            coins_store.load_latest(),
+            api_key,
+            ttl,
+            resolver,
+            metrics,
+            journal,
+            crawl,
+        )
+    with metrics.stage("categories"):
+        df_categories, categories_updated = refresh_category_data(
+            client, categories_store.load_latest(), api_key, ttl
+        )
+
+    # APIのエンドポイントごとの成功・リトライ・スロットリングの件数を表示する
+    client.print_stats()
+
+    now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo"))
+    # 更新した仮想通貨リスト・カテゴリリストを履歴ストアに追記する
+    with metrics.stage("store"):
+        if coins_updated:
+            entry = coins_store.append(df_coins, now)
+            print(f'Data saved to "{entry["path"]}" ({entry["rows"]} rows)')
+            record_changes(data_dir)
+        if categories_updated:
+            entry = categories_store.append(df_categories, now)
+            print(f'Data saved to "{entry["path"]}" ({entry["rows"]} rows)')
+    if not (coins_updated or categories_updated):
+        latest_ratio_update = df_coins["ratioUpdateTime"].max()
+        latest_coin_update = df_coins["coinUpdateTime"].max()
+        latest_category_update = df_categories["categoryUpdateTime"].max()
+        latest_update = max(
+            latest_ratio_update, latest_coin_update, latest_category_update
+        )
+        print(f"Loaded data from history store, latest update at {latest_update}")
+
+    return df_coins, df_categories, coins_updated or categories_updated
+
+
+# 保存済みのローソク足から計算した価格変化率で仮想通貨データの値を置き換える関数
+# (ByBitのsymbolには倍率が付いたものがあるため、価格やATH/ATLはCoinGeckoの値のままにする)
+def apply_price_changes(
+    df_coins,
+    data_dir=config.DATA_DIR,
+    kline_interval=config.KLINE_INTERVAL,
+    kline_days=config.KLINE_DAYS,
+):
+    kline_store = KlineStore(os.path.join(data_dir, "klines"))
+    kline_start = int((datetime.now() - timedelta(days=kline_days)).timestamp() * 1000)
+    df_klines = kline_store.load(kline_interval, start_time=kline_start)
+    if df_klines.empty:
+        return df_coins
+    df_kline_metrics = compute_kline_metrics(df_klines, kline_interval)
+    return update_by_key(
+        df_coins,
+        df_kline_metrics[["symbol"] + list(PRICE_CHANGE_HORIZONS)],
+        "symbol",
+    )
+
+
+# 売買比率の履歴とByBitのローソク足を差分取得し、価格変化率をローソク足から計算した値で置き換える関数
+# (保存済みのsymbolは最新の時刻より後だけを取得する。ローソク足の変化率はCoinGeckoの値より新しい)
+def fetch_data(
+    client,
+    df_coins,
+    data_dir=config.DATA_DIR,
+    ratio_periods=config.RATIO_HISTORY_PERIODS,
+    ratio_days=config.RATIO_HISTORY_DAYS,
+    kline_interval=config.KLINE_INTERVAL,
+    kline_days=config.KLINE_DAYS,
+    metrics=None,
+):
+    if metrics is None:
+        metrics = RunMetrics()
+    l_symbols = list(df_coins["symbol"].unique())
+
+    with metrics.stage("ratio_history"):
+        ratio_history = RatioHistory(os.path.join(data_dir, "ratio_history"))
+        ratio_start = int(
+            (datetime.now() - timedelta(days=ratio_days)).timestamp() * 1000
+        )
+        n_ratio_rows = backfill_ratios(
+            client, ratio_history, l_symbols, ratio_periods, ratio_start
+        )
+        print(f"Ratio history rows added: {n_ratio_rows}")
+
+    with metrics.stage("klines"):
+        kline_store = KlineStore(os.path.join(data_dir, "klines"))
+        kline_start = int(
+            (datetime.now() - timedelta(days=kline_days)).timestamp() * 1000
+        )
+        n_kline_rows = backfill_klines(
+            client, kline_store, l_symbols, kline_interval, kline_start
+        )
+        print(f"Kline rows added: {n_kline_rows}")
+
+    with metrics.stage("price_changes"):
+        return apply_price_changes(df_coins, data_dir, kline_interval, kline_days)
+
+
+# 仮想通貨データの品質のルール (更新日時は再取得までの期間の2倍より古ければ違反とする)
+def quality_rules(ttl=config.TTL):
+    return [
+        Rule("platforms match", "list_equal", ["coinPlatforms", "platforms"]),
+        Rule(
+            "assetPlatformId is first coinPlatform",
+            "first_element",
+            ["coinPlatforms", "assetPlatformId"],
+        ),
+        Rule("required columns", "not_null", ["coinId", "symbol", "coinName"]),
+        Rule("positive market data", "positive", ["coinCap", "currentPrice", "atl"]),
+        Rule("fresh ratios", "fresh", ["ratioUpdateTime"], ttl["ratio"] * 2),
+        Rule("fresh market data", "fresh", ["marketFetchTime"], ttl["market"] * 2),
+        Rule("fresh details", "fresh", ["detailUpdateTime"], ttl["detail"] * 2),
+    ]
+
+
+# 仮想通貨データの品質をチェックし、カテゴリの疎行列のインデックスと集計値を作る関数
+# 品質のチェックは抽出前のデータ、インデックスは時価総額のある仮想通貨とカテゴリを抽出したデータに対して行う
+# 品質のレポートとインデックスはdata_dirに保存する
+# 返り値は (品質のレポート, インデックス, カテゴリごとの集計値のdf)
+def analyze_data(
+    df_coins,
+    df_categories,
+    data_dir=config.DATA_DIR,
+    ttl=config.TTL,
+    engine=config.PIPELINE_ENGINE,
+    metrics=None,
+):
+    if metrics is None:
+        metrics = RunMetrics()
+    with metrics.stage("validate"):
+        quality_report = validate(df_coins, quality_rules(ttl))
+        quality_report.print_summary()
+        quality_report.save(os.path.join(data_dir, "quality_report.json"))
+
+    with metrics.stage("clean"):
+        df_coins, df_categories, _ = run_pipeline(
+            df_coins, df_categories, engine=engine, explode=False
+        )
+    with metrics.stage("index"):
+        category_index = CategoryIndex.build(df_coins, df_categories)
+        category_index.save(os.path.join(data_dir, "category_index.npz"))
+        # カテゴリごとの仮想通貨の数、時価総額で加重平均した変化率、平均の売買比率
+        df_category_stats = category_index.aggregate(df_coins)
+    return quality_report, category_index, df_category_stats
+
+
+# 仮想通貨データの特徴量の行列を作り、スクリーニングをまとめて実行する関数
+# 返り値は (特徴量の行列, スクリーニングごとの上位の仮想通貨のdf (screen, rank, coinId, score))
+def screen_coins(df_coins, screens=DEFAULT_SCREENS, metrics=None):
+    if metrics is None:
+        metrics = RunMetrics()
+    with metrics.stage("screen"):
+        feature_matrix = FeatureMatrix.build(df_coins.drop_duplicates(subset="coinId"))
+        df_screens = feature_matrix.run(screens)
+    print(f"Screens run: {len(screens)}, coins: {len(feature_matrix)}")
+    return feature_matrix, df_screens
+
+
+# 時価総額のある仮想通貨とカテゴリを抽出し、必要な列を選択して欠損のある行を削除してから
+# 指定した形式で並行に出力する関数
+# 返り値は (抽出したdf_coins, 抽出したdf_categories, {出力したファイルのパス: 書き込みにかかった時間[s]})
+def export_data(
+    df_coins,
+    df_categories,
+    data_dir=config.DATA_DIR,
+    formats=config.EXPORT_FORMATS,
+    engine=config.PIPELINE_ENGINE,
+    metrics=None,
+):
+    if metrics is None:
+        metrics = RunMetrics()
+    with metrics.stage("clean"):
+        df_coins, df_categories, _ = run_pipeline(
+            df_coins, df_categories, engine=engine, explode=False
+        )
+    with metrics.stage("export"):
+        export_results = export_frames(
+            {"df_coins": df_coins, "df_categories": df_categories},
+            data_dir,
+            formats=formats,
+        )
+    for path, seconds in export_results.items():
+        print(f'Exported "{path}" in {seconds:.2f}s')
+    return df_coins, df_categories, export_results
+
+
+# 計測値をJSONのレポート (run_report.json) とPrometheusのtextfile (cryptolens.prom) に出力する関数
+def save_metrics(metrics, metrics_dir):
+    metrics.save(os.path.join(metrics_dir, "run_report.json"))
+    metrics.write_prometheus(os.path.join(metrics_dir, "cryptolens.prom"))
+    metrics.print_summary()
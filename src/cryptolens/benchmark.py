@@ -0,0 +1,576 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager, redirect_stderr, redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cryptolens import config
+from cryptolens.api import analyze_data, export_data, make_client, refresh_data
+from cryptolens.crawl import crawl_detail_info
+from cryptolens.journal import CrawlJournal
+from cryptolens.metrics import RunMetrics, peak_rss_bytes
+from cryptolens.pipeline import run_pipeline
+from cryptolens.schema import COINS_SCHEMA, conform
+from cryptolens.standin import ApiStandInServer
+from cryptolens.store import HistoryStore
+
+# 更新のベンチマークの結果を追記する履歴ファイル
+REFRESH_HISTORY_PATH = os.path.join(
+    config.DATA_DIR, "benchmark", "refresh_history.jsonl"
+)
+
+
+# ベンチマーク用に仮想通貨データとカテゴリデータと同じ列・型のダミーデータを作る関数
+# 欠損値や0以下の値も一定の割合で含める (抽出の処理を通るようにする)
+def make_dummy_data(n_coins, n_categories=None, seed=0):
+    if n_categories is None:
+        n_categories = max(10, n_coins // 50)
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now(tz="Asia/Tokyo").floor("s")
+    l_category_names = np.array([f"Category {i}" for i in range(n_categories)])
+    l_platforms = np.array(["ethereum", "solana", "binance-smart-chain", "base"])
+
+    def floats(low, high, missing=0.05, non_positive=0.0):
+        values = rng.uniform(low, high, n_coins)
+        values[rng.random(n_coins) < non_positive] = 0
+        values[rng.random(n_coins) < missing] = np.nan
+        return values
+
+    def times(days, missing=0.02):
+        values = pd.Series(
+            now - pd.to_timedelta(rng.integers(0, days * 86400, n_coins), unit="s")
+        )
+        return values.where(rng.random(n_coins) >= missing)
+
+    def lists(choices, max_length):
+        lengths = rng.integers(0, max_length + 1, n_coins)
+        return [list(rng.choice(choices, length, replace=False)) for length in lengths]
+
+    ids = np.array([f"coin-{i}" for i in range(n_coins)], dtype=object)
+    df_coins = pd.DataFrame(
+        {
+            "symbol": [f"C{i}USDT" for i in range(n_coins)],
+            "coin": [f"C{i}" for i in range(n_coins)],
+            "coinId": ids,
+            "coinName": [f"Coin {i}" for i in range(n_coins)],
+            "categories": lists(l_category_names, 5),
+            "coinPlatforms": lists(l_platforms, 2),
+            "coinCap": np.round(floats(0, 1e10, non_positive=0.05), 0),
+            "coinCapChg%24h": floats(-0.3, 0.3),
+            "coinLaunchTime": times(3000),
+            "watchlistUsers": np.round(floats(0, 1e6), 0),
+            "xFollowers": np.round(floats(0, 1e6, non_positive=0.05), 0),
+            "sentimentVotesUp%": floats(0, 1),
+            "buyRatio": floats(0, 1),
+            "ratioUpdateTime": times(1),
+            "currentPrice": floats(1e-6, 1e5),
+            "ath": floats(1e-6, 1e5),
+            "athChg%": floats(-1, 0),
+            "athDate": times(3000),
+            "atl": floats(1e-6, 1e5, non_positive=0.02),
+            "atlChg%": floats(0, 100),
+            "atlDate": times(3000),
+            "priceChg%1h": floats(-0.1, 0.1),
+            "priceChg%24h": floats(-0.3, 0.3),
+            "priceChg%7d": floats(-0.5, 0.5),
+            "priceChg%14d": floats(-0.5, 0.5),
+            "priceChg%30d": floats(-0.8, 0.8),
+            "priceChg%60d": floats(-0.8, 0.8),
+            "priceChg%200d": floats(-0.9, 0.9),
+            "coinUpdateTime": times(1),
+        }
+    )
+    df_categories = pd.DataFrame(
+        {
+            # 仮想通貨側にないカテゴリや時価総額のないカテゴリも含める (外部結合で片側だけの行ができるようにする)
+            "categoryId": [f"category-{i}" for i in range(n_categories + 5)],
+            "categoryName": [f"Category {i}" for i in range(n_categories + 5)],
+            "categoryCap": np.where(
+                rng.random(n_categories + 5) < 0.05,
+                np.nan,
+                np.round(rng.uniform(0, 1e11, n_categories + 5), 0),
+            ),
+            "categoryVol24h": rng.uniform(0, 1e9, n_categories + 5),
+            "categoryUpdateTime": now,
+        }
+    )
+    # 結合のキーにない列も持たせる (列を選択する処理を通るようにする)
+    df_coins["description"] = "dummy description"
+    df_categories["content"] = "dummy content"
+    return df_coins, df_categories
+
+
+# 2つのdfの内容が同じかどうかを調べる関数 (Arrowのテーブルにして列ごとの型と値を比べる)
+def frames_equal(df_a, df_b):
+    if list(df_a.columns) != list(df_b.columns) or len(df_a) != len(df_b):
+        return False
+    table_a = pa.Table.from_pandas(df_a, preserve_index=False)
+    table_b = pa.Table.from_pandas(df_b, preserve_index=False)
+    for name in table_a.column_names:
+        column_a = table_a[name]
+        column_b = table_b[name]
+        if pa.types.is_dictionary(column_a.type):
+            column_a = column_a.cast(column_a.type.value_type)
+        if pa.types.is_dictionary(column_b.type):
+            column_b = column_b.cast(column_b.type.value_type)
+        if pa.types.is_large_string(column_b.type):
+            column_b = column_b.cast(pa.string())
+        if pa.types.is_large_list(column_b.type):
+            column_b = column_b.cast(pa.list_(column_b.type.value_type))
+        if pa.types.is_large_string(column_a.type):
+            column_a = column_a.cast(pa.string())
+        if pa.types.is_large_list(column_a.type):
+            column_a = column_a.cast(pa.list_(column_a.type.value_type))
+        if not column_a.cast(column_b.type).equals(column_b):
+            return False
+    return True
+
+
+# pandasとpolarsのエンジンで抽出・展開・結合の処理時間を比べる関数
+# 各エンジンの最短の処理時間[s]と、出力が一致したかどうかを返す
+def benchmark_pipeline(sizes=(10_000, 100_000, 1_000_000), repeat=3, seed=0):
+    l_results = []
+    for n_coins in sizes:
+        df_coins, df_categories = make_dummy_data(n_coins, seed=seed)
+        timings = {}
+        outputs = {}
+        for engine in ["pandas", "polars"]:
+            l_seconds = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                outputs[engine] = run_pipeline(df_coins, df_categories, engine=engine)
+                l_seconds.append(time.perf_counter() - started)
+            timings[engine] = min(l_seconds)
+        identical = all(
+            frames_equal(df_pandas, df_polars)
+            for df_pandas, df_polars in zip(outputs["pandas"], outputs["polars"])
+        )
+        l_results.append(
+            {
+                "rows": n_coins,
+                "explodedRows": len(outputs["pandas"][2]),
+                "pandas[s]": timings["pandas"],
+                "polars[s]": timings["polars"],
+                "speedup": timings["pandas"] / timings["polars"],
+                "identical": identical,
+            }
+        )
+        print(
+            f"rows={n_coins}: pandas {timings['pandas']:.3f}s, polars {timings['polars']:.3f}s, identical={identical}"
+        )
+    return pd.DataFrame(l_results)
+
+
+# 仮想通貨データのスナップショットの読み込みを、型を指定しないParquetとスキーマ付きのArrow IPCで比べる関数
+# 読み込み時間[s] (最短) と読み込んだdfのメモリ使用量[bytes]を、全列と一部の列 (columns) について返す
+# arrow_tableはメモリマップしたArrowのテーブルのまま読む場合 (メモリ使用量はテーブルが参照するバッファの大きさ)
+def benchmark_snapshot_load(
+    sizes=(10_000, 100_000),
+    repeat=3,
+    columns=("symbol", "coinId", "coinCap", "buyRatio"),
+    seed=0,
+):
+    l_results = []
+    snapshot_time = pd.Timestamp.now(tz="Asia/Tokyo").to_pydatetime()
+    for n_coins in sizes:
+        df_coins, _ = make_dummy_data(n_coins, seed=seed)
+        with tempfile.TemporaryDirectory() as root:
+            stores = {
+                "parquet": HistoryStore(root, "legacy"),
+                "arrow": HistoryStore(root, "typed", COINS_SCHEMA),
+            }
+            # 以前の形式 (型を指定しないParquet) で書き込む
+            entry = stores["parquet"].append(df_coins, snapshot_time)
+            path = os.path.join(stores["parquet"].dir, entry["path"])
+            table = pa.ipc.open_file(path).read_all()
+            pq.write_table(table, path[: -len(".arrow")] + ".parquet")
+            stores["parquet"].manifest["latest"]["path"] = (
+                entry["path"][: -len(".arrow")] + ".parquet"
+            )
+            stores["arrow"].append(conform(df_coins, COINS_SCHEMA), snapshot_time)
+
+            row = {"rows": n_coins}
+            for name, store in stores.items():
+                for label, selected in [("all", None), ("cols", list(columns))]:
+                    l_seconds = []
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        df = store.load_latest(selected)
+                        l_seconds.append(time.perf_counter() - started)
+                    n_bytes = int(df.memory_usage(index=True, deep=True).sum())
+                    row[f"{name}_{label}[s]"] = min(l_seconds)
+                    row[f"{name}_{label}[MB]"] = n_bytes / 2**20
+            for label, selected in [("all", None), ("cols", list(columns))]:
+                l_seconds = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    table = stores["arrow"].load_latest_table(selected)
+                    l_seconds.append(time.perf_counter() - started)
+                row[f"arrow_table_{label}[s]"] = min(l_seconds)
+                row[f"arrow_table_{label}[MB]"] = table.nbytes / 2**20
+        l_results.append(row)
+        print(
+            f"rows={n_coins}: parquet {row['parquet_all[s]']:.3f}s/{row['parquet_all[MB]']:.1f}MB, "
+            f"arrow {row['arrow_all[s]']:.3f}s/{row['arrow_all[MB]']:.1f}MB"
+        )
+    return pd.DataFrame(l_results)
+
+
+# quiet=Trueの場合に標準出力と標準エラー出力をoutputに書き込む (進捗表示とログをベンチマークの出力に混ぜない)
+@contextmanager
+def captured_output(output, quiet=True):
+    if not quiet:
+        yield
+        return
+    with redirect_stdout(output), redirect_stderr(output):
+        yield
+
+
+# ベンチマークの履歴 (1行1回のJSON) を読み込む関数
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# 同じ条件の前回の結果と比べ、処理時間がthresholdの割合より長くなった段階を返す関数
+# (min_seconds未満の差はばらつきとして無視し、前回の時間が0の段階は比べない)
+def find_regressions(record, previous, threshold=0.2, min_seconds=0.05):
+    l_regressions = []
+    l_timings = [("total", record["totalSeconds"], previous["totalSeconds"])] + [
+        (name, stage["wallSeconds"], previous["stages"][name]["wallSeconds"])
+        for name, stage in record["stages"].items()
+        if name in previous["stages"]
+    ]
+    for name, seconds, previous_seconds in l_timings:
+        if previous_seconds <= 0:
+            continue
+        if (
+            seconds > previous_seconds * (1 + threshold)
+            and seconds - previous_seconds >= min_seconds
+        ):
+            l_regressions.append(
+                {
+                    "stage": name,
+                    "previousSeconds": previous_seconds,
+                    "seconds": seconds,
+                    "ratio": round(seconds / previous_seconds, 3),
+                }
+            )
+    return l_regressions
+
+
+# ローカルのスタンドインサーバーに対して更新・分析・出力を実行し、処理段階ごとの時間とメモリを計測する関数
+# 仮想通貨の数ごとに空のデータディレクトリから1回実行する (最大メモリ使用量はプロセス全体の値のため小さい順に実行する)
+# latency, rate_limits, error_rateはサーバーの遅延・上限・429の割合、client_rate_limitsはHTTPクライアントのレート制限
+# history_pathを指定すると結果を追記し、同じ条件の前回の結果と比べて遅くなった段階を表示する
+def benchmark_refresh(
+    sizes=(100, 1000),
+    latency=0.0,
+    rate_limits=None,
+    error_rate=0.0,
+    client_rate_limits=None,
+    formats=("parquet",),
+    seed=0,
+    history_path=None,
+    threshold=0.2,
+    quiet=True,
+):
+    l_history = load_history(history_path) if history_path else []
+    l_results = []
+    for n_coins in sorted(sizes):
+        bench_config = json.loads(
+            json.dumps(
+                {
+                    "coins": n_coins,
+                    "latency": latency,
+                    "rateLimits": rate_limits or {},
+                    "errorRate": error_rate,
+                    "clientRateLimits": client_rate_limits or {},
+                    "formats": list(formats),
+                    "seed": seed,
+                },
+                sort_keys=True,
+            )
+        )
+        metrics = RunMetrics(f"benchmark-{n_coins}")
+        output = io.StringIO()
+        with ExitStack() as stack:
+            server = stack.enter_context(
+                ApiStandInServer(
+                    n_coins,
+                    latency=latency,
+                    rate_limits=rate_limits,
+                    error_rate=error_rate,
+                    seed=seed,
+                )
+            )
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            client = make_client(
+                data_dir,
+                replay=False,
+                metrics=metrics,
+                base_urls=server.base_urls,
+                rate_limits=client_rate_limits or {},
+            )
+            with captured_output(output, quiet):
+                started = time.perf_counter()
+                df_coins, df_categories, _ = refresh_data(
+                    client, "benchmark", data_dir, metrics=metrics
+                )
+                refresh_seconds = time.perf_counter() - started
+                analyze_data(df_coins, df_categories, data_dir, metrics=metrics)
+                export_data(
+                    df_coins,
+                    df_categories,
+                    data_dir,
+                    formats=list(formats),
+                    metrics=metrics,
+                )
+                total_seconds = time.perf_counter() - started
+            client.cache.close()
+        report = metrics.to_dict()
+        record = {
+            "time": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "config": bench_config,
+            "rows": len(df_coins),
+            "requests": server.n_requests,
+            "throttled": server.n_throttled,
+            "refreshSeconds": round(refresh_seconds, 6),
+            "totalSeconds": round(total_seconds, 6),
+            "coinsPerSecond": round(len(df_coins) / refresh_seconds, 3),
+            "requestsPerSecond": round(server.n_requests / refresh_seconds, 3),
+            "responseBytes": sum(
+                request["bytes"] for request in report["http"].values()
+            ),
+            "peakRssBytes": peak_rss_bytes(),
+            "stages": report["stages"],
+            "framePeakBytes": report["framePeakBytes"],
+            "sleepSeconds": report["sleepSeconds"],
+        }
+        l_previous = [r for r in l_history if r["config"] == bench_config]
+        record["regressions"] = (
+            find_regressions(record, l_previous[-1], threshold) if l_previous else []
+        )
+        if history_path:
+            os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+            with open(history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        print(
+            f"coins={n_coins}: refresh {refresh_seconds:.2f}s ({record['coinsPerSecond']:.1f} coins/s, "
+            f"{server.n_requests} requests, {server.n_throttled} throttled, "
+            f"{record['responseBytes'] / 2**20:.1f}MB downloaded), total {total_seconds:.2f}s"
+        )
+        for name, stage in report["stages"].items():
+            print(
+                f"  {name}: wall={stage['wallSeconds']:.3f}s, cpu={stage['cpuSeconds']:.3f}s, "
+                f"peak_rss={stage['peakRssBytes'] / 2**20:.0f}MB"
+            )
+        for regression in record["regressions"]:
+            print(
+                f"  Regression in {regression['stage']}: {regression['previousSeconds']:.3f}s -> "
+                f"{regression['seconds']:.3f}s (x{regression['ratio']})"
+            )
+        l_results.append(
+            {
+                "coins": n_coins,
+                "rows": record["rows"],
+                "requests": record["requests"],
+                "throttled": record["throttled"],
+                "downloaded[MB]": record["responseBytes"] / 2**20,
+                "refresh[s]": refresh_seconds,
+                "total[s]": total_seconds,
+                "coins/s": record["coinsPerSecond"],
+                "peakRss[MB]": (record["peakRssBytes"] or 0) / 2**20,
+                "regressions": len(record["regressions"]),
+            }
+        )
+    return pd.DataFrame(l_results)
+
+
+# ローカルのスタンドインサーバーに対して詳細情報の取得をAPIキーの数を変えて実行し、時間を比べる関数
+# サーバーはAPIキーごとにrate_limit (リクエスト数, 秒数) を超えたリクエストに429を返し、
+# HTTPクライアントはAPIキーごとにclient_rate_limitでプロセス間で共有して制限する
+# 取得時間[s]、1秒あたりのリクエスト数、APIキーが1つの場合との速度比、429の件数を返す
+# (quietでもワーカープロセスの進捗バーは表示される)
+def benchmark_crawl(
+    n_ids=300,
+    key_counts=(1, 2, 4),
+    workers_per_key=1,
+    latency=0.0,
+    rate_limit=(10, 1),
+    client_rate_limit=(1, 0.11),
+    quiet=True,
+):
+    l_results = []
+    l_ids = [f"coin-{i}" for i in range(n_ids)]
+    with ApiStandInServer(
+        n_coins=n_ids, latency=latency, rate_limits={"coingecko": rate_limit}
+    ) as server:
+        for n_keys in key_counts:
+            l_keys = [f"benchmark-key-{i}" for i in range(n_keys)]
+            n_requests, n_throttled = server.n_requests, server.n_throttled
+            with tempfile.TemporaryDirectory() as data_dir:
+                client = make_client(
+                    data_dir,
+                    replay=False,
+                    base_urls=server.base_urls,
+                    rate_limits={"api.coingecko.com": client_rate_limit},
+                )
+                output = io.StringIO()
+                started = time.perf_counter()
+                journal_path = os.path.join(data_dir, "journal.jsonl")
+                with captured_output(output, quiet), CrawlJournal(
+                    journal_path
+                ) as journal:
+                    df = crawl_detail_info(
+                        client,
+                        l_ids,
+                        journal,
+                        l_keys,
+                        data_dir,
+                        workers_per_key=workers_per_key,
+                    )
+                seconds = time.perf_counter() - started
+            l_results.append(
+                {
+                    "keys": n_keys,
+                    "workers": n_keys * workers_per_key,
+                    "rows": len(df),
+                    "seconds": seconds,
+                    "requests/s": (server.n_requests - n_requests) / seconds,
+                    "throttled": server.n_throttled - n_throttled,
+                }
+            )
+            print(f"keys={n_keys}: {len(df)} rows in {seconds:.2f}s")
+    df_results = pd.DataFrame(l_results)
+    df_results["speedup"] = df_results["seconds"].iloc[0] / df_results["seconds"]
+    return df_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the pipeline engines or benchmark a refresh against local stand-in APIs"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["pipeline", "refresh", "load", "crawl"],
+        default="pipeline",
+        help="pipeline: pandas vs polars, refresh: refresh/analyze/export against stand-in servers, "
+        "load: untyped Parquet vs typed Arrow snapshot loads, "
+        "crawl: sharded detail crawl with 1, 2 and 4 API keys",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        help="rows (pipeline, default: 10000 100000 1000000; load, default: 10000 100000) "
+        "or coins (refresh, default: 100 1000; crawl, first size only, default: 300)",
+    )
+    parser.add_argument(
+        "--keys",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="API key counts for the crawl mode (default: 1 2 4)",
+    )
+    parser.add_argument(
+        "--workers-per-key",
+        type=int,
+        default=1,
+        help="crawl processes per API key (default: 1)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="stand-in response latency [s]"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        nargs=2,
+        metavar=("REQUESTS", "SECONDS"),
+        help="stand-in rate limit per API, excess requests get 429",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of random 429 responses"
+    )
+    parser.add_argument(
+        "--client-rate-limit",
+        type=float,
+        nargs=2,
+        metavar=("REQUESTS", "SECONDS"),
+        help="HTTP client rate limit per host (default: unlimited)",
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=["xlsx", "csv", "parquet", "arrow"],
+        default=["parquet"],
+    )
+    parser.add_argument(
+        "--history",
+        default=REFRESH_HISTORY_PATH,
+        help=f"refresh results history (default: {REFRESH_HISTORY_PATH})",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="slowdown ratio reported as a regression (default: 0.2)",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show progress bars and logs"
+    )
+    args = parser.parse_args()
+    if args.mode == "pipeline":
+        sizes = args.sizes or [10_000, 100_000, 1_000_000]
+        print(benchmark_pipeline(sizes, args.repeat).to_string(index=False))
+    elif args.mode == "load":
+        sizes = args.sizes or [10_000, 100_000]
+        print(benchmark_snapshot_load(sizes, args.repeat).to_string(index=False))
+    elif args.mode == "crawl":
+        df_results = benchmark_crawl(
+            (args.sizes or [300])[0],
+            args.keys,
+            workers_per_key=args.workers_per_key,
+            latency=args.latency,
+            rate_limit=tuple(args.rate_limit or (10, 1)),
+            client_rate_limit=tuple(args.client_rate_limit or (1, 0.11)),
+            quiet=not args.verbose,
+        )
+        print(df_results.to_string(index=False))
+    else:
+        rate_limits = None
+        if args.rate_limit:
+            rate_limits = {
+                "coingecko": tuple(args.rate_limit),
+                "bybit": tuple(args.rate_limit),
+            }
+        client_rate_limits = None
+        if args.client_rate_limit:
+            client_rate_limits = {
+                "api.coingecko.com": tuple(args.client_rate_limit),
+                "api.bybit.com": tuple(args.client_rate_limit),
+            }
+        df_results = benchmark_refresh(
+            args.sizes or [100, 1000],
+            latency=args.latency,
+            rate_limits=rate_limits,
+            error_rate=args.error_rate,
+            client_rate_limits=client_rate_limits,
+            formats=args.formats,
+            history_path=args.history,
+            threshold=args.threshold,
+            quiet=not args.verbose,
+        )
+        print(df_results.to_string(index=False))
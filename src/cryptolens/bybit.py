@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from tqdm import tqdm
+
+from cryptolens.records import ColumnarBuilder, Field
+from cryptolens.resolver import normalize_base_coins
+
+
+# ByBitから仮想通貨一覧を取得する関数 (1000件を超える場合はカーソルでページングする)
+def get_bybit_coins_list(client, category):
+    url = "https://api.bybit.com/v5/market/instruments-info"
+    headers = {}
+    params = {
+        "category": category,
+        "limit": 1000,
+    }
+    l_instruments = []
+    while True:
+        response = client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(
+                f"Error fetching Bybit coins list: {response.status_code}, {response.text}"
+            )
+            return pd.DataFrame()
+        json = response.json()
+        if json["retCode"] != 0:
+            print(f"Error fetching Bybit coins list: {json['retMsg']}")
+            return pd.DataFrame()
+        l_instruments.extend(json["result"]["list"])
+        cursor = json["result"].get("nextPageCursor")
+        if not cursor:
+            break
+        params = {**params, "cursor": cursor}
+
+    df = pd.DataFrame(l_instruments)
+    # 対象を絞る
+    df = df[df["quoteCoin"] == "USDT"].reset_index(drop=True)
+    df = df[df["contractType"] == "LinearPerpetual"].reset_index(drop=True)
+    df = df[df["status"] == "Trading"].reset_index(drop=True)
+    # 必要な列だけ取得
+    df = df[["symbol", "baseCoin", "launchTime"]]
+    # strip
+    df["symbol"] = df["symbol"].str.strip()
+    # 仮想通貨名から倍率の数値を除去し、小文字にする
+    df["baseCoin"], multipliers = normalize_base_coins(df["baseCoin"])
+    # launchTimeをUNIXタイムスタンプからJSTのdatetime形式にする
+    df["launchTime"] = pd.to_numeric(df["launchTime"])
+    df["launchTime"] = pd.to_datetime(df["launchTime"], unit="ms", utc=True)
+    df["launchTime"] = df["launchTime"].dt.tz_convert("Asia/Tokyo")
+    df.columns = ["symbol", "coin", "coinLaunchTime"]
+    df["coinMultiplier"] = multipliers
+    return df
+
+
+# ByBitから仮想通貨の売買比率 (JSON) を取得する関数
+def get_bybit_long_short_ratio(client, category, symbol, period, limit):
+    url = "https://api.bybit.com/v5/market/account-ratio"
+    headers = {}
+    params = {
+        "category": category,
+        "symbol": symbol,
+        "period": period,
+        "limit": limit,
+    }
+    response = client.get(url, headers=headers, params=params)
+    if response.status_code == 200:
+        json = response.json()
+        if json["retCode"] == 0:
+            return json["result"]["list"]
+        else:
+            print(f"Error fetching Bybit long short ratio: {json['retMsg']}")
+            return []
+    else:
+        print(
+            f"Error fetching Bybit long short ratio: {response.status_code}, {response.text}"
+        )
+        return []
+
+
+# ByBitの売買比率から取得する列の定義 (timestampはJSTの日時形式にする)
+ratio_fields = [
+    Field("symbol", ["symbol"], "str"),
+    Field("buyRatio", ["buyRatio"]),
+    Field("ratioUpdateTime", ["timestamp"], "epoch_ms", "Asia/Tokyo"),
+]
+
+
+# ByBitから渡したsymbolリストのすべての売買比率を取得する関数
+# レート制限はHTTPクライアントで行い、並列に取得する
+def get_all_ratios(client, l_symbols, max_workers=16):
+    results = {}
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                get_bybit_long_short_ratio, client, "linear", symbol, "1d", 1
+            ): symbol
+            for symbol in l_symbols
+        }
+        for future in tqdm(
+            as_completed(futures),
+            total=len(futures),
+            desc="Fetching long-short ratios from ByBit",
+        ):
+            symbol = futures[future]
+            try:
+                results[symbol] = future.result()
+            except Exception as e:
+                errors.append((symbol, str(e)))
+                print(f"Error fetching ratio data for symbol {symbol}: {e}")
+
+    if errors:
+        print("Errors occurred for the following symbols:")
+        for error in errors:
+            print(f"Symbol: {error[0]}, Error: {error[1]}")
+
+    # 渡したsymbolの順序で列ごとに溜めて、最後に1回だけdfを作る
+    builder = ColumnarBuilder(ratio_fields)
+    for symbol in l_symbols:
+        builder.extend(results.get(symbol, []))
+    return builder.to_frame()
@@ -0,0 +1,209 @@
+import fnmatch
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# キャッシュに残すレスポンスヘッダー (条件付きリクエストとJSONのデコードに使うもの)
+CACHED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+# ストリーミングのレスポンスを一時ファイルからSQLiteに書き込むときの1回の大きさ[bytes]
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+# リプレイモードでキャッシュにないリクエストが来たときの例外
+class CacheMissError(LookupError):
+    pass
+
+
+# URLとパラメータをキーにAPIのレスポンスをSQLiteに保存するキャッシュ
+# ttls: {エンドポイントのパターン (fnmatch形式): 有効期間[秒]}、一致しないものはdefault_ttl
+# replay: Trueの場合は通信せず、キャッシュにあるレスポンスだけを期限に関係なく返す
+# max_age: 指定すると開いたときに取得 (再検証) からmax_age[秒]より古いレスポンスを削除する
+#   (削除した領域は次に保存するレスポンスに再利用され、ファイルが増え続けない)
+class ResponseCache:
+    def __init__(self, path, ttls=None, default_ttl=0, replay=False, max_age=None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.replay = replay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        if max_age is not None:
+            self.prune(max_age)
+
+    # URLとパラメータ (順序によらない) からキャッシュのキーを作る
+    @staticmethod
+    def make_key(url, params=None):
+        items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        return hashlib.sha256(json.dumps([url, items]).encode()).hexdigest()
+
+    # エンドポイントに対応する有効期間[秒]を返す
+    def ttl_for(self, endpoint):
+        for pattern, ttl in self.ttls.items():
+            if fnmatch.fnmatch(endpoint, pattern):
+                return ttl
+        return self.default_ttl
+
+    # キャッシュを取得する (なければNone)
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, headers, body, fetched_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        url, headers, body, fetched_at = row
+        return {
+            "url": url,
+            "headers": json.loads(headers),
+            "body": body,
+            "fetched_at": fetched_at,
+        }
+
+    # キャッシュが有効期間内かを判定する
+    def is_fresh(self, entry, endpoint):
+        return time.time() - entry["fetched_at"] < self.ttl_for(endpoint)
+
+    @staticmethod
+    def _headers(response):
+        return {
+            name: response.headers[name]
+            for name in CACHED_HEADERS
+            if name in response.headers
+        }
+
+    # 成功したレスポンスを保存する
+    def put(self, key, response):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response.url,
+                    json.dumps(self._headers(response)),
+                    response.content,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    # ストリーミングで受信中の成功したレスポンスを、呼び出し側が本文を読むのと同時に保存する
+    # 受信したチャンクは一時ファイルに書き、本文を最後まで読んだ時点でSQLiteのBLOBに分割して書き込む
+    # (本文全体をメモリに持たない。途中で読むのをやめた場合は保存しない)
+    # 本文を読み込み済みのレスポンスはputと同じように保存する
+    def put_stream(self, key, response):
+        if response._content_consumed:
+            self.put(key, response)
+            return response
+        response.raw = _TeeReader(
+            response.raw, self, key, response.url, self._headers(response)
+        )
+        return response
+
+    # 一時ファイルに書いた本文を保存する
+    # Python 3.11以降はBLOBに分割して書き込み、それより前は本文を1回読み込んでから書き込む
+    def _put_file(self, key, url, headers, f):
+        size = f.tell()
+        f.seek(0)
+        with self._lock:
+            if hasattr(self._conn, "blobopen"):
+                cursor = self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, zeroblob(?), ?)",
+                    (key, url, json.dumps(headers), size, time.time()),
+                )
+                with self._conn.blobopen("responses", "body", cursor.lastrowid) as blob:
+                    while chunk := f.read(COPY_CHUNK_SIZE):
+                        blob.write(chunk)
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, url, json.dumps(headers), f.read(), time.time()),
+                )
+            self._conn.commit()
+
+    # 304 Not Modifiedのときに取得日時だけ更新する
+    def touch(self, key):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+
+    # 取得日時がmax_age[秒]より古いレスポンスを削除し、削除した件数を返す
+    def prune(self, max_age):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE fetched_at < ?", (time.time() - max_age,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    # 条件付きリクエストのヘッダー (If-None-Match, If-Modified-Since) を作る
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if "ETag" in entry["headers"]:
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if "Last-Modified" in entry["headers"]:
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    # キャッシュからrequestsのレスポンスを作る
+    # (本文はSQLiteから1回でメモリに読み込む。ストリーミングで取得したレスポンスも同じ)
+    @staticmethod
+    def to_response(entry):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry["url"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"]
+        # 本文は読み込み済み (iter_contentで本文を分割して返すようにする)
+        response._content_consumed = True
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# requestsのレスポンスの本文 (urllib3のraw) を読みながら一時ファイルにも書き、最後まで読んだらキャッシュに保存するラッパー
+# requestsのiter_contentはrawのstreamを呼ぶため、呼び出し側はそのままチャンクごとに読める
+class _TeeReader:
+    def __init__(self, raw, cache, key, url, headers):
+        self._raw = raw
+        self._cache = cache
+        self._key = key
+        self._url = url
+        self._headers = headers
+
+    def stream(self, amt=2**16, decode_content=None):
+        with tempfile.TemporaryFile() as f:
+            for chunk in self._raw.stream(amt, decode_content=decode_content):
+                f.write(chunk)
+                yield chunk
+            self._cache._put_file(self._key, self._url, self._headers, f)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
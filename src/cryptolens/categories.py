@@ -0,0 +1,199 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# カテゴリごとに時価総額で加重平均する列
+WEIGHTED_COLUMNS = [
+    "coinCapChg%24h",
+    "priceChg%1h",
+    "priceChg%24h",
+    "priceChg%7d",
+    "priceChg%14d",
+    "priceChg%30d",
+    "priceChg%60d",
+    "priceChg%200d",
+]
+# カテゴリごとに単純平均する列
+MEAN_COLUMNS = ["buyRatio"]
+
+
+# 仮想通貨 × カテゴリ の対応を疎行列 (CSR) で持つインデックス
+# 仮想通貨のidとカテゴリ名はそれぞれ配列の位置 (整数) に置き換えて持つ
+# 行 (仮想通貨) ごとのカテゴリはmatrix、列 (カテゴリ) ごとの仮想通貨は転置したmatrix_tから
+# indptrの範囲を切り出すだけで取得できる (explodeや結合をしない)
+class CategoryIndex:
+    def __init__(self, coin_ids, category_names, matrix, n_listed_categories):
+        self.coin_ids = np.asarray(coin_ids, dtype=object)
+        self.category_names = np.asarray(category_names, dtype=object)
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+        self.matrix_t = self.matrix.T.tocsr()
+        # category_namesの先頭n_listed_categories個がカテゴリデータにあるカテゴリ
+        self.n_listed_categories = n_listed_categories
+        self._coin_index = {coin_id: i for i, coin_id in enumerate(self.coin_ids)}
+        self._category_index = {name: j for j, name in enumerate(self.category_names)}
+
+    # 仮想通貨データ (coinIdとcategoriesの列) とカテゴリデータ (categoryNameの列) からインデックスを作る
+    # カテゴリデータにないカテゴリ名は後ろに追加する
+    @classmethod
+    def build(cls, df_coins, df_categories):
+        l_category_names = list(pd.unique(df_categories["categoryName"].dropna()))
+        n_listed_categories = len(l_category_names)
+        category_index = {name: j for j, name in enumerate(l_category_names)}
+
+        lengths = np.zeros(len(df_coins), dtype=np.int64)
+        l_columns = []
+        for i, categories in enumerate(df_coins["categories"]):
+            if categories is None or (
+                not isinstance(categories, (list, np.ndarray)) and pd.isna(categories)
+            ):
+                continue
+            columns = set()
+            for name in categories:
+                if name is None or name == "":
+                    continue
+                j = category_index.get(name)
+                if j is None:
+                    j = category_index[name] = len(l_category_names)
+                    l_category_names.append(name)
+                columns.add(j)
+            lengths[i] = len(columns)
+            l_columns.extend(sorted(columns))
+
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.array(l_columns, dtype=np.int32)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(df_coins), len(l_category_names)),
+        )
+        return cls(df_coins["coinId"], l_category_names, matrix, n_listed_categories)
+
+    # インデックスをnpzファイルに保存する関数 (pickleを使わない)
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            coin_ids=self.coin_ids.astype(str),
+            category_names=self.category_names.astype(str),
+            indptr=self.matrix.indptr,
+            indices=self.matrix.indices,
+            n_listed_categories=self.n_listed_categories,
+        )
+        os.replace(tmp_path, path)
+
+    # 保存したインデックスを読み込む関数
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            indices = npz["indices"]
+            matrix = sparse.csr_matrix(
+                (np.ones(len(indices)), indices, npz["indptr"]),
+                shape=(len(npz["coin_ids"]), len(npz["category_names"])),
+            )
+            return cls(
+                npz["coin_ids"],
+                npz["category_names"],
+                matrix,
+                int(npz["n_listed_categories"]),
+            )
+
+    # 仮想通貨の属するカテゴリ名の配列を返す関数
+    def categories_of(self, coin_id):
+        i = self._coin_index[coin_id]
+        start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+        return self.category_names[self.matrix.indices[start:end]]
+
+    # カテゴリに属する仮想通貨の位置の配列を返す関数
+    def coin_positions(self, category_name):
+        j = self._category_index[category_name]
+        start, end = self.matrix_t.indptr[j], self.matrix_t.indptr[j + 1]
+        return self.matrix_t.indices[start:end]
+
+    # カテゴリに属する仮想通貨のidの配列を返す関数
+    def coins_in(self, category_name):
+        return self.coin_ids[self.coin_positions(category_name)]
+
+    # カテゴリごとの仮想通貨の数
+    def coin_counts(self):
+        return np.diff(self.matrix_t.indptr)
+
+    # 仮想通貨のカテゴリのうち、カテゴリデータにないカテゴリ名 (昇順)
+    def unlisted_categories(self):
+        return np.sort(self.category_names[self.n_listed_categories :])
+
+    # カテゴリデータにあるカテゴリのうち、属する仮想通貨がないカテゴリ名 (昇順)
+    def empty_categories(self):
+        counts = self.coin_counts()[: self.n_listed_categories]
+        return np.sort(self.category_names[: self.n_listed_categories][counts == 0])
+
+    # dfの列をインデックスの仮想通貨の順に並べた配列を返す関数 (dfにない仮想通貨はNaN)
+    def align(self, df_coins, column):
+        values = pd.Series(
+            df_coins[column].to_numpy(np.float64), index=df_coins["coinId"]
+        )
+        values = values[~values.index.duplicated(keep="first")]
+        return values.reindex(self.coin_ids).to_numpy()
+
+    # カテゴリごとの集計値を疎行列の積でまとめて計算する関数
+    # WEIGHTED_COLUMNSは時価総額 (coinCap) での加重平均、MEAN_COLUMNSは単純平均 (欠損値は除く)
+    def aggregate(self, df_coins):
+        result = {"categoryName": self.category_names, "coinCount": self.coin_counts()}
+        cap = np.nan_to_num(self.align(df_coins, "coinCap"))
+        result["coinCap"] = self.matrix_t @ cap
+        for column in WEIGHTED_COLUMNS:
+            if column not in df_coins.columns:
+                continue
+            values = self.align(df_coins, column)
+            valid = ~np.isnan(values)
+            weights = self.matrix_t @ np.where(valid, cap, 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result[column] = (
+                    self.matrix_t @ np.where(valid, cap * values, 0)
+                ) / weights
+        for column in MEAN_COLUMNS:
+            if column not in df_coins.columns:
+                continue
+            values = self.align(df_coins, column)
+            valid = ~np.isnan(values)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result[column] = (self.matrix_t @ np.where(valid, values, 0)) / (
+                    self.matrix_t @ valid.astype(np.float64)
+                )
+        return pd.DataFrame(result)
+
+    # カテゴリ × カテゴリ の共起行列 (同じ仮想通貨が両方に属している数、対角成分はカテゴリの仮想通貨の数)
+    def cooccurrence(self):
+        return (self.matrix_t @ self.matrix).tocsr()
+
+    # あるカテゴリと一緒に付けられることが多いカテゴリを返す関数
+    def related_categories(self, category_name, k=10, cooccurrence=None):
+        if cooccurrence is None:
+            cooccurrence = self.cooccurrence()
+        j = self._category_index[category_name]
+        start, end = cooccurrence.indptr[j], cooccurrence.indptr[j + 1]
+        columns = cooccurrence.indices[start:end]
+        counts = cooccurrence.data[start:end]
+        keep = columns != j
+        columns, counts = columns[keep], counts[keep]
+        order = np.argsort(-counts, kind="stable")[:k]
+        return pd.Series(
+            counts[order].astype(np.int64), index=self.category_names[columns[order]]
+        )
+
+    # カテゴリに属する仮想通貨のうち、valuesの大きい (ascending=Trueなら小さい) 順にk個のidと値を返す関数
+    # valuesはalignで作った仮想通貨の順の配列
+    def top_movers(self, category_name, values, k=10, ascending=False):
+        positions = self.coin_positions(category_name)
+        selected = values[positions]
+        positions = positions[~np.isnan(selected)]
+        selected = values[positions]
+        if not ascending:
+            selected = -selected
+        if len(selected) > k:
+            top = np.argpartition(selected, k - 1)[:k]
+        else:
+            top = np.arange(len(selected))
+        top = top[np.argsort(selected[top], kind="stable")]
+        return pd.Series(values[positions[top]], index=self.coin_ids[positions[top]])
@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import sys
+
+from cryptolens import config
+
+# コマンドラインのエントリポイント (cryptolens <サブコマンド>)
+# pandas・pyarrow等の重い依存ライブラリはサブコマンドの実行時に読み込む (--helpやstatusは速く起動する)
+
+
+# 履歴ストアのmanifestから最新のスナップショットを表示する (重い依存ライブラリを読み込まない)
+def run_status(args):
+    for name in [config.COINS_STORE, config.CATEGORIES_STORE]:
+        manifest_path = os.path.join(args.data_dir, name, "manifest.json")
+        if not os.path.exists(manifest_path):
+            print(f"{name}: no snapshots")
+            continue
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        latest = manifest["latest"]
+        n_snapshots = sum(len(p["files"]) for p in manifest["partitions"].values())
+        if latest is None:
+            print(f"{name}: no snapshots")
+        else:
+            print(
+                f"{name}: {n_snapshots} snapshots, latest {latest['snapshotTime']} ({latest['rows']} rows)"
+            )
+    return 0
+
+
+# 計測値の出力先 (指定がなければ<data_dir>/metrics)
+def metrics_dir(args):
+    return args.metrics_dir or os.path.join(args.data_dir, "metrics")
+
+
+def run_refresh(args):
+    from cryptolens import api
+    from cryptolens.metrics import RunMetrics
+
+    metrics = RunMetrics("refresh")
+    client = api.make_client(args.data_dir, replay=args.replay or None, metrics=metrics)
+    api_keys = api.load_api_keys(args.env_file)
+    api.refresh_data(
+        client,
+        api_keys[0] if api_keys else None,
+        args.data_dir,
+        metrics=metrics,
+        api_keys=api_keys,
+        workers_per_key=args.workers_per_key,
+    )
+    api.save_metrics(metrics, metrics_dir(args))
+    return 0
+
+
+def run_fetch(args):
+    from cryptolens import api
+    from cryptolens.metrics import RunMetrics
+
+    metrics = RunMetrics("fetch")
+    client = api.make_client(args.data_dir, replay=args.replay or None, metrics=metrics)
+    df_coins, _ = api.load_latest(args.data_dir)
+    if df_coins.empty:
+        print("Error: no coin data, run 'cryptolens refresh' first")
+        return 1
+    api.fetch_data(
+        client,
+        df_coins,
+        args.data_dir,
+        ratio_periods=args.ratio_periods,
+        ratio_days=args.ratio_days,
+        kline_interval=args.kline_interval,
+        kline_days=args.kline_days,
+        metrics=metrics,
+    )
+    api.save_metrics(metrics, metrics_dir(args))
+    return 0
+
+
+def run_export(args):
+    from cryptolens import api
+    from cryptolens.metrics import RunMetrics
+
+    df_coins, df_categories = api.load_latest(args.data_dir)
+    if df_coins.empty or df_categories.empty:
+        print("Error: no coin or category data, run 'cryptolens refresh' first")
+        return 1
+    metrics = RunMetrics("export")
+    df_coins = api.apply_price_changes(df_coins, args.data_dir, args.kline_interval)
+    api.export_data(
+        df_coins,
+        df_categories,
+        args.out_dir or args.data_dir,
+        formats=args.formats,
+        engine=args.engine,
+        metrics=metrics,
+    )
+    api.save_metrics(metrics, metrics_dir(args))
+    return 0
+
+
+def run_analyze(args):
+    from cryptolens import api
+    from cryptolens.metrics import RunMetrics
+
+    df_coins, df_categories = api.load_latest(args.data_dir)
+    if df_coins.empty or df_categories.empty:
+        print("Error: no coin or category data, run 'cryptolens refresh' first")
+        return 1
+    metrics = RunMetrics("analyze")
+    df_coins = api.apply_price_changes(df_coins, args.data_dir, args.kline_interval)
+    _, category_index, df_category_stats = api.analyze_data(
+        df_coins, df_categories, args.data_dir, engine=args.engine, metrics=metrics
+    )
+    api.save_metrics(metrics, metrics_dir(args))
+    print(
+        f"Category index: {len(category_index.coin_ids)} coins x {len(category_index.category_names)} categories"
+    )
+    df_top = df_category_stats.sort_values("coinCap", ascending=False).head(args.top)
+    print(df_top.to_string(index=False))
+    return 0
+
+
+# まだ記録していないスナップショットの差分を変化のフィードに追記して表示する
+def run_diff(args):
+    from cryptolens import api
+
+    l_events = api.record_changes(args.data_dir)
+    if not l_events:
+        print("No new snapshots to diff")
+        return 0
+    for events in l_events:
+        print(events.to_pandas().head(args.top).to_string(index=False))
+    return 0
+
+
+# ノートブックと同じ順序ですべての処理を実行する
+def run_all(args):
+    from cryptolens import api
+    from cryptolens.metrics import RunMetrics
+
+    metrics = RunMetrics("run")
+    client = api.make_client(args.data_dir, replay=args.replay or None, metrics=metrics)
+    api_keys = api.load_api_keys(args.env_file)
+    df_coins, df_categories, _ = api.refresh_data(
+        client,
+        api_keys[0] if api_keys else None,
+        args.data_dir,
+        metrics=metrics,
+        api_keys=api_keys,
+        workers_per_key=args.workers_per_key,
+    )
+    df_coins = api.fetch_data(
+        client,
+        df_coins,
+        args.data_dir,
+        kline_interval=args.kline_interval,
+        metrics=metrics,
+    )
+    api.analyze_data(
+        df_coins, df_categories, args.data_dir, engine=args.engine, metrics=metrics
+    )
+    api.export_data(
+        df_coins,
+        df_categories,
+        args.out_dir or args.data_dir,
+        formats=args.formats,
+        engine=args.engine,
+        metrics=metrics,
+    )
+    api.save_metrics(metrics, metrics_dir(args))
+    return 0
+
+
+# データの種類ごとの間隔で更新し続ける (Ctrl+Cで実行中のジョブを終えてから止まる)
+def run_schedule(args):
+    from cryptolens import api
+    from cryptolens.metrics import RunMetrics
+    from cryptolens.scheduler import Scheduler
+
+    metrics = RunMetrics("schedule")
+    client = api.make_client(args.data_dir, replay=args.replay or None, metrics=metrics)
+    with Scheduler(
+        client,
+        api.load_api_key(args.env_file),
+        args.data_dir,
+        metrics=metrics,
+        metrics_dir=metrics_dir(args),
+    ) as scheduler:
+        try:
+            scheduler.run(duration=args.duration)
+        except KeyboardInterrupt:
+            print("Stopping scheduler")
+    client.print_stats()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cryptolens",
+        description="Collect ByBit and CoinGecko data and analyze crypto categories.",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=config.DATA_DIR,
+        help=f"data directory (default: {config.DATA_DIR})",
+    )
+    parser.add_argument(
+        "--env-file",
+        default=config.ENV_PATH,
+        help=f".env file with COINGECKO_API_KEY or comma-separated COINGECKO_API_KEYS (default: {config.ENV_PATH})",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        help="directory for run_report.json and cryptolens.prom (default: <data-dir>/metrics)",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="use cached API responses only (same as CRYPTOLENS_REPLAY=1)",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="<command>")
+
+    # 出力・分析のオプション
+    output_options = argparse.ArgumentParser(add_help=False)
+    output_options.add_argument(
+        "--engine",
+        choices=["pandas", "polars"],
+        default=config.PIPELINE_ENGINE,
+        help=f"engine for the cleaning stage (default: {config.PIPELINE_ENGINE})",
+    )
+    output_options.add_argument(
+        "--kline-interval",
+        default=config.KLINE_INTERVAL,
+        help=f"kline interval for price changes (default: {config.KLINE_INTERVAL})",
+    )
+    # 取得のオプション
+    crawl_options = argparse.ArgumentParser(add_help=False)
+    crawl_options.add_argument(
+        "--workers-per-key",
+        type=int,
+        default=1,
+        help="detail crawl processes per CoinGecko API key, sharing its rate limit (default: 1)",
+    )
+    export_options = argparse.ArgumentParser(add_help=False)
+    export_options.add_argument(
+        "--formats",
+        nargs="+",
+        choices=["xlsx", "csv", "parquet", "arrow"],
+        default=config.EXPORT_FORMATS,
+        help=f"export formats (default: {' '.join(config.EXPORT_FORMATS)})",
+    )
+    export_options.add_argument(
+        "--out-dir", help="export directory (default: the data directory)"
+    )
+
+    subparser = subparsers.add_parser(
+        "status", help="show the latest snapshots in the history stores"
+    )
+    subparser.set_defaults(func=run_status)
+
+    subparser = subparsers.add_parser(
+        "refresh",
+        parents=[crawl_options],
+        help="refresh coin and category data and store a snapshot",
+    )
+    subparser.set_defaults(func=run_refresh)
+
+    subparser = subparsers.add_parser(
+        "schedule",
+        help="keep the latest snapshot fresh with per-source refresh cadences",
+    )
+    subparser.add_argument(
+        "--duration",
+        type=float,
+        help="seconds to run before exiting (default: run until interrupted)",
+    )
+    subparser.set_defaults(func=run_schedule)
+
+    subparser = subparsers.add_parser(
+        "fetch", help="backfill long-short ratio and kline histories"
+    )
+    subparser.add_argument(
+        "--ratio-periods",
+        nargs="+",
+        default=config.RATIO_HISTORY_PERIODS,
+        help=f"long-short ratio periods (default: {' '.join(config.RATIO_HISTORY_PERIODS)})",
+    )
+    subparser.add_argument(
+        "--ratio-days",
+        type=int,
+        default=config.RATIO_HISTORY_DAYS,
+        help=f"days of ratio history on the first run (default: {config.RATIO_HISTORY_DAYS})",
+    )
+    subparser.add_argument(
+        "--kline-interval",
+        default=config.KLINE_INTERVAL,
+        help=f"kline interval in minutes (default: {config.KLINE_INTERVAL})",
+    )
+    subparser.add_argument(
+        "--kline-days",
+        type=int,
+        default=config.KLINE_DAYS,
+        help=f"days of klines on the first run (default: {config.KLINE_DAYS})",
+    )
+    subparser.set_defaults(func=run_fetch)
+
+    subparser = subparsers.add_parser(
+        "export",
+        parents=[output_options, export_options],
+        help="export the latest coin and category data",
+    )
+    subparser.set_defaults(func=run_export)
+
+    subparser = subparsers.add_parser(
+        "analyze",
+        parents=[output_options],
+        help="check data quality and build the category index",
+    )
+    subparser.add_argument(
+        "--top", type=int, default=20, help="categories to show (default: 20)"
+    )
+    subparser.set_defaults(func=run_analyze)
+
+    subparser = subparsers.add_parser(
+        "diff",
+        help="append changes since the previous snapshot to <data-dir>/change_feed.jsonl",
+    )
+    subparser.add_argument(
+        "--top", type=int, default=20, help="changes to show per snapshot (default: 20)"
+    )
+    subparser.set_defaults(func=run_diff)
+
+    subparser = subparsers.add_parser(
+        "run",
+        parents=[crawl_options, output_options, export_options],
+        help="refresh, fetch, analyze and export in one go",
+    )
+    subparser.set_defaults(func=run_all)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 0
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cryptolens.cache import CacheMissError
+from cryptolens.ratelimit import TokenBucket
+
+# リトライ対象のステータスコード
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# ホストごとにコネクションプールを持ち、レート制限・リトライ・バックオフをまとめて行うHTTPクライアント
+# rate_limits: {ホスト名: (リクエスト数, 秒数)} でホストごとの上限を指定する
+# cache: ResponseCacheを渡すと有効期間内のレスポンスは通信せずにキャッシュから返す
+# metrics: RunMetricsを渡すとリクエストごとの応答時間・受信バイト数と待機時間を記録する
+# base_urls: {元のURLの先頭: 置き換えるURLの先頭} で送信先を置き換える (ローカルのスタンドインサーバー用)
+# buckets: {ホスト名: トークンバケット} で指定したホストはrate_limitsの代わりにそのバケットを使う
+#   (プロセス間で上限を共有するFileTokenBucket用)
+#   レート制限・キャッシュ・統計は元のURLのホストとエンドポイントのまま扱う
+class HttpClient:
+    def __init__(
+        self,
+        rate_limits=None,
+        cache=None,
+        max_retries=5,
+        backoff=1.0,
+        max_backoff=60.0,
+        pool_size=32,
+        timeout=30,
+        metrics=None,
+        base_urls=None,
+        buckets=None,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache = cache
+        self.metrics = metrics
+        self.base_urls = dict(base_urls or {})
+        self.rate_limits = dict(rate_limits or {})
+        self._buckets = {
+            host: TokenBucket(*limit) for host, limit in (rate_limits or {}).items()
+        }
+        self._buckets.update(buckets or {})
+        self._sessions = {}
+        # サーバーから指示された待機 (Retry-After, X-Bapi-Limit-Status) の解除時刻
+        self._blocked_until = defaultdict(float)
+        self._lock = threading.Lock()
+        # エンドポイントごとの成功・リトライ・スロットリング・エラーの件数
+        self.stats = defaultdict(Counter)
+
+    # ホストごとのセッション (keep-aliveのコネクションプール) を取得する
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+            return session
+
+    # 送信先のURLを置き換える
+    def _rewrite(self, url):
+        for prefix, replacement in self.base_urls.items():
+            if url.startswith(prefix):
+                return replacement + url[len(prefix) :]
+        return url
+
+    # ホストのレート制限とサーバー指示の待機が解けるまで待つ
+    def _wait_turn(self, host):
+        waited = 0.0
+        delay = self._blocked_until[host] - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            waited += delay
+        bucket = self._buckets.get(host)
+        if bucket is not None:
+            waited += bucket.acquire()
+        if self.metrics is not None:
+            self.metrics.observe_sleep(host, waited, "rate_limit")
+
+    # リトライまでdelay秒待つ
+    def _backoff(self, host, delay):
+        time.sleep(delay)
+        if self.metrics is not None:
+            self.metrics.observe_sleep(host, delay, "backoff")
+
+    # 1回のリクエスト (リトライを含む) の応答時間・受信バイト数・ステータスコードを記録する
+    # ストリーミングのレスポンスは本文を読まず、応答時間はヘッダーまで、受信バイト数はContent-Lengthにする
+    def _observe(self, endpoint, started, response, stream=False):
+        if self.metrics is None:
+            return
+        seconds = time.perf_counter() - started
+        if response is None:
+            self.metrics.observe_request(endpoint, seconds, 0, "exception")
+            return
+        if stream:
+            try:
+                n_bytes = int(response.headers.get("Content-Length", 0))
+            except ValueError:
+                n_bytes = 0
+        else:
+            n_bytes = len(response.content)
+        self.metrics.observe_request(endpoint, seconds, n_bytes, response.status_code)
+
+    # エンドポイントの件数を1増やす (プールのスレッドから同時に呼ばれるためロックを取る)
+    def _count(self, endpoint, name):
+        with self._lock:
+            self.stats[endpoint][name] += 1
+
+    # リトライし尽くした、またはリトライしないエラーを数える
+    def _count_error(self, endpoint):
+        self._count(endpoint, "error")
+        if self.metrics is not None:
+            self.metrics.count_error(endpoint)
+
+    # ホスト全体をdelay秒間待機させる (並列のリクエストも含めて止める)
+    def _block(self, host, delay):
+        with self._lock:
+            self._blocked_until[host] = max(
+                self._blocked_until[host], time.monotonic() + delay
+            )
+
+    # レスポンスヘッダーからレート制限の残りを読み取ってペースを調整する
+    # Bybit: X-Bapi-Limit-Status (残り回数), X-Bapi-Limit-Reset-Timestamp (解除時刻[ms])
+    def _adapt_pacing(self, host, response):
+        remaining = response.headers.get("X-Bapi-Limit-Status")
+        reset = response.headers.get("X-Bapi-Limit-Reset-Timestamp")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining = int(remaining)
+            until_reset = int(reset) / 1000 - time.time()
+        except ValueError:
+            return
+        if until_reset <= 0:
+            return
+        if remaining <= 0:
+            self._block(host, until_reset)
+        elif remaining < 10:
+            # 残りが少ないときは解除時刻まで均等に間隔を空ける
+            self._block(host, until_reset / remaining)
+
+    # キャッシュに保存するレスポンスかを判定する
+    # Bybitはエラーも200で返し、本文のretCodeが0以外になる (エラーの本文を有効期間中返し続けないようにする)
+    @staticmethod
+    def _cacheable(host, response):
+        if response.status_code != 200:
+            return False
+        if host != "api.bybit.com":
+            return True
+        try:
+            return response.json().get("retCode") == 0
+        except (ValueError, AttributeError):
+            return False
+
+    # リトライまでの待機秒数を決める (Retry-Afterがあれば従い、なければジッター付き指数バックオフ)
+    # Retry-Afterは秒数かHTTPの日時で、0からmax_backoffの範囲に収める
+    def _retry_delay(self, response, attempt):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                delay = self._parse_retry_after(retry_after)
+                if delay is not None:
+                    return min(max(delay, 0.0), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    # Retry-Afterの値を待機秒数にする (解釈できなければNone)
+    @staticmethod
+    def _parse_retry_after(retry_after):
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            retry_time = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        # タイムゾーンのない日時 (-0000) はUTCとみなす
+        if retry_time.tzinfo is None:
+            retry_time = retry_time.replace(tzinfo=timezone.utc)
+        return retry_time.timestamp() - time.time()
+
+    # GETリクエストを送る関数
+    # キャッシュが有効期間内ならそれを返し、期限切れなら条件付きリクエストで再検証する
+    # stream: Trueの場合は本文を読み込まずに返す (iter_contentでチャンクごとに読む)
+    #   キャッシュする場合は読んだチャンクを一時ファイル経由でキャッシュに書き込み、本文全体をメモリに持たない
+    #   (キャッシュから返す場合は保存した本文を1回で読み込む)
+    def get(self, url, params=None, headers=None, endpoint=None, stream=False):
+        host = urlsplit(url).netloc
+        endpoint = endpoint or f"{host}{urlsplit(url).path}"
+        if self.cache is None:
+            return self._get(url, params, headers, host, endpoint, stream)
+
+        key = self.cache.make_key(url, params)
+        entry = self.cache.get(key)
+        if self.cache.replay:
+            if entry is None:
+                raise CacheMissError(f"No cached response in replay mode: {url}")
+            self._count(endpoint, "cache_hit")
+            return self.cache.to_response(entry)
+        if entry is not None and self.cache.is_fresh(entry, endpoint):
+            self._count(endpoint, "cache_hit")
+            return self.cache.to_response(entry)
+
+        if entry is not None:
+            headers = {**(headers or {}), **self.cache.conditional_headers(entry)}
+        response = self._get(url, params, headers, host, endpoint, stream)
+        if response.status_code == 304 and entry is not None:
+            self._count(endpoint, "not_modified")
+            self.cache.touch(key)
+            return self.cache.to_response(entry)
+        if not self._cacheable(host, response):
+            return response
+        if stream:
+            return self.cache.put_stream(key, response)
+        self.cache.put(key, response)
+        return response
+
+    # GETリクエストを送る関数 (キャッシュなし)
+    # 429/5xxと通信エラーはリトライし、リトライし尽くした場合は最後のレスポンスを返す
+    def _get(self, url, params, headers, host, endpoint, stream=False):
+        session = self._session(host)
+        url = self._rewrite(url)
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_turn(host)
+            started = time.perf_counter()
+            try:
+                response = session.get(
+                    url,
+                    params=params,
+                    headers=headers,
+                    timeout=self.timeout,
+                    stream=stream,
+                )
+            except requests.RequestException:
+                self._observe(endpoint, started, None)
+                if attempt == self.max_retries:
+                    self._count_error(endpoint)
+                    raise
+                self._count(endpoint, "retry")
+                self._backoff(host, self._retry_delay(None, attempt))
+                continue
+
+            self._observe(endpoint, started, response, stream)
+            self._adapt_pacing(host, response)
+            if response.status_code not in RETRY_STATUS_CODES:
+                if response.status_code < 400:
+                    self._count(endpoint, "success")
+                else:
+                    self._count_error(endpoint)
+                return response
+            if response.status_code == 429:
+                self._count(endpoint, "throttle")
+            if attempt == self.max_retries:
+                self._count_error(endpoint)
+                return response
+            self._count(endpoint, "retry")
+            # ストリーミングのレスポンスは本文を読まずにコネクションを返す
+            response.close()
+            delay = self._retry_delay(response, attempt)
+            if response.status_code == 429:
+                self._block(host, delay)
+            else:
+                self._backoff(host, delay)
+        return response
+
+    # エンドポイントごとの件数を表示する
+    def print_stats(self):
+        for endpoint, stats in sorted(self.stats.items()):
+            print(
+                f"{endpoint}: success={stats['success']}, retry={stats['retry']}, "
+                f"throttle={stats['throttle']}, error={stats['error']}, "
+                f"cache_hit={stats['cache_hit']}, not_modified={stats['not_modified']}"
+            )
@@ -0,0 +1,374 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from tqdm import tqdm
+
+from cryptolens import config
+from cryptolens.records import ColumnarBuilder, Field, iter_json_array
+
+
+# CoinGeckoから仮想通貨のカテゴリ一覧を取得する関数
+def get_coingecko_categories_list(client, api_key):
+    url = "https://api.coingecko.com/api/v3/coins/categories?order=market_cap_desc"
+    headers = {"accept": "application/json", "x-cg-demo-api-key": api_key}
+    response = client.get(url, headers=headers)
+    if response.status_code != 200:
+        print(
+            f"Error fetching CoinGecko categories list: {response.status_code}, {response.text}"
+        )
+        return pd.DataFrame()
+    df = pd.DataFrame(response.json())
+    # 必要な列だけ抽出
+    df = df[
+        [
+            "id",
+            "name",
+            "market_cap",
+            "market_cap_change_24h",
+            "volume_24h",
+            "updated_at",
+        ]
+    ]
+    # 更新日時の形式をJSTのdatetime形式に変更
+    df["updated_at"] = pd.to_datetime(df["updated_at"], utc=True)
+    df["updated_at"] = df["updated_at"].dt.tz_convert("Asia/Tokyo")
+    df["updated_at"] = df["updated_at"].dt.floor("s")
+    # 列名変更
+    columns = [
+        "categoryId",
+        "categoryName",
+        "categoryCap",
+        "categoryCapChg24h",
+        "categoryVol24h",
+        "categoryUpdateTime",
+    ]
+    df.columns = columns
+    return df
+
+
+# CoinGeckoの/coins/listから取得する列の定義 (プラットフォームは空要素を除いたキーのリスト)
+coin_list_fields = [
+    Field("coinId", ["id"], "str"),
+    Field("coin", ["symbol"], "str"),
+    Field("coinName", ["name"], "str"),
+    Field("coinPlatforms", ["platforms"], "keys"),
+]
+
+
+# CoinGeckoから仮想通貨一覧を取得する関数
+# 1万件を超える配列をまとめてJSONとして読み込まず、1件ずつ読んで列ごとに溜める
+# (本文はストリーミングで受信し、チャンクごとに読む。キャッシュから返す場合は保存した本文を1回で読み込む)
+def get_coingecko_coins_list(client, api_key):
+    url = "https://api.coingecko.com/api/v3/coins/list"
+    headers = {"accept": "application/json", "x-cg-demo-api-key": api_key}
+    params = {
+        "include_platform": "true",
+    }
+    response = client.get(url, headers=headers, params=params, stream=True)
+    if response.status_code != 200:
+        print(
+            f"Error fetching CoinGecko coins list: {response.status_code}, {response.text}"
+        )
+        return pd.DataFrame()
+    builder = ColumnarBuilder(coin_list_fields)
+    builder.extend(iter_json_array(response.iter_content(chunk_size=64 * 1024)))
+    return builder.to_frame()
+
+
+# CoinGeckoの/coins/{id}から取得する列の定義
+coin_info_fields = [
+    Field("coinId", ["id"], "str"),
+    Field("coin", ["symbol"], "str"),
+    Field("coinName", ["name"], "str"),
+    Field("coinSlug", ["web_slug"], "str"),
+    Field("categories", ["categories"], "list"),
+    Field("assetPlatformId", ["asset_platform_id"], "str"),
+    Field("platforms", ["platforms"], "keys"),
+    Field("facebookLikes", ["community_data", "facebook_likes"]),
+    Field("redditSubscribers", ["community_data", "reddit_subscribers"]),
+    Field("telegramUserCount", ["community_data", "telegram_channel_user_count"]),
+    Field("xFollowers", ["community_data", "twitter_followers"]),
+    Field("coinCap", ["market_data", "market_cap", "usd"]),
+    Field("coinCapRank", ["market_cap_rank"]),
+    Field("coinCapFdvRatio", ["market_cap_fdv_ratio"]),
+    Field(
+        "coinCapChg%24h",
+        ["market_data", "market_cap_change_percentage_24h_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field("ath", ["market_data", "ath", "usd"]),
+    Field("athChg%", ["market_data", "ath_change_percentage", "usd"], scale=0.01),
+    Field("athDate", ["market_data", "ath_date", "usd"], "datetime", "Asia/Tokyo"),
+    Field("atl", ["market_data", "atl", "usd"]),
+    Field("atlChg%", ["market_data", "atl_change_percentage", "usd"], scale=0.01),
+    Field("atlDate", ["market_data", "atl_date", "usd"], "datetime", "Asia/Tokyo"),
+    Field("currentPrice", ["market_data", "current_price", "usd"]),
+    Field(
+        "priceChg%1h",
+        ["market_data", "price_change_percentage_1h_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field(
+        "priceChg%24h",
+        ["market_data", "price_change_percentage_24h_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field(
+        "priceChg%7d",
+        ["market_data", "price_change_percentage_7d_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field(
+        "priceChg%14d",
+        ["market_data", "price_change_percentage_14d_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field(
+        "priceChg%30d",
+        ["market_data", "price_change_percentage_30d_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field(
+        "priceChg%60d",
+        ["market_data", "price_change_percentage_60d_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field(
+        "priceChg%200d",
+        ["market_data", "price_change_percentage_200d_in_currency", "usd"],
+        scale=0.01,
+    ),
+    Field("sentimentVotesUp%", ["sentiment_votes_up_percentage"], scale=0.01),
+    Field("watchlistUsers", ["watchlist_portfolio_users"]),
+    Field("coinUpdateTime", ["last_updated"], "datetime", "Asia/Tokyo"),
+]
+
+# get_all_infoが返すdfの列 (市場データ・詳細情報をこのパイプラインで取得した日時を含む)
+coin_info_columns = [field.name for field in coin_info_fields] + [
+    "marketFetchTime",
+    "detailUpdateTime",
+]
+
+
+# CoinGeckoから仮想通貨の詳細情報 (JSON) を取得する関数
+# 使わない多言語の名前・説明、取引所ごとのティッカー、開発者の情報、スパークラインは要求しない
+def get_coingecko_coin_info(client, id, api_key):
+    url = f"https://api.coingecko.com/api/v3/coins/{id}"
+    headers = {"accept": "application/json", "x-cg-demo-api-key": api_key}
+    params = {
+        "localization": "false",
+        "tickers": "false",
+        "market_data": "true",
+        "community_data": "true",
+        "developer_data": "false",
+        "sparkline": "false",
+    }
+    response = client.get(
+        url, headers=headers, params=params, endpoint="api.coingecko.com/coins/{id}"
+    )
+    if response.status_code != 200:
+        print(
+            f"Error fetching CoinGecko coins info: {response.status_code}, {response.text}"
+        )
+        return None
+    return response.json()
+
+
+# CoinGeckoから渡したidリストのすべての詳細情報を/coins/{id}で1件ずつ取得する関数
+# journal (CrawlJournal) を渡すと1件ごとに結果・エラーを記録し、記録済みのidは取得せずに記録した値を使う
+# (中断した後の再実行では、エラーになったidと未取得のidだけを取得する)
+def get_all_detail_info(client, l_ids, api_key, journal=None):
+    builder = ColumnarBuilder(coin_info_fields)
+    errors = []
+    # 詳細情報の取得日時 (差分更新でTTLの判定に使う)
+    now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo")).replace(microsecond=0)
+    l_update_times = []
+
+    if journal is not None:
+        done = journal.done()
+        l_done_ids = [id for id in dict.fromkeys(l_ids) if id in done]
+        l_ids = journal.pending(l_ids)
+        if l_done_ids:
+            print(
+                f"Resuming from journal: {len(l_done_ids)} done, {len(l_ids)} to fetch"
+            )
+        for id in l_done_ids:
+            row, fetched = done[id]
+            builder.append_row(row)
+            l_update_times.append(fetched)
+
+    for id in tqdm(l_ids, desc="Fetching coin info from CoinGecko"):
+        try:
+            json = get_coingecko_coin_info(client, id, api_key)
+            if json is not None:
+                row = builder.extract(json)
+                builder.append_row(row)
+                l_update_times.append(now)
+                if journal is not None:
+                    journal.record(id, row)
+            elif journal is not None:
+                journal.record_error(id, "no data")
+        except Exception as e:
+            errors.append((id, str(e)))
+            print(f"Error fetching info data for id {id}: {e}")
+            if journal is not None:
+                journal.record_error(id, str(e))
+
+    if errors:
+        print("Errors occurred for the following ids:")
+        for error in errors:
+            print(f"ID: {error[0]}, Error: {error[1]}")
+
+    # 型変換・JSTへの変換・%の倍率変換は列の定義に従ってまとめて行う
+    df = builder.to_frame()
+    df["detailUpdateTime"] = pd.to_datetime(
+        pd.Series(l_update_times, dtype=object), utc=True
+    ).dt.tz_convert("Asia/Tokyo")
+
+    return df
+
+
+# CoinGeckoの/coins/marketsから取得する列の定義 (/coins/{id}と同じ列名にする)
+coin_market_fields = [
+    Field("coinId", ["id"], "str"),
+    Field("coin", ["symbol"], "str"),
+    Field("coinName", ["name"], "str"),
+    Field("coinCap", ["market_cap"]),
+    Field("coinCapRank", ["market_cap_rank"]),
+    Field("coinCapChg%24h", ["market_cap_change_percentage_24h"], scale=0.01),
+    Field("ath", ["ath"]),
+    Field("athChg%", ["ath_change_percentage"], scale=0.01),
+    Field("athDate", ["ath_date"], "datetime", "Asia/Tokyo"),
+    Field("atl", ["atl"]),
+    Field("atlChg%", ["atl_change_percentage"], scale=0.01),
+    Field("atlDate", ["atl_date"], "datetime", "Asia/Tokyo"),
+    Field("currentPrice", ["current_price"]),
+    Field("priceChg%1h", ["price_change_percentage_1h_in_currency"], scale=0.01),
+    Field("priceChg%24h", ["price_change_percentage_24h_in_currency"], scale=0.01),
+    Field("priceChg%7d", ["price_change_percentage_7d_in_currency"], scale=0.01),
+    Field("priceChg%14d", ["price_change_percentage_14d_in_currency"], scale=0.01),
+    Field("priceChg%30d", ["price_change_percentage_30d_in_currency"], scale=0.01),
+    Field("priceChg%200d", ["price_change_percentage_200d_in_currency"], scale=0.01),
+    Field("coinUpdateTime", ["last_updated"], "datetime", "Asia/Tokyo"),
+]
+
+
+# CoinGeckoから渡したidリスト (最大250件) の市場データ (JSON) を/coins/marketsでまとめて取得する関数
+def get_coingecko_coins_markets(client, l_ids, api_key):
+    url = "https://api.coingecko.com/api/v3/coins/markets"
+    headers = {"accept": "application/json", "x-cg-demo-api-key": api_key}
+    params = {
+        "vs_currency": "usd",
+        "ids": ",".join(l_ids),
+        "per_page": 250,
+        "page": 1,
+        "price_change_percentage": "1h,24h,7d,14d,30d,200d",
+    }
+    response = client.get(url, headers=headers, params=params)
+    if response.status_code != 200:
+        print(
+            f"Error fetching CoinGecko coins markets: {response.status_code}, {response.text}"
+        )
+        return []
+    return response.json()
+
+
+# CoinGeckoから渡したidリストのすべての市場データを250件ずつページングして取得する関数
+# marketFetchTimeは取得した日時 (差分更新でTTLの判定に使う。coinUpdateTimeはCoinGecko側の更新日時で、
+# 取引の少ない仮想通貨では古いままになるため使わない)
+def get_all_market_info(client, l_ids, api_key, per_page=250):
+    builder = ColumnarBuilder(coin_market_fields)
+    errors = []
+    now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo")).replace(microsecond=0)
+
+    l_chunks = [l_ids[i : i + per_page] for i in range(0, len(l_ids), per_page)]
+    for chunk in tqdm(l_chunks, desc="Fetching coin markets from CoinGecko"):
+        try:
+            builder.extend(get_coingecko_coins_markets(client, chunk, api_key))
+        except Exception as e:
+            errors.append((chunk[0], str(e)))
+            print(f"Error fetching markets data from id {chunk[0]}: {e}")
+
+    if errors:
+        print("Errors occurred for the pages starting at the following ids:")
+        for error in errors:
+            print(f"ID: {error[0]}, Error: {error[1]}")
+
+    df = builder.to_frame()
+    df["marketFetchTime"] = pd.Series(now, index=df.index)
+    return df
+
+
+# /coins/{id}でしか取得できない列 (カテゴリ、コミュニティ、プラットフォーム等)
+detail_only_columns = [
+    field.name
+    for field in coin_info_fields
+    if field.name not in {market_field.name for market_field in coin_market_fields}
+]
+
+# 詳細情報の再取得までの期間の既定値 (/coins/{id}のレスポンスのキャッシュの有効期間)
+DETAIL_TTL = timedelta(seconds=config.CACHE_TTLS["*/coins/{id}"])
+
+
+# 詳細情報を/coins/{id}で取得し直す必要があるidのリストを出力する関数
+# /coins/{id}でしか取得できない列がすべて欠損している (未取得の) idと、取得日時がttlより古いidを返す
+def get_stale_detail_ids(df, ttl=DETAIL_TTL):
+    if df.empty or "detailUpdateTime" not in df.columns:
+        return list(df["coinId"].unique()) if "coinId" in df.columns else []
+    now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo"))
+    l_columns = [col for col in detail_only_columns if col in df.columns]
+    missing = df[l_columns].isna().all(axis=1) if l_columns else True
+    mask = (
+        missing | df["detailUpdateTime"].isna() | ((now - df["detailUpdateTime"]) > ttl)
+    )
+    return list(df.loc[mask, "coinId"].unique())
+
+
+# CoinGeckoから渡したidリストのすべての詳細情報を取得する関数
+# 市場データは/coins/marketsでまとめて取得し、/coins/{id}はdetail_idsだけに対して呼ぶ
+# (カテゴリ、コミュニティ、プラットフォーム等/coins/marketsにない列のため)
+# detail_idsを渡さない場合は、df_known (取得済みの詳細情報の列とdetailUpdateTimeを持つdf) で
+# /coins/{id}の列が未取得か、取得日時がdetail_ttlより古いidだけを取得する (df_knownがなければすべて)
+# journalは/coins/{id}の取得のチェックポイント (get_all_detail_infoを参照)
+# crawlを渡すと/coins/{id}の取得をcrawl(detail_ids, journal)で行う (複数のプロセス・APIキーでの取得用)
+def get_all_info(
+    client,
+    l_ids,
+    api_key,
+    detail_ids=None,
+    journal=None,
+    crawl=None,
+    df_known=None,
+    detail_ttl=DETAIL_TTL,
+):
+    if detail_ids is None:
+        if df_known is None:
+            detail_ids = l_ids
+        else:
+            df_known = df_known[df_known["coinId"].isin(l_ids)]
+            l_stale_ids = set(get_stale_detail_ids(df_known, detail_ttl))
+            l_known_ids = set(df_known["coinId"])
+            detail_ids = [
+                id for id in l_ids if id in l_stale_ids or id not in l_known_ids
+            ]
+    df_market = get_all_market_info(client, l_ids, api_key)
+    if crawl is not None:
+        df_detail = crawl(detail_ids, journal)
+    else:
+        df_detail = get_all_detail_info(client, detail_ids, api_key, journal)
+
+    # 市場データは/coins/marketsの値を優先し、取得できなかったidだけ/coins/{id}の値を使う
+    # (その場合の市場データの取得日時は/coins/{id}の取得日時)
+    df = df_market.set_index("coinId").combine_first(df_detail.set_index("coinId"))
+    df = df.reset_index().reindex(columns=coin_info_columns)
+    df["marketFetchTime"] = df["marketFetchTime"].fillna(df["detailUpdateTime"])
+    return df
+
+
+# CoinGeckoから渡したidリストの時価総額順位を/coins/marketsでまとめて取得する関数
+def get_coin_cap_ranks(client, l_ids, api_key):
+    df = get_all_market_info(client, l_ids, api_key)
+    if df.empty:
+        return pd.DataFrame(columns=["coinId", "coinCapRank"])
+    return df[["coinId", "coinCapRank"]]
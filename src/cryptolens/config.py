@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+# 既定の設定 (コマンドとノートブックで共通に使う)
+# このモジュールは重い依存ライブラリを読み込まない (cryptolens --help を速く起動するため)
+
+# データの保存先と、APIキーを読み込む.envファイル
+DATA_DIR = "./data"
+ENV_PATH = "../../.env"
+
+# データの種類ごとの再取得までの期間 (売買比率・市場データは日次、詳細情報・カテゴリはあまり変わらない)
+TTL = {
+    "ratio": timedelta(days=1),
+    "market": timedelta(days=1),
+    "detail": timedelta(days=7),
+    "category": timedelta(days=1),
+}
+
+# ホストごとのレート制限 (リクエスト数, 秒数)
+# CoinGecko: Demo APIの上限 (1分間に30回) に収まるよう2.05秒に1回
+# ByBit: IP単位の上限 (5秒間に600回) に収まるよう1秒間に100回
+RATE_LIMITS = {
+    "api.coingecko.com": (1, 2.05),
+    "api.bybit.com": (100, 1),
+}
+
+# エンドポイントごとのレスポンスのキャッシュの有効期間[s]
+CACHE_TTLS = {
+    "*/coins/list": 24 * 60 * 60,
+    "*/coins/categories": 24 * 60 * 60,
+    "*/coins/{id}": 24 * 60 * 60,
+    "*/coins/markets": 10 * 60,
+    "*/instruments-info": 60 * 60,
+    "*/account-ratio": 10 * 60,
+}
+# レスポンスのキャッシュから削除するまでの期間[s] (リプレイで使えるのはこれより新しいレスポンスだけ)
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# 売買比率の履歴を保存する期間の種類と、初回にさかのぼる日数
+RATIO_HISTORY_PERIODS = ["1d"]
+RATIO_HISTORY_DAYS = 90
+# 価格変化率の計算に使うByBitのローソク足の間隔 (分) と、初回にさかのぼる日数
+KLINE_INTERVAL = "60"
+KLINE_DAYS = 201
+# 仮想通貨データとカテゴリデータを出力する形式 ("xlsx", "csv", "parquet", "arrow")
+EXPORT_FORMATS = ["xlsx"]
+# 抽出・列選択の処理に使うエンジン ("pandas" または "polars")
+PIPELINE_ENGINE = "pandas"
+
+# 履歴ストアの名前 (<DATA_DIR>/<名前>/manifest.json)
+COINS_STORE = "df_coins"
+CATEGORIES_STORE = "df_categories"
+
+# 定期実行 (cryptolens schedule) のデータの種類ごとの実行間隔と、実行時刻を遅らせる最大の時間 (ジッタ)
+# instruments: ByBitの上場・上場廃止の反映 (新しい仮想通貨だけ詳細情報などを取得する)
+# ratios: 売買比率 (期間の区切りの時刻に合わせて実行する)
+# markets: CoinGeckoの市場データ、details: CoinGeckoの詳細情報 (TTLより古いものだけ)、categories: カテゴリ
+SCHEDULE = {
+    "instruments": (timedelta(hours=1), timedelta(minutes=5)),
+    "ratios": (timedelta(days=1), timedelta(minutes=10)),
+    "markets": (timedelta(days=1), timedelta(minutes=30)),
+    "details": (timedelta(days=3), timedelta(hours=1)),
+    "categories": (timedelta(days=1), timedelta(minutes=30)),
+}
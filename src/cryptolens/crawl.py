@@ -0,0 +1,119 @@
+import glob
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cryptolens import config
+from cryptolens.coingecko import get_all_detail_info
+from cryptolens.journal import CrawlJournal
+from cryptolens.ratelimit import FileTokenBucket
+
+# CoinGeckoのホスト (APIキーごとのレート制限の対象)
+COINGECKO_HOST = "api.coingecko.com"
+
+
+# APIキーごとに共有するトークンバケットのファイルのパス (キーそのものはファイル名に含めない)
+def bucket_path(lock_dir, api_key):
+    digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return os.path.join(lock_dir, f"coingecko-{digest}.bucket")
+
+
+# APIキーの上限をプロセス間で共有するHTTPクライアントを作る関数
+# settings: {"data_dir", "replay", "base_urls", "rate_limits"} (親プロセスのクライアントと同じ設定)
+def make_shared_client(api_key, settings):
+    from cryptolens.api import make_client
+
+    buckets = {}
+    limit = settings["rate_limits"].get(COINGECKO_HOST)
+    if limit is not None:
+        lock_dir = os.path.join(settings["data_dir"], "ratelimit")
+        buckets[COINGECKO_HOST] = FileTokenBucket(
+            bucket_path(lock_dir, api_key), *limit
+        )
+    return make_client(
+        settings["data_dir"],
+        replay=settings["replay"],
+        base_urls=settings["base_urls"],
+        rate_limits=settings["rate_limits"],
+        buckets=buckets,
+    )
+
+
+# ワーカープロセスで1つのシャードのidの詳細情報を取得し、シャードのジャーナルに記録する関数
+# 結果はジャーナルに書くため、親プロセスにはエンドポイントごとの件数だけを返す
+def crawl_shard(l_ids, api_key, journal_path, max_age, settings):
+    client = make_shared_client(api_key, settings)
+    with CrawlJournal(journal_path, max_age=max_age) as journal:
+        get_all_detail_info(client, l_ids, api_key, journal)
+    return {endpoint: dict(stats) for endpoint, stats in client.stats.items()}
+
+
+# ワーカープロセスの起動方法 (forkserverでは読み込み済みのモジュールを引き継ぐため、
+# ワーカーごとにpandas等を読み込み直さない。forkserverがない環境ではspawnを使う)
+def worker_context():
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["cryptolens.api"])
+    return context
+
+
+# CoinGeckoの詳細情報を複数のプロセス・APIキーに分けて取得する関数
+# - 未取得とエラーになったidを (APIキーの数 × workers_per_key) 個のシャードに分け、プロセスごとに取得する
+# - シャードiはi番目のAPIキー (キーの数で割った余り) を使い、同じキーのプロセスは
+#   <data_dir>/ratelimit/のファイルのトークンバケットで上限 (RATE_LIMITSのCoinGeckoの値) を共有する
+# - ワーカーはシャードごとのジャーナル (<journalのパス>.<i>) に記録し、終わったらjournalに取り込む
+#   (中断した場合も次回の実行の最初に取り込むため、取得済みのidは再取得しない)
+# - 最後にjournalから全件のdfを作る (ワーカーでエラーになったidはここで1回だけ再取得する)
+# 返り値はget_all_detail_infoと同じ列のdf
+def crawl_detail_info(
+    client, l_ids, journal, api_keys, data_dir=config.DATA_DIR, workers_per_key=1
+):
+    settings = {
+        "data_dir": data_dir,
+        "replay": client.cache.replay if client.cache is not None else False,
+        "base_urls": client.base_urls,
+        "rate_limits": client.rate_limits,
+    }
+    # 前回の実行で取り込めなかったシャードのジャーナルを取り込む
+    for path in glob.glob(f"{glob.escape(journal.path)}.[0-9]*"):
+        if path.endswith(".tmp"):
+            continue
+        print(f'Merged {journal.merge(path)} entries from "{path}"')
+
+    l_pending = journal.pending(l_ids)
+    n_workers = min(len(api_keys) * workers_per_key, len(l_pending))
+    if n_workers > 0:
+        print(
+            f"Crawling {len(l_pending)} ids with {n_workers} workers and {len(api_keys)} API keys"
+        )
+        context = worker_context()
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(
+                    crawl_shard,
+                    l_pending[i::n_workers],
+                    api_keys[i % len(api_keys)],
+                    f"{journal.path}.{i}",
+                    journal.max_age,
+                    settings,
+                ): i
+                for i in range(n_workers)
+            }
+            for future in as_completed(futures):
+                try:
+                    for endpoint, stats in future.result().items():
+                        client.stats[endpoint].update(stats)
+                except Exception as e:
+                    print(f"Error in crawl worker {futures[future]}: {e}")
+        for i in range(n_workers):
+            path = f"{journal.path}.{i}"
+            if os.path.exists(path):
+                journal.merge(path)
+
+    retry_client = make_shared_client(api_keys[0], settings)
+    df = get_all_detail_info(retry_client, l_ids, api_keys[0], journal)
+    for endpoint, stats in retry_client.stats.items():
+        client.stats[endpoint].update(stats)
+    return df
@@ -0,0 +1,255 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# スナップショットの行を対応させるキー (ByBitのsymbolとCoinGeckoのid)
+KEYS = ["symbol", "coinId"]
+
+# しきい値 (前回のスナップショットから今回のスナップショットの間にlevelをまたいだら変化として記録する)
+Threshold = namedtuple("Threshold", ["column", "level"])
+
+# 標準のしきい値 (変化率は0.1 = 10%)
+DEFAULT_THRESHOLDS = [
+    Threshold("buyRatio", 0.4),
+    Threshold("buyRatio", 0.5),
+    Threshold("buyRatio", 0.6),
+    Threshold("coinCap", 1e8),
+    Threshold("coinCap", 1e9),
+    Threshold("coinCap", 1e10),
+    Threshold("priceChg%24h", -0.1),
+    Threshold("priceChg%24h", 0.1),
+    Threshold("priceChg%7d", -0.2),
+    Threshold("priceChg%7d", 0.2),
+]
+
+# 変化のテーブルの列
+# type: "listing" (新規上場), "delisting" (上場廃止), "category_added", "category_removed",
+#       "threshold_up" (level以上になった), "threshold_down" (level未満になった)
+EVENT_SCHEMA = pa.schema(
+    [
+        pa.field("type", pa.string()),
+        pa.field("symbol", pa.string()),
+        pa.field("coinId", pa.string()),
+        pa.field("category", pa.string()),
+        pa.field("column", pa.string()),
+        pa.field("level", pa.float64()),
+        pa.field("previous", pa.float64()),
+        pa.field("current", pa.float64()),
+    ]
+)
+
+
+# キーの列を文字列にして区切り文字でつないだ列を返す関数 (辞書エンコードの列も比べられるようにする)
+def key_column(table, keys=KEYS):
+    columns = [table.column(key).cast(pa.string()) for key in keys]
+    return pc.binary_join_element_wise(*columns, "\x1f")
+
+
+# 変化のテーブルを作る関数 (指定しない列は欠損値)
+# float32の値は10進数の表記が同じfloat64にする (0.6が0.6000000238418579にならないように)
+def _events(type, symbol, coin_id, n_rows=None, **columns):
+    n_rows = len(symbol) if n_rows is None else n_rows
+    data = {"type": pa.array([type] * n_rows, pa.string())}
+    data["symbol"] = symbol.cast(pa.string())
+    data["coinId"] = coin_id.cast(pa.string())
+    for field in EVENT_SCHEMA:
+        if field.name in data:
+            continue
+        value = columns.get(field.name)
+        if value is None:
+            data[field.name] = pa.nulls(n_rows, field.type)
+        else:
+            if pa.types.is_float32(value.type):
+                value = value.cast(pa.string())
+            data[field.name] = value.cast(field.type)
+    return pa.table(data, schema=EVENT_SCHEMA)
+
+
+# 2つのスナップショットのテーブルの差分 (変化のテーブル) を返す関数
+# 行はsymbolとcoinIdのハッシュで対応させ (pyarrow.computeのindex_in/is_in)、行ごとのループはしない
+# - キーが今回だけにある行は新規上場、前回だけにある行は上場廃止
+# - 両方にある行はカテゴリを (行, カテゴリ) の組にして比べ、追加・削除されたカテゴリを記録する
+# - 両方にある行でしきい値をまたいだ値を記録する (どちらかが欠損している場合は記録しない)
+def diff_tables(previous, current, thresholds=DEFAULT_THRESHOLDS):
+    previous_keys = key_column(previous).combine_chunks()
+    current_keys = key_column(current).combine_chunks()
+    l_events = []
+
+    # 今回の行に対応する前回の行の位置 (前回にない場合は欠損値)
+    positions = pc.index_in(current_keys, value_set=previous_keys)
+    listed = pc.is_null(positions)
+    l_events.append(
+        _events(
+            "listing",
+            pc.filter(current.column("symbol"), listed),
+            pc.filter(current.column("coinId"), listed),
+        )
+    )
+    delisted = pc.invert(pc.is_in(previous_keys, value_set=current_keys))
+    l_events.append(
+        _events(
+            "delisting",
+            pc.filter(previous.column("symbol"), delisted),
+            pc.filter(previous.column("coinId"), delisted),
+        )
+    )
+
+    # 両方にある行を同じ順序に並べる
+    matched = pc.invert(listed)
+    current_rows = pc.filter(pa.array(np.arange(current.num_rows)), matched)
+    previous_rows = pc.filter(positions, matched).cast(pa.int64())
+    symbols = current.column("symbol").take(current_rows)
+    coin_ids = current.column("coinId").take(current_rows)
+
+    if "categories" in current.column_names and "categories" in previous.column_names:
+        # (両方にある行の中の位置, カテゴリ) の組
+        l_pairs = []
+        for table, rows in [(previous, previous_rows), (current, current_rows)]:
+            categories = table.column("categories").take(rows).combine_chunks()
+            parents = pc.list_parent_indices(categories)
+            names = pc.list_flatten(categories)
+            pairs = pc.binary_join_element_wise(
+                parents.cast(pa.string()), names.cast(pa.string()), "\x1f"
+            )
+            l_pairs.append((parents, names, pairs))
+        for type, (parents, names, pairs), (_, _, other) in [
+            ("category_added", l_pairs[1], l_pairs[0]),
+            ("category_removed", l_pairs[0], l_pairs[1]),
+        ]:
+            changed = pc.invert(pc.is_in(pairs, value_set=other))
+            rows = pc.filter(parents, changed)
+            l_events.append(
+                _events(
+                    type,
+                    symbols.take(rows),
+                    coin_ids.take(rows),
+                    category=pc.filter(names, changed),
+                )
+            )
+
+    for threshold in thresholds:
+        if (
+            threshold.column not in current.column_names
+            or threshold.column not in previous.column_names
+        ):
+            continue
+        before = previous.column(threshold.column).take(previous_rows)
+        after = current.column(threshold.column).take(current_rows)
+        before_values = before.cast(pa.float64())
+        after_values = after.cast(pa.float64())
+        for type, crossed in [
+            (
+                "threshold_up",
+                pc.and_(
+                    pc.less(before_values, threshold.level),
+                    pc.greater_equal(after_values, threshold.level),
+                ),
+            ),
+            (
+                "threshold_down",
+                pc.and_(
+                    pc.greater_equal(before_values, threshold.level),
+                    pc.less(after_values, threshold.level),
+                ),
+            ),
+        ]:
+            # 欠損値との比較は欠損値になり、filterで除かれる
+            n_rows = pc.sum(crossed).as_py() or 0
+            l_events.append(
+                _events(
+                    type,
+                    pc.filter(symbols, crossed),
+                    pc.filter(coin_ids, crossed),
+                    n_rows,
+                    column=pa.array([threshold.column] * n_rows, pa.string()),
+                    level=pa.array([threshold.level] * n_rows, pa.float64()),
+                    previous=pc.filter(before, crossed),
+                    current=pc.filter(after, crossed),
+                )
+            )
+
+    return pa.concat_tables(l_events)
+
+
+# 差分に使うスナップショットの列 (キー、カテゴリ、しきい値の列)
+def diff_columns(thresholds=DEFAULT_THRESHOLDS):
+    return list(dict.fromkeys(KEYS + ["categories"] + [t.column for t in thresholds]))
+
+
+# 履歴ストアの2つのスナップショット (manifestのエントリ) の差分を返す関数
+# スナップショットは差分に使う列だけをメモリマップで読む (全体を読み込まない)
+def diff_snapshots(store, previous_entry, current_entry, thresholds=DEFAULT_THRESHOLDS):
+    columns = diff_columns(thresholds)
+    return diff_tables(
+        store.load_table(previous_entry, columns),
+        store.load_table(current_entry, columns),
+        thresholds,
+    )
+
+
+# ファイルの最後の行をJSONとして読む関数 (末尾から読み、ファイル全体は読まない)
+def read_last_line(path, block_size=4096):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0 and data.count(b"\n") < 2:
+            start = max(end - block_size, 0)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    l_lines = [line for line in data.splitlines() if line.strip()]
+    if not l_lines:
+        return None
+    try:
+        return json.loads(l_lines[-1])
+    except ValueError:
+        return None
+
+
+# 変化を1行1件のJSONでフィードに追記する関数 (tail -fで読めるように1回の書き込みで追記する)
+# 各行にスナップショットの取得日時を付け、欠損値の項目は省く
+# 最後にスナップショットごとのまとめの行 ({"type": "snapshot", ...}) を書く (どこまで記録したかの目印)
+def append_change_feed(path, events, previous_entry, current_entry):
+    l_lines = []
+    for event in events.to_pylist():
+        event = {key: value for key, value in event.items() if value is not None}
+        event = {"snapshotTime": current_entry["snapshotTime"], **event}
+        l_lines.append(json.dumps(event, ensure_ascii=False, separators=(",", ":")))
+    summary = {
+        "snapshotTime": current_entry["snapshotTime"],
+        "type": "snapshot",
+        "snapshot": current_entry["snapshot"],
+        "previousSnapshot": previous_entry["snapshot"],
+        "events": events.num_rows,
+    }
+    l_lines.append(json.dumps(summary, ensure_ascii=False, separators=(",", ":")))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n".join(l_lines) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# 履歴ストアのまだフィードに記録していないスナップショットについて、1つ前のスナップショットとの差分を追記する関数
+# (フィードが空の場合は最新のスナップショットだけ記録する)
+# 返り値は追記した変化のテーブルのリスト
+def update_change_feed(store, path, thresholds=DEFAULT_THRESHOLDS):
+    l_entries = store.entries()
+    l_snapshots = [entry["snapshot"] for entry in l_entries]
+    last = read_last_line(path)
+    start = len(l_entries) - 1
+    if last is not None and last.get("snapshot") in l_snapshots:
+        start = l_snapshots.index(last["snapshot"]) + 1
+    l_results = []
+    for i in range(max(start, 1), len(l_entries)):
+        events = diff_snapshots(store, l_entries[i - 1], l_entries[i], thresholds)
+        append_change_feed(path, events, l_entries[i - 1], l_entries[i])
+        l_results.append(events)
+    return l_results
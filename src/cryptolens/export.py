@@ -0,0 +1,130 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+# 出力できる形式と拡張子
+FORMATS = {"xlsx": "xlsx", "csv": "csv", "parquet": "parquet", "arrow": "arrow"}
+
+
+# リストの列をPythonのリストの表記 (['a', 'b']) の文字列の列にする関数 (空のリストは "[]")
+def format_lists(column):
+    column = column.cast(pa.list_(pa.string()))
+    joined = pc.binary_join(column, "', '")
+    quoted = pc.binary_join_element_wise("['", joined, "']", "")
+    return pc.if_else(pc.equal(pc.list_value_length(column), 0), "[]", quoted)
+
+
+# 出力する表 (Arrowのテーブル) を作る関数
+# tables: 形式ごとの表
+#   "typed": タイムゾーン付きの日時・リストの列をそのまま持つ表 (Parquet, Arrow IPC)
+#   "text":  日時をタイムゾーンなしの現地時刻にし、リストを文字列にした表 (xlsx, CSV)
+#            float32の列は10進数の表記が同じfloat64にする (0.6が0.6000000238418579にならないように)
+# dfからの変換とタイムゾーンの処理はここで1回だけ行う
+def to_export_tables(df):
+    typed = pa.Table.from_pandas(df, preserve_index=False)
+    columns = []
+    for column in typed.columns:
+        if pa.types.is_timestamp(column.type) and column.type.tz is not None:
+            column = pc.local_timestamp(column)
+        elif pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+            column = format_lists(column)
+        elif pa.types.is_float32(column.type):
+            column = column.cast(pa.string()).cast(pa.float64())
+        columns.append(column)
+    text = pa.table(columns, names=typed.column_names)
+    return {"typed": typed, "text": text}
+
+
+# 一時ファイルに書き込んでから置き換える (書き込み途中のファイルを残さない)
+def _replace(write, path):
+    directory, file_name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{file_name}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# xlsxを書き込み専用モードで出力する関数 (行をbatch_size行ずつ変換して追記するのでメモリは一定)
+def write_xlsx(table, path, sheet_name, batch_size=10_000):
+    def write(tmp_path):
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(table.column_names)
+        for batch in table.to_batches(max_chunksize=batch_size):
+            columns = [column.to_pylist() for column in batch.columns]
+            for row in zip(*columns):
+                worksheet.append(row)
+        workbook.save(tmp_path)
+
+    _replace(write, path)
+
+
+def write_csv(table, path):
+    _replace(lambda tmp_path: pv.write_csv(table, tmp_path), path)
+
+
+def write_parquet(table, path):
+    _replace(lambda tmp_path: pq.write_table(table, tmp_path), path)
+
+
+# Arrow IPC (Feather V2) 形式で出力する関数
+def write_arrow(table, path):
+    def write(tmp_path):
+        with pa.ipc.new_file(tmp_path, table.schema) as writer:
+            writer.write_table(table)
+
+    _replace(write, path)
+
+
+# 複数のdfを複数の形式で並行に出力する関数
+# frames: {名前: df} (ファイル名は <名前>.<拡張子>、xlsxのシート名は名前)
+# 返り値は出力したファイルのパスと書き込みにかかった時間[s]
+def export_frames(frames, out_dir, formats=("xlsx",), max_workers=4):
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    tasks = []
+    for name, df in frames.items():
+        tables = to_export_tables(df)
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{name}.{FORMATS[fmt]}")
+            if fmt == "xlsx":
+                tasks.append((path, write_xlsx, (tables["text"], path, name)))
+            elif fmt == "csv":
+                tasks.append((path, write_csv, (tables["text"], path)))
+            elif fmt == "parquet":
+                tasks.append((path, write_parquet, (tables["typed"], path)))
+            else:
+                tasks.append((path, write_arrow, (tables["typed"], path)))
+
+    def run(write, args):
+        started = time.perf_counter()
+        write(*args)
+        return time.perf_counter() - started
+
+    results = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run, write, args): path for path, write, args in tasks
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                errors.append((path, str(e)))
+
+    if errors:
+        print("Errors occurred for the following exports:")
+        for error in errors:
+            print(f"Path: {error[0]}, Error: {error[1]}")
+
+    return results
@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+
+# ジャーナルのファイルの {id: 最後の行} を読む関数 (書き込み途中の行は読み飛ばす)
+def read_entries(path):
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["id"]] = entry
+    return entries
+
+
+# 1件ずつ取得するクロール (CoinGeckoの/coins/{id}など) の結果とエラーを追記していくチェックポイントのジャーナル
+# 1行1件のJSONL ({"id", "status": "done" | "error", "time", "row" | "error"}) に取得するたびに書き込み、
+# 中断した後の再実行では取得済みのidを飛ばし、エラーになったidと未取得のidだけを取得する
+# - 同じidの行は後の行を優先する (エラーの後に取得できればdone)
+# - 書き込み途中で中断した最後の行は読み飛ばす
+# - max_ageより古い結果は取得済みとみなさない (次回の定期的な再取得ではすべて取得し直す)
+#   (開いたままのジャーナルでも、done・failed・pendingを呼ぶたびにその時点の日時で判定する)
+# - 開くときに古い結果と重複した行を除いて書き直す (ファイルが増え続けないように)
+class CrawlJournal:
+    def __init__(self, path, max_age=timedelta(days=1), tz="Asia/Tokyo"):
+        self.path = path
+        self.max_age = max_age
+        self.tz = ZoneInfo(tz)
+        self.entries = self._read()
+        self._compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _read(self):
+        entries = read_entries(self.path)
+        expiry = self._expiry()
+        return {
+            id: entry
+            for id, entry in entries.items()
+            if datetime.fromisoformat(entry["time"]) >= expiry
+        }
+
+    def _clock(self):
+        return datetime.now().astimezone(self.tz)
+
+    # これより前に記録した結果は取得済みとみなさない日時
+    def _expiry(self):
+        return self._clock() - self.max_age
+
+    # max_ageより古くない行
+    def _fresh_entries(self):
+        expiry = self._expiry()
+        return {
+            id: entry
+            for id, entry in self.entries.items()
+            if datetime.fromisoformat(entry["time"]) >= expiry
+        }
+
+    # 残っている行だけを一時ファイルに書いてから置き換える
+    def _compact(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    # 1行追記してディスクまで書き出す (プロセスが強制終了されても書き込んだ行は残る)
+    def _write(self, entry):
+        self.entries[entry["id"]] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _now(self):
+        return self._clock().replace(microsecond=0).isoformat()
+
+    # 取得できたidの結果 (JSONにできる値の辞書) を記録する
+    def record(self, id, row):
+        self._write({"id": id, "status": "done", "time": self._now(), "row": row})
+
+    # 取得できなかったidのエラーを記録する
+    def record_error(self, id, error):
+        self._write({"id": id, "status": "error", "time": self._now(), "error": error})
+
+    # 別のジャーナルのファイル (並列のワーカーが書いたもの) の行を取り込んでから削除する
+    def merge(self, path):
+        entries = read_entries(path)
+        for entry in entries.values():
+            self.entries[entry["id"]] = entry
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        os.remove(path)
+        return len(entries)
+
+    # 取得済みのidの {id: (結果, 取得日時)} (max_ageより古い結果は含めない)
+    def done(self):
+        return {
+            id: (entry["row"], datetime.fromisoformat(entry["time"]))
+            for id, entry in self._fresh_entries().items()
+            if entry["status"] == "done"
+        }
+
+    # 前回エラーになったidの {id: エラー} (max_ageより古いエラーは含めない)
+    def failed(self):
+        return {
+            id: entry["error"]
+            for id, entry in self._fresh_entries().items()
+            if entry["status"] == "error"
+        }
+
+    # idリストのうち取得が必要なid (未取得とエラーになったid) を順番を保って返す
+    def pending(self, l_ids):
+        done = self.done()
+        return [id for id in l_ids if id not in done]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,226 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cryptolens.series import SeriesStore, backfill_series
+
+# ByBitのローソク足の間隔と1本の長さ[ms]
+INTERVALS = {
+    "1": 60 * 1000,
+    "5": 5 * 60 * 1000,
+    "15": 15 * 60 * 1000,
+    "30": 30 * 60 * 1000,
+    "60": 60 * 60 * 1000,
+    "240": 4 * 60 * 60 * 1000,
+    "D": 24 * 60 * 60 * 1000,
+}
+
+# ローソク足の時系列のスキーマ (symbolは辞書エンコード、時刻は足の開始時刻のUNIXタイムスタンプ[ms])
+KLINE_SCHEMA = pa.schema(
+    [
+        ("symbol", pa.dictionary(pa.int32(), pa.string())),
+        ("timestamp", pa.int64()),
+        ("open", pa.float64()),
+        ("high", pa.float64()),
+        ("low", pa.float64()),
+        ("close", pa.float64()),
+        ("volume", pa.float64()),
+        ("turnover", pa.float64()),
+    ]
+)
+
+# 価格変化率の列名と期間[ms] (df_coinsの列名に合わせる)
+PRICE_CHANGE_HORIZONS = {
+    "priceChg%1h": 60 * 60 * 1000,
+    "priceChg%24h": 24 * 60 * 60 * 1000,
+    "priceChg%7d": 7 * 24 * 60 * 60 * 1000,
+    "priceChg%14d": 14 * 24 * 60 * 60 * 1000,
+    "priceChg%30d": 30 * 24 * 60 * 60 * 1000,
+    "priceChg%60d": 60 * 24 * 60 * 60 * 1000,
+    "priceChg%200d": 200 * 24 * 60 * 60 * 1000,
+}
+
+
+# ByBitからローソク足を1ページ (最大1000本、新しい順) 取得する関数
+def get_bybit_klines_page(
+    client, category, symbol, interval, start_time, end_time, limit=1000
+):
+    url = "https://api.bybit.com/v5/market/kline"
+    params = {
+        "category": category,
+        "symbol": symbol,
+        "interval": interval,
+        "start": start_time,
+        "end": end_time,
+        "limit": limit,
+    }
+    response = client.get(url, params=params)
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Error fetching Bybit klines: {response.status_code}, {response.text}"
+        )
+    json = response.json()
+    if json["retCode"] != 0:
+        raise RuntimeError(f"Error fetching Bybit klines: {json['retMsg']}")
+    return json["result"]["list"]
+
+
+# ByBitから期間内のローソク足を新しい方から遡ってすべて取得する関数
+# 返り値は列名ごとの配列 (timestamp昇順)
+def get_bybit_klines_history(
+    client, category, symbol, interval, start_time, end_time, limit=1000
+):
+    l_rows = []
+    end = end_time
+    while end >= start_time:
+        rows = get_bybit_klines_page(
+            client, category, symbol, interval, start_time, end, limit
+        )
+        if not rows:
+            break
+        l_rows.extend(rows)
+        oldest = min(int(row[0]) for row in rows)
+        if len(rows) < limit or oldest <= start_time:
+            break
+        end = oldest - 1
+
+    values = np.array(l_rows, dtype=np.float64).reshape(-1, 7)
+    timestamps, index = np.unique(values[:, 0].astype(np.int64), return_index=True)
+    values = values[index]
+    return {
+        "timestamp": timestamps,
+        "open": values[:, 1],
+        "high": values[:, 2],
+        "low": values[:, 3],
+        "close": values[:, 4],
+        "volume": values[:, 5],
+        "turnover": values[:, 6],
+    }
+
+
+# ローソク足の時系列を間隔ごとに保存するストア
+class KlineStore(SeriesStore):
+    def __init__(self, root):
+        super().__init__(root, KLINE_SCHEMA, "interval")
+
+
+# 渡したsymbolリストのすべてのローソク足を並列に差分取得してストアに追記する関数
+# 取得する期間の開始・終了は足の区切りに切り下げる (同じ足の中の再実行は同じリクエストになり、
+# レスポンスのキャッシュを使い回せる。終了を切り下げても最新の足の開始時刻は含まれる)
+def backfill_klines(
+    client,
+    store,
+    l_symbols,
+    interval,
+    start_time,
+    end_time=None,
+    category="linear",
+    max_workers=16,
+):
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval}")
+    if end_time is None:
+        end_time = int(time.time() * 1000)
+
+    step = INTERVALS[interval]
+
+    def fetch(symbol, interval, start, end):
+        return get_bybit_klines_history(
+            client, category, symbol, interval, start - start % step, end - end % step
+        )
+
+    return backfill_series(
+        store,
+        fetch,
+        l_symbols,
+        {interval: INTERVALS[interval]},
+        start_time,
+        end_time,
+        max_workers=max_workers,
+        desc="Fetching klines from ByBit",
+    )[interval]
+
+
+# 時系列のdfから symbol × 時刻 の行列を作る関数 (欠けている足はNaN)
+def build_matrix(df, columns):
+    symbol_index, symbols = pd.factorize(df["symbol"], sort=True)
+    time_index, timestamps = pd.factorize(df["timestamp"], sort=True)
+    symbols = np.asarray(symbols, dtype=object)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    matrices = {}
+    for column in columns:
+        matrix = np.full((len(symbols), len(timestamps)), np.nan)
+        matrix[symbol_index, time_index] = df[column].to_numpy(np.float64)
+        matrices[column] = matrix
+    return symbols, timestamps, matrices
+
+
+# 行ごとに欠損値を直前の値で埋める関数
+def forward_fill(matrix):
+    index = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return matrix[np.arange(matrix.shape[0])[:, None], index]
+
+
+# 行ごとの最大値・最小値とその位置を求める関数 (すべて欠損の行はNaN、位置は0)
+def nan_extreme(matrix, func):
+    fill = -np.inf if func is np.argmax else np.inf
+    filled = np.where(np.isnan(matrix), fill, matrix)
+    index = func(filled, axis=1)
+    value = filled[np.arange(matrix.shape[0]), index]
+    return np.where(np.isinf(value), np.nan, value), index
+
+
+# ローソク足から複数期間の価格変化率、ATH/ATL、ドローダウンを行列演算でまとめて計算する関数
+# ATH/ATLは取得済みの期間の中での値 (上場来ではない)
+# interval: ローソク足の間隔 (INTERVALSのキー、変化率の基準の足を選ぶのに使う)
+def compute_kline_metrics(df, interval, horizons=None, tz="Asia/Tokyo"):
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval}")
+    if horizons is None:
+        horizons = PRICE_CHANGE_HORIZONS
+    symbols, timestamps, m = build_matrix(df, ["high", "low", "close"])
+    close = forward_fill(m["close"])
+    rows = np.arange(len(symbols))
+
+    # 最新の終値とその時刻
+    has_close = ~np.isnan(m["close"])
+    last = close.shape[1] - 1 - np.argmax(has_close[:, ::-1], axis=1)
+    current = close[rows, last]
+    last_time = timestamps[last]
+
+    result = {"symbol": symbols, "currentPrice": current}
+    # 最新の時刻からhorizonだけ前の終値との変化率
+    # 時刻は足の開始時刻のため、最新の時刻からhorizonだけ前に終わる足 (1本分前に始まる足) の終値と比べる
+    # (最新の足は形成中で、その終値は最新の時刻から足1本分までの間の価格)
+    for name, horizon in horizons.items():
+        start = last_time - horizon - INTERVALS[interval]
+        index = np.searchsorted(timestamps, start, side="right") - 1
+        past = close[rows, np.clip(index, 0, None)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = current / past - 1
+        result[name] = np.where(index >= 0, change, np.nan)
+
+    ath, ath_index = nan_extreme(m["high"], np.argmax)
+    atl, atl_index = nan_extreme(m["low"], np.argmin)
+    # 終値の高値更新からの下落率 (最大ドローダウンと現在のドローダウン)
+    running_max = np.fmax.accumulate(m["close"], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["ath"] = ath
+        result["athChg%"] = current / ath - 1
+        result["athDate"] = timestamps[ath_index]
+        result["atl"] = atl
+        result["atlChg%"] = current / atl - 1
+        result["atlDate"] = timestamps[atl_index]
+        drawdown = m["close"] / running_max - 1
+        result["maxDrawdown"] = nan_extreme(drawdown, np.argmin)[0]
+        result["drawdown"] = current / running_max[rows, -1] - 1
+    result["klineUpdateTime"] = last_time
+
+    df_metrics = pd.DataFrame(result)
+    for col in ["athDate", "atlDate", "klineUpdateTime"]:
+        df_metrics[col] = pd.to_datetime(df_metrics[col], unit="ms", utc=True)
+        df_metrics[col] = df_metrics[col].dt.tz_convert(tz)
+    return df_metrics
@@ -0,0 +1,294 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# HTTPリクエストの応答時間[s]のヒストグラムのバケットの上限
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Prometheusのメトリクス名の接頭辞
+METRIC_PREFIX = "cryptolens"
+
+
+# プロセスの最大メモリ使用量[bytes] (取得できない環境ではNone)
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Prometheusのhistogramと同じ形 (上限ごとの累積の件数、合計、件数) で値を集計するクラス
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {
+            "buckets": {str(upper): n for upper, n in zip(self.buckets, self.counts)},
+            "sum": round(self.sum, 6),
+            "count": self.count,
+        }
+
+
+# 1回の実行の計測値を集めるクラス (スレッドセーフ)
+# - 処理段階 (stage) ごとの経過時間・CPU時間 (プロセス全体)・終了時のプロセスの最大メモリ使用量
+# - エンドポイントごとのHTTPリクエストの応答時間のヒストグラム・受信バイト数・ステータスコードごとの件数
+# - ホストごとのレート制限・リトライの待機時間
+# - 処理段階ごとのDataFrameのメモリ使用量の最大値、エラーの件数
+# JSONのレポートとPrometheusのtextfile (node_exporterのtextfile collector用) に出力する
+class RunMetrics:
+    def __init__(self, name="refresh"):
+        self.name = name
+        self.started = datetime.now().astimezone()
+        self.stages = {}
+        self.requests = defaultdict(
+            lambda: {"latency": Histogram(), "bytes": 0, "status": defaultdict(int)}
+        )
+        self.sleeps = defaultdict(float)
+        self.frames = {}
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    # 処理段階の経過時間とCPU時間を計測する (同じ名前の段階は合計する、例外はエラーとして数えて送出する)
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield self
+        except Exception:
+            self.count_error(name)
+            raise
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self._lock:
+                stage = self.stages.setdefault(
+                    name, {"wallSeconds": 0.0, "cpuSeconds": 0.0, "runs": 0}
+                )
+                stage["wallSeconds"] += wall
+                stage["cpuSeconds"] += cpu
+                stage["runs"] += 1
+                stage["peakRssBytes"] = peak_rss_bytes()
+
+    # HTTPリクエスト1回 (リトライは別の1回) の応答時間・受信バイト数・ステータスコードを記録する
+    def observe_request(self, endpoint, seconds, n_bytes, status):
+        with self._lock:
+            request = self.requests[endpoint]
+            request["latency"].observe(seconds)
+            request["bytes"] += n_bytes
+            request["status"][str(status)] += 1
+
+    # レート制限 (reason="rate_limit") やリトライ (reason="backoff") で待機した秒数を記録する
+    def observe_sleep(self, host, seconds, reason="rate_limit"):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.sleeps[(host, reason)] += seconds
+
+    # 処理段階で作ったDataFrameのメモリ使用量 (リストなどのオブジェクトの中身を含む) の最大値を記録する
+    def observe_frame(self, name, df):
+        n_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            self.frames[name] = max(self.frames.get(name, 0), n_bytes)
+
+    def count_error(self, source, n=1):
+        with self._lock:
+            self.errors[source] += n
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "started": self.started.isoformat(),
+                "seconds": round(
+                    (datetime.now().astimezone() - self.started).total_seconds(), 3
+                ),
+                "peakRssBytes": peak_rss_bytes(),
+                "stages": {
+                    name: {
+                        **stage,
+                        "wallSeconds": round(stage["wallSeconds"], 6),
+                        "cpuSeconds": round(stage["cpuSeconds"], 6),
+                    }
+                    for name, stage in self.stages.items()
+                },
+                "http": {
+                    endpoint: {
+                        "latency": request["latency"].to_dict(),
+                        "bytes": request["bytes"],
+                        "status": dict(request["status"]),
+                    }
+                    for endpoint, request in sorted(self.requests.items())
+                },
+                "sleepSeconds": {
+                    f"{host} {reason}": round(seconds, 6)
+                    for (host, reason), seconds in sorted(self.sleeps.items())
+                },
+                "framePeakBytes": dict(self.frames),
+                "errors": dict(self.errors),
+            }
+
+    # 処理段階ごとの時間を表示する関数
+    def print_summary(self):
+        for name, stage in self.to_dict()["stages"].items():
+            print(
+                f"Stage {name}: wall={stage['wallSeconds']:.2f}s, cpu={stage['cpuSeconds']:.2f}s"
+            )
+
+    # JSONのレポートに保存する関数
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # Prometheusのテキスト形式の行を作る関数
+    def to_prometheus(self):
+        report = self.to_dict()
+        lines = []
+
+        def metric(name, kind, help, samples):
+            name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join(
+                    f'{key}="{escape_label(val)}"' for key, val in labels.items()
+                )
+                label_text = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"{name}{suffix}{label_text} {value}")
+
+        run = {"run": self.name}
+        metric(
+            "last_run_timestamp_seconds",
+            "gauge",
+            "Start time of the last run.",
+            [("", run, self.started.timestamp())],
+        )
+        metric(
+            "run_seconds",
+            "gauge",
+            "Wall time of the last run.",
+            [("", run, report["seconds"])],
+        )
+        metric(
+            "peak_rss_bytes",
+            "gauge",
+            "Peak resident memory of the process.",
+            [("", run, report["peakRssBytes"])],
+        )
+        stages = report["stages"].items()
+        metric(
+            "stage_wall_seconds",
+            "gauge",
+            "Wall time spent in each stage.",
+            [("", {**run, "stage": name}, s["wallSeconds"]) for name, s in stages],
+        )
+        metric(
+            "stage_cpu_seconds",
+            "gauge",
+            "Process CPU time spent in each stage.",
+            [("", {**run, "stage": name}, s["cpuSeconds"]) for name, s in stages],
+        )
+        samples = []
+        for endpoint, request in report["http"].items():
+            labels = {**run, "endpoint": endpoint}
+            latency = request["latency"]
+            for upper, n in latency["buckets"].items():
+                samples.append(("_bucket", {**labels, "le": upper}, n))
+            samples.append(("_bucket", {**labels, "le": "+Inf"}, latency["count"]))
+            samples.append(("_sum", labels, latency["sum"]))
+            samples.append(("_count", labels, latency["count"]))
+        metric(
+            "http_request_duration_seconds",
+            "histogram",
+            "Latency of HTTP requests per endpoint.",
+            samples,
+        )
+        metric(
+            "http_response_bytes_total",
+            "counter",
+            "Bytes downloaded per endpoint.",
+            [
+                ("", {**run, "endpoint": endpoint}, request["bytes"])
+                for endpoint, request in report["http"].items()
+            ],
+        )
+        metric(
+            "http_responses_total",
+            "counter",
+            "HTTP responses per endpoint and status code.",
+            [
+                ("", {**run, "endpoint": endpoint, "status": status}, n)
+                for endpoint, request in report["http"].items()
+                for status, n in request["status"].items()
+            ],
+        )
+        with self._lock:
+            sleeps = sorted(self.sleeps.items())
+        metric(
+            "sleep_seconds_total",
+            "counter",
+            "Time spent waiting on rate limits and retry backoff.",
+            [
+                ("", {**run, "host": host, "reason": reason}, round(seconds, 6))
+                for (host, reason), seconds in sleeps
+            ],
+        )
+        metric(
+            "frame_peak_bytes",
+            "gauge",
+            "Peak memory of the DataFrames built in each stage.",
+            [
+                ("", {**run, "frame": name}, n)
+                for name, n in report["framePeakBytes"].items()
+            ],
+        )
+        metric(
+            "errors_total",
+            "counter",
+            "Errors per stage or endpoint.",
+            [
+                ("", {**run, "source": source}, n)
+                for source, n in report["errors"].items()
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    # Prometheusのtextfileに出力する関数 (node_exporterが書き込み途中のファイルを読まないよう置き換える)
+    def write_prometheus(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+# Prometheusのラベルの値をエスケープする関数
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,214 @@
+import inspect
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+
+# 出力する仮想通貨データの列
+COIN_COLUMNS = [
+    "symbol",
+    "coin",
+    "coinId",
+    "coinName",
+    "categories",
+    "coinPlatforms",
+    "coinCap",
+    "coinCapChg%24h",
+    "coinLaunchTime",
+    "watchlistUsers",
+    "xFollowers",
+    "sentimentVotesUp%",
+    "buyRatio",
+    "ratioUpdateTime",
+    "currentPrice",
+    "ath",
+    "athChg%",
+    "athDate",
+    "atl",
+    "atlChg%",
+    "atlDate",
+    "priceChg%1h",
+    "priceChg%24h",
+    "priceChg%7d",
+    "priceChg%14d",
+    "priceChg%30d",
+    "priceChg%60d",
+    "priceChg%200d",
+    "coinUpdateTime",
+]
+
+# 出力するカテゴリデータの列
+CATEGORY_COLUMNS = [
+    "categoryId",
+    "categoryName",
+    "categoryCap",
+    "categoryVol24h",
+    "categoryUpdateTime",
+]
+
+# 外部結合の結果のどちらにあるかを示す列の値 (pandasのindicatorと同じ順序)
+MERGE_INDICATOR = ["left_only", "right_only", "both"]
+
+# 左結合で左側の行順を保つための引数 (polars 0.20の左結合は常に左側の行順を保ち、
+# 1.x以降では行順を保つかどうかをmaintain_orderで指定する)
+if "maintain_order" in inspect.signature(pl.LazyFrame.join).parameters:
+    KEEP_LEFT_ORDER = {"maintain_order": "left"}
+else:
+    KEEP_LEFT_ORDER = {}
+
+
+# 時価総額のある仮想通貨を時価総額の降順に並べ、必要な列のうち欠損のない行を抽出する関数 (pandas)
+def clean_coins_pandas(df_coins):
+    df_coins = df_coins.dropna(subset=["coinCap"])
+    df_coins = df_coins[df_coins["coinCap"] > 0]
+    df_coins = df_coins.sort_values(
+        by=["coinCap"], ascending=[False], kind="stable"
+    ).reset_index(drop=True)
+    df_coins = df_coins[COIN_COLUMNS]
+    df_coins = df_coins.dropna()
+    df_coins = df_coins[df_coins["xFollowers"] > 0]
+    return df_coins[df_coins["atl"] > 0].reset_index(drop=True)
+
+
+# 時価総額のあるカテゴリを時価総額の降順に並べ、欠損のない行を抽出する関数 (pandas)
+def clean_categories_pandas(df_categories):
+    df_categories = df_categories.dropna(subset=["categoryCap"])
+    df_categories = df_categories[df_categories["categoryCap"] > 0]
+    df_categories = df_categories.sort_values(
+        by=["categoryCap"], ascending=[False], kind="stable"
+    ).reset_index(drop=True)
+    df_categories = df_categories[CATEGORY_COLUMNS]
+    return df_categories.dropna().reset_index(drop=True)
+
+
+# 仮想通貨をカテゴリごとの行に展開し、カテゴリデータと外部結合する関数 (pandas)
+def explode_categories_pandas(df_coins, df_categories):
+    df_coins_exploded = df_coins.explode("categories")
+    df_coins_exploded = df_coins_exploded.dropna(subset=["categories"]).reset_index(
+        drop=True
+    )
+    df_coins_exploded = df_coins_exploded.rename(columns={"categories": "categoryName"})
+    return pd.merge(
+        df_coins_exploded,
+        df_categories,
+        on=["categoryName"],
+        how="outer",
+        indicator=True,
+    )
+
+
+# clean_coins_pandasと同じ処理のLazyFrame版
+# 浮動小数点のNaNはpandasの欠損値と同じ扱いにするためnullに置き換える
+# 行ごとの抽出を先に済ませてから並べ替える (安定ソートなので結果は同じで、並べ替える行が減る)
+def clean_coins_lazy(lf_coins):
+    return (
+        lf_coins.select(COIN_COLUMNS)
+        .fill_nan(None)
+        .drop_nulls()
+        .filter(
+            (pl.col("coinCap") > 0) & (pl.col("xFollowers") > 0) & (pl.col("atl") > 0)
+        )
+        .sort("coinCap", descending=True, maintain_order=True)
+    )
+
+
+# clean_categories_pandasと同じ処理のLazyFrame版
+def clean_categories_lazy(lf_categories):
+    return (
+        lf_categories.select(CATEGORY_COLUMNS)
+        .fill_nan(None)
+        .drop_nulls()
+        .filter(pl.col("categoryCap") > 0)
+        .sort("categoryCap", descending=True, maintain_order=True)
+    )
+
+
+# explode_categories_pandasと同じ処理のLazyFrame版
+# pandasの外部結合に合わせて、キーの昇順・同じキーの中では左右の元の行順に並べる
+# 結合と並べ替えはキーと行番号だけの細い表で行い、最後に残りの列を行番号で結合する
+# (polars 0.20と1.x以降の両方で動くように、外部結合は左結合と右側だけの行 (anti結合) を連結して作り、
+#  列名はLazyFrameからではなく引数の列名のリストから求める)
+def explode_categories_lazy(
+    lf_coins,
+    lf_categories,
+    coin_columns=COIN_COLUMNS,
+    category_columns=CATEGORY_COLUMNS,
+):
+    lf_coins = lf_coins.with_row_index("_left")
+    lf_categories = lf_categories.with_row_index("_right")
+    lf_left = (
+        lf_coins.select(["_left", "categories"])
+        .explode("categories")
+        .filter(pl.col("categories").is_not_null())
+        .rename({"categories": "categoryName"})
+    )
+    lf_right = lf_categories.select(["_right", "categoryName"])
+    lf_keys = pl.concat(
+        [
+            lf_left.join(lf_right, on="categoryName", how="left", coalesce=True),
+            lf_right.join(lf_left, on="categoryName", how="anti"),
+        ],
+        how="diagonal",
+    ).sort(["categoryName", "_left", "_right"], nulls_last=True)
+    merge = (
+        pl.when(pl.col("_left").is_null())
+        .then(pl.lit("right_only"))
+        .when(pl.col("_right").is_null())
+        .then(pl.lit("left_only"))
+        .otherwise(pl.lit("both"))
+    )
+    l_columns = ["categoryName" if col == "categories" else col for col in coin_columns]
+    l_columns += [col for col in category_columns if col != "categoryName"]
+    return (
+        lf_keys.join(
+            lf_coins.drop("categories"),
+            on="_left",
+            how="left",
+            coalesce=True,
+            **KEEP_LEFT_ORDER,
+        )
+        .join(
+            lf_categories.drop("categoryName"),
+            on="_right",
+            how="left",
+            coalesce=True,
+            **KEEP_LEFT_ORDER,
+        )
+        .with_columns(merge.cast(pl.Enum(MERGE_INDICATOR)).alias("_merge"))
+        .select(l_columns + ["_merge"])
+    )
+
+
+# pandasのdfをArrowを経由してLazyFrameにする関数 (必要な列だけを変換する)
+def to_lazy(df, columns):
+    table = pa.Table.from_pandas(df[columns], preserve_index=False)
+    return pl.from_arrow(table).lazy()
+
+
+# 抽出・列選択・展開・結合の処理をまとめて実行する関数
+# engine="polars" の場合はLazyFrameで処理を組み立て、最適化してからマルチスレッドで一度に実行する
+# 返り値は (df_coins, df_categories, df_coins_exploded) (explode=Falseの場合df_coins_explodedはNone)
+def run_pipeline(df_coins, df_categories, engine="pandas", explode=True):
+    if engine == "pandas":
+        df_coins = clean_coins_pandas(df_coins)
+        df_categories = clean_categories_pandas(df_categories)
+        if not explode:
+            return df_coins, df_categories, None
+        return (
+            df_coins,
+            df_categories,
+            explode_categories_pandas(df_coins, df_categories),
+        )
+    if engine != "polars":
+        raise ValueError(f"Unknown engine: {engine}")
+
+    lf_coins = clean_coins_lazy(to_lazy(df_coins, COIN_COLUMNS))
+    lf_categories = clean_categories_lazy(to_lazy(df_categories, CATEGORY_COLUMNS))
+    l_lazy = [lf_coins, lf_categories]
+    if explode:
+        l_lazy.append(explode_categories_lazy(lf_coins, lf_categories))
+    # 共通する部分の処理は1回だけ実行される
+    results = [result.to_pandas() for result in pl.collect_all(l_lazy)]
+    if not explode:
+        results.append(None)
+    return tuple(results)
@@ -0,0 +1,99 @@
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# FileTokenBucketのファイルの内容 (残りのトークン数, 補充した時刻[s])
+STATE = struct.Struct("<dd")
+
+
+# トークンバケット方式でリクエスト頻度を制限するクラス (スレッドセーフ)
+# capacity: period秒あたりに許可するリクエスト数 (バーストの上限も兼ねる)
+class TokenBucket:
+    def __init__(self, capacity, period=1.0):
+        if capacity <= 0 or period <= 0:
+            raise ValueError("capacity and period must be positive")
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # 経過時間に応じてトークンを補充する (ロック取得済みで呼ぶ)
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    # トークンを取得できるまで待機し、待機した秒数を返す
+    def acquire(self, tokens=1):
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+# 複数のプロセスで1つの上限を共有するトークンバケット (POSIXのファイルロックを使う)
+# 残りのトークン数と補充した時刻 (UNIX時間) をpathのファイルに保存し、fcntl.flockで排他して更新する
+# 同じpathを使うプロセス・スレッドの合計がperiod秒あたりcapacity回を超えない
+class FileTokenBucket:
+    def __init__(self, path, capacity, period=1.0):
+        if fcntl is None:
+            raise RuntimeError("FileTokenBucket requires fcntl (POSIX only)")
+        if capacity <= 0 or period <= 0:
+            raise ValueError("capacity and period must be positive")
+        self.path = path
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+
+    # ファイルをロックしてトークンを補充し、取得できれば減らす
+    # 返り値は取得できるまでに待つ必要がある秒数 (取得できた場合は0)
+    def _try_acquire(self, tokens):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                data = os.pread(self._fd, STATE.size, 0)
+                now = time.time()
+                if len(data) == STATE.size:
+                    available, updated = STATE.unpack(data)
+                    available = min(
+                        self.capacity, available + max(now - updated, 0) * self.rate
+                    )
+                else:
+                    available = self.capacity
+                if available >= tokens:
+                    os.pwrite(self._fd, STATE.pack(available - tokens, now), 0)
+                    return 0.0
+                os.pwrite(self._fd, STATE.pack(available, now), 0)
+                return (tokens - available) / self.rate
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # トークンを取得できるまで待機し、待機した秒数を返す
+    def acquire(self, tokens=1):
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def close(self):
+        os.close(self._fd)
@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from cryptolens.series import SeriesStore, backfill_series
+
+# ByBitの売買比率の期間と1期間の長さ[ms]
+PERIODS = {
+    "5min": 5 * 60 * 1000,
+    "15min": 15 * 60 * 1000,
+    "30min": 30 * 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "4h": 4 * 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000,
+}
+
+# 売買比率の時系列のスキーマ (symbolは辞書エンコード、比率はfloat32、時刻はUNIXタイムスタンプ[ms])
+RATIO_SCHEMA = pa.schema(
+    [
+        ("symbol", pa.dictionary(pa.int32(), pa.string())),
+        ("timestamp", pa.int64()),
+        ("buyRatio", pa.float32()),
+    ]
+)
+
+
+# ByBitから売買比率を1ページ取得する関数 (レコードのリストと次ページのカーソルを返す)
+def get_bybit_long_short_ratio_page(
+    client,
+    category,
+    symbol,
+    period,
+    start_time=None,
+    end_time=None,
+    cursor=None,
+    limit=500,
+):
+    url = "https://api.bybit.com/v5/market/account-ratio"
+    params = {
+        "category": category,
+        "symbol": symbol,
+        "period": period,
+        "limit": limit,
+    }
+    if start_time is not None:
+        params["startTime"] = start_time
+    if end_time is not None:
+        params["endTime"] = end_time
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get(url, params=params)
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Error fetching Bybit long short ratio: {response.status_code}, {response.text}"
+        )
+    json = response.json()
+    if json["retCode"] != 0:
+        raise RuntimeError(f"Error fetching Bybit long short ratio: {json['retMsg']}")
+    return json["result"]["list"], json["result"].get("nextPageCursor")
+
+
+# ByBitから期間内の売買比率をカーソルでページングしてすべて取得する関数
+# 返り値は列名ごとの配列 (timestamp昇順のint64とfloat32)
+def get_bybit_long_short_ratio_history(
+    client, category, symbol, period, start_time, end_time
+):
+    l_timestamps = []
+    l_ratios = []
+    cursor = None
+    while True:
+        records, cursor = get_bybit_long_short_ratio_page(
+            client, category, symbol, period, start_time, end_time, cursor
+        )
+        for record in records:
+            l_timestamps.append(int(record["timestamp"]))
+            l_ratios.append(float(record["buyRatio"]))
+        if not records or not cursor:
+            break
+    timestamps = np.array(l_timestamps, dtype=np.int64)
+    ratios = np.array(l_ratios, dtype=np.float32)
+    # 重複を除いて昇順に並べる
+    timestamps, index = np.unique(timestamps, return_index=True)
+    return {"timestamp": timestamps, "buyRatio": ratios[index]}
+
+
+# 売買比率の時系列を期間ごとに保存するストア
+class RatioHistory(SeriesStore):
+    def __init__(self, root):
+        super().__init__(root, RATIO_SCHEMA, "period")
+
+
+# 渡したsymbolリスト・期間のすべての売買比率の時系列を取得してストアに追記する関数
+# 保存済みのsymbolは最新のtimestampから (その期間を取得し直す)、未保存のsymbolはstart_timeから取得する
+# 取得する期間の開始・終了は期間の区切りに切り下げる (同じ期間の中の再実行は同じリクエストになり、
+# レスポンスのキャッシュを使い回せる。終了を切り下げても最新の期間の開始時刻は含まれる)
+def backfill_ratios(
+    client,
+    history,
+    l_symbols,
+    periods,
+    start_time,
+    end_time=None,
+    category="linear",
+    max_workers=16,
+):
+    if end_time is None:
+        end_time = int(time.time() * 1000)
+    for period in periods:
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+
+    def fetch(symbol, period, start, end):
+        step = PERIODS[period]
+        return get_bybit_long_short_ratio_history(
+            client, category, symbol, period, start - start % step, end - end % step
+        )
+
+    return backfill_series(
+        history,
+        fetch,
+        l_symbols,
+        {period: PERIODS[period] for period in periods},
+        start_time,
+        end_time,
+        max_workers=max_workers,
+        desc="Backfilling long-short ratios from ByBit",
+    )
@@ -0,0 +1,152 @@
+import codecs
+from collections import namedtuple
+from json import JSONDecodeError, JSONDecoder
+
+import pandas as pd
+
+# 列の定義
+# name: 列名, path: JSONのキーのパス, kind: 型, tz: タイムゾーン, scale: 倍率
+# kind: "str" (前後スペース除去), "float", "datetime" (ISO形式の文字列),
+#       "epoch_ms" (UNIXタイムスタンプ[ms]), "list" (空要素除去・前後スペース除去),
+#       "keys" (辞書のキーのリスト、listと同じ整形をする)
+Field = namedtuple(
+    "Field", ["name", "path", "kind", "tz", "scale"], defaults=["float", None, None]
+)
+
+
+# JSONのキーから値を取得する関数 (キーがない場合デフォルト値を返す)
+def get_nested_value(json, keys, default=None):
+    for key in keys:
+        json = json.get(key, default)
+        if json is None:
+            return default
+    return json
+
+
+# リストの空要素を除去し、各要素の前後スペースを削除する関数
+def clean_list(lst):
+    return [s.strip() for s in lst if s]
+
+
+# JSONの配列をチャンク (bytesまたはstr) ごとに読み、要素を1件ずつ返すジェネレータ
+# 配列全体をPythonのオブジェクトにしないため、大きなレスポンスでも要素1件分のメモリで済む
+# 配列の後のチャンクも最後まで読む (空白以外があればエラー。ストリーミングの本文をキャッシュに書き終えるため)
+def iter_json_array(chunks):
+    decoder = JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = False
+    chunks = iter(chunks)
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                check_trailing(buffer[pos + 1 :], chunks, text_decoder)
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except JSONDecodeError:
+                # 要素の途中でチャンクが終わっている
+                break
+            # 数値の途中でチャンクが終わっている可能性があるため、後ろに続きがある場合だけ確定する
+            if end >= len(buffer):
+                break
+            yield value
+            pos = end
+    raise ValueError("Unexpected end of JSON array")
+
+
+# JSONの配列の後に残りのチャンクを読み、空白以外があればエラーにする関数
+def check_trailing(rest, chunks, text_decoder):
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk)
+        rest += chunk
+        if rest.strip():
+            break
+        rest = ""
+    if rest.strip():
+        raise ValueError("Extra data after JSON array")
+
+
+# 列の定義に従ってJSONのレコードを列ごとのリストに溜め、最後に1回だけDataFrameを作るクラス
+# 1行ずつDataFrameを作ってconcatするのと違い、件数に対して線形の時間・メモリで済む
+class ColumnarBuilder:
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self._columns = {field.name: [] for field in self.fields}
+
+    def __len__(self):
+        return len(self._columns[self.fields[0].name]) if self.fields else 0
+
+    # 1件のJSONから各列の値を取り出した辞書を返す (型変換前の値なのでJSONにして保存できる)
+    def extract(self, json):
+        row = {}
+        for field in self.fields:
+            value = get_nested_value(json, field.path)
+            if field.kind == "str":
+                value = value.strip() if isinstance(value, str) else value
+            elif field.kind == "list":
+                value = clean_list(value) if value else []
+            elif field.kind == "keys":
+                value = clean_list(value.keys()) if value else []
+            row[field.name] = value
+        return row
+
+    # extractで取り出した1件の値を追加する
+    def append_row(self, row):
+        for field in self.fields:
+            self._columns[field.name].append(row.get(field.name))
+
+    # 1件のJSONから各列の値を取り出して追加する
+    def append(self, json):
+        self.append_row(self.extract(json))
+
+    # 複数件のJSONを追加する
+    def extend(self, l_json):
+        for json in l_json:
+            self.append(json)
+
+    # 溜めた列を型変換してDataFrameを作る
+    def to_frame(self):
+        data = {}
+        for field in self.fields:
+            data[field.name] = convert_column(self._columns[field.name], field)
+        return pd.DataFrame(data)
+
+
+# 列の定義に従ってリストを型付きのSeriesに変換する関数
+def convert_column(values, field):
+    if field.kind == "float":
+        series = pd.to_numeric(pd.Series(values, dtype=object)).astype("float64")
+        if field.scale is not None:
+            series = series * field.scale
+        return series
+    if field.kind == "datetime":
+        series = pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+        if field.tz is not None:
+            series = series.dt.tz_convert(field.tz)
+        return series.dt.floor("s")
+    if field.kind == "epoch_ms":
+        series = pd.to_numeric(pd.Series(values, dtype=object))
+        series = pd.to_datetime(series, unit="ms", utc=True)
+        if field.tz is not None:
+            series = series.dt.tz_convert(field.tz)
+        return series
+    if field.kind in ("list", "keys"):
+        return pd.Series(values, dtype=object)
+    return pd.Series(values)
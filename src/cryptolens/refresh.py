@@ -0,0 +1,169 @@
+import glob
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from cryptolens.bybit import get_all_ratios, get_bybit_coins_list
+from cryptolens.coingecko import (
+    get_all_info,
+    get_coin_cap_ranks,
+    get_coingecko_categories_list,
+    get_coingecko_coins_list,
+    get_stale_detail_ids,
+)
+from cryptolens.metrics import RunMetrics
+from cryptolens.schema import CATEGORIES_SCHEMA, COINS_SCHEMA, conform
+
+
+# 更新日時の列がTTLより古い (または欠損している) 行のキーのリストを出力する関数
+def get_stale_keys(df, key, column, ttl):
+    now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo"))
+    if column not in df.columns:
+        return list(df[key].unique())
+    mask = df[column].isna() | ((now - df[column]) > ttl)
+    return list(df.loc[mask, key].unique())
+
+
+# カテゴリのfeatherデータの中の更新日時を確認してデータを再取得するかのフラグを出力する関数
+def need_update_category_data(df, ttl):
+    now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo"))
+    latest_update = df["categoryUpdateTime"].max()
+    return (now - latest_update) > ttl
+
+
+# 取得したdfの値でkey列が一致する行の値を上書きする関数 (欠損値では上書きしない)
+def update_by_key(df, df_new, key):
+    df = df.copy()
+    df_new = df_new.drop_duplicates(subset=[key]).set_index(key)
+    for col in df_new.columns:
+        values = df[key].map(df_new[col])
+        if col in df.columns:
+            df[col] = values.where(values.notna(), df[col])
+        else:
+            df[col] = values
+    return df
+
+
+# 仮想通貨データを差分更新する関数
+# ByBitとCoinGeckoの仮想通貨リストから対象を作り直し (新規上場は追加、上場廃止は削除)、
+# 更新日時がTTLより古いものだけ売買比率・市場データ・詳細情報を再取得して既存データにマージする
+# ByBitのsymbolごとのCoinGeckoのidはresolverで1つに決める (同じシンボルの別の仮想通貨の情報を取得しない)
+# metrics: RunMetricsを渡すと処理段階 (fetch_lists, ratios, details, merge) ごとの時間を記録する
+# journal: CrawlJournalを渡すと詳細情報の取得を1件ごとに記録し、中断した後の再実行では記録済みのidを取得しない
+# crawl: 詳細情報を取得する関数 (get_all_infoを参照、複数のプロセス・APIキーでの取得用)
+def refresh_coin_data(
+    client, df_prev, api_key, ttl, resolver, metrics=None, journal=None, crawl=None
+):
+    if metrics is None:
+        metrics = RunMetrics()
+
+    with metrics.stage("fetch_lists"):
+        # ByBitの仮想通貨リストを取得 (無期限先物)
+        df_bybit_coins = get_bybit_coins_list(client, "linear")
+        print(f"ByBit coins df size: {df_bybit_coins.shape}")
+
+        # CoinGeckoの仮想通貨リストを取得
+        df_coingecko_coins = get_coingecko_coins_list(client, api_key)
+        print(f"CoinGecko coins df size: {df_coingecko_coins.shape}")
+        metrics.observe_frame("coingecko_coins_list", df_coingecko_coins)
+
+        # ByBitとCoinGeckoでそれぞれ取得した仮想通貨リストをsymbolごとに1つのidでマージする
+        df = resolver.resolve(
+            df_bybit_coins,
+            df_coingecko_coins,
+            lambda l_ids: get_coin_cap_ranks(client, l_ids, api_key),
+        )
+
+        # 既存データから取得済みの列を引き継ぐ
+        keys = ["symbol", "coinId"]
+        listing_changed = True
+        if not df_prev.empty:
+            l_prev_columns = [col for col in df_prev.columns if col not in df.columns]
+            prev_keys = set(df_prev[keys].itertuples(index=False))
+            current_keys = set(df[keys].itertuples(index=False))
+            listing_changed = prev_keys != current_keys
+            print(
+                f"New coins: {len(current_keys - prev_keys)}, delisted coins: {len(prev_keys - current_keys)}"
+            )
+            df = pd.merge(df, df_prev[keys + l_prev_columns], on=keys, how="left")
+
+    # 売買比率が古いsymbolだけ再取得する
+    with metrics.stage("ratios"):
+        l_stale_symbols = get_stale_keys(df, "symbol", "ratioUpdateTime", ttl["ratio"])
+        print(f"Stale ratios: {len(l_stale_symbols)} / {df['symbol'].nunique()}")
+        df_ratio = None
+        if l_stale_symbols:
+            df_ratio = get_all_ratios(client, l_stale_symbols)
+
+    # 市場データ・詳細情報が古いidだけ再取得する
+    # (/coins/{id}は詳細情報の列が未取得か古いidだけに呼び、市場データは/coins/marketsでまとめて取得する)
+    with metrics.stage("details"):
+        l_stale_market_ids = get_stale_keys(
+            df, "coinId", "marketFetchTime", ttl["market"]
+        )
+        l_stale_detail_ids = get_stale_detail_ids(df, ttl["detail"])
+        print(
+            f"Stale market data: {len(l_stale_market_ids)}, stale details: {len(l_stale_detail_ids)} / {df['coinId'].nunique()}"
+        )
+        l_stale_ids = list(dict.fromkeys(l_stale_market_ids + l_stale_detail_ids))
+        df_info = None
+        if l_stale_ids:
+            df_info = get_all_info(
+                client,
+                l_stale_ids,
+                api_key,
+                detail_ids=l_stale_detail_ids,
+                journal=journal,
+                crawl=crawl,
+            )
+            metrics.observe_frame("coin_info", df_info)
+
+    with metrics.stage("merge"):
+        if df_ratio is not None:
+            df = update_by_key(df, df_ratio, "symbol")
+        if df_info is not None:
+            df = update_by_key(df, df_info, "coinId")
+
+        # 売買比率か詳細情報を取得できなかった仮想通貨は除外する
+        df = df.dropna(subset=["ratioUpdateTime", "coinUpdateTime"]).reset_index(
+            drop=True
+        )
+
+        # Noneを欠損値に置換し、数値・日時の列をスキーマの型にする
+        df = df.replace({None: np.nan})
+        df = conform(df, COINS_SCHEMA)
+        metrics.observe_frame("coins", df)
+
+    updated = bool(l_stale_symbols or l_stale_ids) or listing_changed
+    return df, updated
+
+
+# カテゴリデータを更新する関数 (カテゴリリストは1回の取得で済むため、古ければすべて再取得する)
+def refresh_category_data(client, df_prev, api_key, ttl):
+    if not df_prev.empty and not need_update_category_data(df_prev, ttl["category"]):
+        return df_prev, False
+    # CoinGeckoのカテゴリリストを取得
+    df = get_coingecko_categories_list(client, api_key)
+    if df.empty:
+        return df_prev, False
+    df["categoryId"] = df["categoryId"].str.strip()
+    df["categoryName"] = df["categoryName"].str.strip()
+    df = conform(df, CATEGORIES_SCHEMA)
+    print(f"CoinGecko categories df size: {df.shape}")
+    return df, True
+
+
+# 以前のfeatherファイルのスナップショットがあれば履歴ストアに取り込む関数 (ストアが空のときのみ)
+def import_feather_snapshots(store, data_dir, pattern):
+    if len(store) > 0:
+        return
+    for feather_file_path in sorted(glob.glob(os.path.join(data_dir, pattern))):
+        snapshot = os.path.basename(feather_file_path).rsplit("_", 1)[1][:12]
+        snapshot_time = datetime.strptime(snapshot, "%Y%m%d%H%M").replace(
+            tzinfo=ZoneInfo("Asia/Tokyo")
+        )
+        store.append(pd.read_feather(feather_file_path), snapshot_time)
+        print(f'Imported "{os.path.basename(feather_file_path)}" into history store')
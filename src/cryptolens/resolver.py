@@ -0,0 +1,171 @@
+import json
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+# ByBitの通貨名の先頭または末尾に付く倍率の数値 (10, 100, 1000, ...)
+# 例: 1000PEPE, 10000SATS, SHIB1000 (1INCHのように0が続かないものは倍率ではない)
+MULTIPLIER_PATTERN = r"^(?P<prefix>10+)(?=\D)|(?<=\D)(?P<suffix>10+)$"
+
+# ブリッジ・ラップ・ペッグされたトークンの名前 (同じシンボルの本来の仮想通貨より優先しない)
+DERIVATIVE_PATTERN = r"(?i)\b(?:bridged|wrapped|peg|pegged|wormhole)\b"
+
+
+# ByBitの通貨名から倍率の数値を除いて小文字にし、倍率と合わせて返す関数 (文字列の列に対してまとめて処理する)
+def normalize_base_coins(base_coins):
+    base_coins = base_coins.str.strip()
+    extracted = base_coins.str.extract(MULTIPLIER_PATTERN)
+    multipliers = extracted["prefix"].fillna(extracted["suffix"])
+    coins = base_coins.str.replace(MULTIPLIER_PATTERN, "", regex=True).str.lower()
+    multipliers = pd.to_numeric(multipliers).fillna(1).astype(np.int64)
+    return coins, multipliers
+
+
+# ByBitのsymbolごとに、同じシンボルのCoinGeckoのidの候補から1つを決めるクラス
+# 優先順位: 手動の指定 > 候補が1つだけ > 候補が変わらず有効期間内の前回の結果 > 候補のスコア
+# スコアは時価総額順位 (小さいほど優先)、ブリッジ・ラップされたトークンでないこと、
+# プラットフォームの情報 (チェーン固有の通貨、多くのチェーンにあるトークンほど優先) の順に比べる
+# 結果はバージョン付きのJSONに保存し、変わったsymbolは変更履歴に残す
+class CoinIdResolver:
+    def __init__(self, path, overrides=None, ttl=timedelta(days=7)):
+        self.path = path
+        self.overrides = dict(overrides or {})
+        self.ttl = ttl
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.table = json.load(f)
+        else:
+            self.table = {"version": 0, "updated": None, "mapping": {}, "changes": []}
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.table, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # 候補をスコアの順に並べ、symbolごとに先頭の候補を選ぶ関数
+    @staticmethod
+    def _pick_by_score(df_candidates, df_ranks):
+        df = df_candidates.merge(df_ranks, on="coinId", how="left")
+        text = df["coinId"] + " " + df["coinName"].fillna("")
+        df["_derivative"] = text.str.contains(DERIVATIVE_PATTERN, regex=True)
+        n_platforms = df["coinPlatforms"].map(len)
+        df["_native"] = n_platforms == 0
+        df["_platforms"] = n_platforms
+        df = df.sort_values(
+            ["symbol", "coinCapRank", "_derivative", "_native", "_platforms", "coinId"],
+            ascending=[True, True, True, False, False, True],
+            na_position="last",
+            kind="stable",
+        )
+        return df.drop_duplicates(subset=["symbol"], keep="first")
+
+    # ByBitの仮想通貨リスト (symbol, coin) とCoinGeckoの仮想通貨リスト (coinId, coin, coinName, coinPlatforms) から
+    # symbolごとに1つのidを選んでマージしたdfを返す関数
+    # fetch_ranks(l_ids) は候補のidの時価総額順位のdf (coinId, coinCapRank) を返す
+    # (スコアで選ぶ必要のある候補だけを渡す)
+    def resolve(self, df_bybit, df_coingecko, fetch_ranks):
+        now = datetime.now().astimezone(ZoneInfo("Asia/Tokyo")).replace(microsecond=0)
+        mapping = self.table["mapping"]
+
+        df_candidates = df_bybit[["symbol", "coin"]].merge(
+            df_coingecko, on="coin", how="inner"
+        )
+        candidates = (
+            df_candidates.sort_values("coinId")
+            .groupby("symbol")["coinId"]
+            .agg(",".join)
+            .to_dict()
+        )
+        l_coin_ids = set(df_coingecko["coinId"])
+
+        # シンボルが一致しない仮想通貨も手動の指定があれば対象にする
+        for symbol in df_bybit["symbol"]:
+            if symbol in self.overrides and symbol not in candidates:
+                candidates[symbol] = ""
+
+        chosen = {}
+        sources = {}
+        l_unresolved = []
+        for symbol, candidate_ids in candidates.items():
+            override = self.overrides.get(symbol)
+            entry = mapping.get(symbol)
+            if override is not None and override in l_coin_ids:
+                chosen[symbol], sources[symbol] = override, "override"
+            elif candidate_ids and "," not in candidate_ids:
+                chosen[symbol], sources[symbol] = candidate_ids, "single"
+            elif (
+                entry is not None
+                and entry["candidates"] == candidate_ids
+                and entry["source"] in ("rank", "platform")
+                and now - datetime.fromisoformat(entry["resolvedAt"]) <= self.ttl
+            ):
+                chosen[symbol], sources[symbol] = entry["coinId"], "cache"
+            elif candidate_ids:
+                l_unresolved.append(symbol)
+        # 候補にないidの手動の指定 (CoinGeckoのリストにないid) は無視する
+        for symbol, override in self.overrides.items():
+            if override not in l_coin_ids:
+                print(
+                    f"Warning: override for {symbol} is not a CoinGecko id: {override}"
+                )
+
+        if l_unresolved:
+            df_unresolved = df_candidates[df_candidates["symbol"].isin(l_unresolved)]
+            df_ranks = fetch_ranks(list(df_unresolved["coinId"].unique()))
+            if df_ranks.empty:
+                df_ranks = pd.DataFrame(columns=["coinId", "coinCapRank"])
+            df_ranks = df_ranks[["coinId", "coinCapRank"]].drop_duplicates("coinId")
+            df_picked = self._pick_by_score(df_unresolved, df_ranks)
+            has_rank = df_picked["coinCapRank"].notna()
+            for symbol, coin_id, ranked in zip(
+                df_picked["symbol"], df_picked["coinId"], has_rank
+            ):
+                chosen[symbol] = coin_id
+                sources[symbol] = "rank" if ranked else "platform"
+
+        # 結果が変わったsymbolを変更履歴に残し、バージョンを上げる
+        changes = []
+        for symbol in sorted(set(mapping) | set(chosen)):
+            before = mapping.get(symbol, {}).get("coinId")
+            after = chosen.get(symbol)
+            if before != after:
+                changes.append({"symbol": symbol, "from": before, "to": after})
+        new_mapping = {}
+        for symbol, coin_id in chosen.items():
+            entry = mapping.get(symbol)
+            if sources[symbol] == "cache":
+                new_mapping[symbol] = entry
+            else:
+                new_mapping[symbol] = {
+                    "coinId": coin_id,
+                    "source": sources[symbol],
+                    "candidates": candidates[symbol],
+                    "resolvedAt": now.isoformat(),
+                }
+        if changes:
+            self.table["version"] += 1
+            for change in changes:
+                change["version"] = self.table["version"]
+                change["time"] = now.isoformat()
+            self.table["changes"].extend(changes)
+        self.table["mapping"] = new_mapping
+        self.table["updated"] = now.isoformat()
+        self._write()
+
+        n_ambiguous = sum("," in ids for ids in candidates.values())
+        print(
+            f"Resolved {len(chosen)} symbols ({n_ambiguous} ambiguous, {len(l_unresolved)} scored), "
+            f"mapping version {self.table['version']} ({len(changes)} changes)"
+        )
+
+        df_chosen = pd.DataFrame(
+            {"symbol": list(chosen), "coinId": list(chosen.values())}
+        )
+        df = df_bybit.merge(df_chosen, on="symbol", how="inner")
+        df_coingecko = df_coingecko.drop(columns=["coin"]).drop_duplicates("coinId")
+        return df.merge(df_coingecko, on="coinId", how="left").reset_index(drop=True)
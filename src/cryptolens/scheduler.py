@@ -0,0 +1,348 @@
+import json
+import math
+import os
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from cryptolens import config
+from cryptolens.api import open_stores
+from cryptolens.bybit import get_all_ratios
+from cryptolens.coingecko import (
+    get_all_detail_info,
+    get_all_market_info,
+    get_stale_detail_ids,
+)
+from cryptolens.diff import update_change_feed
+from cryptolens.journal import CrawlJournal
+from cryptolens.metrics import RunMetrics
+from cryptolens.refresh import (
+    refresh_category_data,
+    refresh_coin_data,
+    update_by_key,
+)
+from cryptolens.resolver import CoinIdResolver
+
+# 定期実行するジョブ
+# run(scheduler) は現在のスナップショットから取得を行い、適用する関数 (取得できなければNone) を返す
+# 適用する関数 apply(df_coins, df_categories) は (df_coins, df_categories, 仮想通貨の変更, カテゴリの変更) を返す
+# align=Trueの場合は実行間隔の区切りの時刻 (UTC) に合わせて実行する
+Job = namedtuple(
+    "Job", ["name", "run", "interval", "jitter", "align"], defaults=[False]
+)
+
+# データがない・エラーが起きた場合に再実行するまでの時間
+RETRY_DELAY = timedelta(minutes=1)
+
+# 仮想通貨リストの更新では既存の仮想通貨は再取得しない (新しい仮想通貨の欠損している値だけ取得する)
+LISTING_TTL = {
+    "ratio": timedelta(days=36500),
+    "market": timedelta(days=36500),
+    "detail": timedelta(days=36500),
+}
+
+
+# 変更のないジョブの結果を適用する関数
+def unchanged(df_coins, df_categories):
+    return df_coins, df_categories, False, False
+
+
+# 上場・上場廃止を反映した仮想通貨リストに、現在のスナップショットの値を引き継ぐ関数
+# (取得している間に他のジョブが更新した値を上書きしない)
+def merge_listing(df_current, df_listed, keys=("symbol", "coinId")):
+    keys = list(keys)
+    if df_current.empty:
+        return df_listed
+    df_listed = df_listed.set_index(keys)
+    df_current = df_current.drop_duplicates(subset=keys).set_index(keys)
+    df = df_current.reindex(df_listed.index).combine_first(df_listed)
+    l_columns = list(df_listed.columns) + [
+        col for col in df.columns if col not in df_listed.columns
+    ]
+    return df[l_columns].reset_index()
+
+
+# ByBitの仮想通貨リストを取得し、上場・上場廃止を反映する
+def run_instruments(scheduler):
+    df, updated = refresh_coin_data(
+        scheduler.client,
+        scheduler.df_coins,
+        scheduler.api_key,
+        LISTING_TTL,
+        scheduler.resolver,
+    )
+    if df.empty:
+        return None
+    if not updated:
+        return unchanged
+    return lambda df_coins, df_categories: (
+        merge_listing(df_coins, df),
+        df_categories,
+        True,
+        False,
+    )
+
+
+# 売買比率をすべてのsymbolについて取得する
+def run_ratios(scheduler):
+    df_coins = scheduler.df_coins
+    if df_coins.empty:
+        return None
+    df_ratio = get_all_ratios(scheduler.client, list(df_coins["symbol"].unique()))
+    if df_ratio.empty:
+        return None
+    return lambda df_coins, df_categories: (
+        update_by_key(df_coins, df_ratio, "symbol"),
+        df_categories,
+        True,
+        False,
+    )
+
+
+# CoinGeckoの市場データをすべてのidについて/coins/marketsでまとめて取得する
+def run_markets(scheduler):
+    df_coins = scheduler.df_coins
+    if df_coins.empty:
+        return None
+    df_market = get_all_market_info(
+        scheduler.client, list(df_coins["coinId"].unique()), scheduler.api_key
+    )
+    if df_market.empty:
+        return None
+    return lambda df_coins, df_categories: (
+        update_by_key(df_coins, df_market, "coinId"),
+        df_categories,
+        True,
+        False,
+    )
+
+
+# CoinGeckoの詳細情報が古いidだけ/coins/{id}で取得する (再起動後は記録済みのidを取得しない)
+def run_details(scheduler):
+    df_coins = scheduler.df_coins
+    if df_coins.empty:
+        return None
+    l_stale_ids = get_stale_detail_ids(df_coins, scheduler.ttl["detail"])
+    if not l_stale_ids:
+        return unchanged
+    df_detail = get_all_detail_info(
+        scheduler.client, l_stale_ids, scheduler.api_key, scheduler.detail_journal
+    )
+    if df_detail.empty:
+        return None
+    return lambda df_coins, df_categories: (
+        update_by_key(df_coins, df_detail, "coinId"),
+        df_categories,
+        True,
+        False,
+    )
+
+
+# カテゴリリストを取得する
+def run_categories(scheduler):
+    df, updated = refresh_category_data(
+        scheduler.client,
+        pd.DataFrame(),
+        scheduler.api_key,
+        scheduler.ttl,
+    )
+    if not updated:
+        return None
+    return lambda df_coins, df_categories: (df_coins, df, False, True)
+
+
+# データの種類ごとのジョブを作る関数 (schedule: {名前: (実行間隔, ジッタ)})
+def default_jobs(schedule=config.SCHEDULE):
+    runs = {
+        "instruments": run_instruments,
+        "ratios": run_ratios,
+        "markets": run_markets,
+        "details": run_details,
+        "categories": run_categories,
+    }
+    return [
+        Job(name, runs[name], interval, jitter, align=name == "ratios")
+        for name, (interval, jitter) in schedule.items()
+    ]
+
+
+# データの種類ごとの間隔でジョブを繰り返し実行し、現在のスナップショットを更新し続けるスケジューラ
+# - ジョブは並列に実行し、すべてのジョブで1つのHTTPクライアント (ホストごとのレート制限) を共有する
+# - 実行中のジョブの次の実行時刻が来ても重ねて実行しない (終わってから次の実行時刻を決める)
+# - 取得は現在のスナップショットを読むだけで行い、結果はロックの中で最新のスナップショットに適用して
+#   履歴ストアに追記してから置き換える (途中の状態を他のジョブや読み手に見せない)
+# - ジョブごとの前回・次回の実行時刻は<data_dir>/scheduler.jsonに保存し、再起動後も引き継ぐ
+# - 詳細情報は1件ごとに<data_dir>/detail_journal.jsonlに記録し、再起動後は取得済みのidを取得しない
+#   (ジャーナルはcloseまたはwith文の終わりで閉じる)
+# - 仮想通貨データを追記するたびに前回のスナップショットとの差分を<data_dir>/change_feed.jsonlに追記する
+# - metrics_dirを指定するとジョブが終わるたびに計測値 (ジョブごとの時間など) を出力する
+class Scheduler:
+    def __init__(
+        self,
+        client,
+        api_key,
+        data_dir=config.DATA_DIR,
+        ttl=config.TTL,
+        jobs=None,
+        overrides=None,
+        tz="Asia/Tokyo",
+        metrics=None,
+        metrics_dir=None,
+    ):
+        self.client = client
+        self.metrics = metrics if metrics is not None else RunMetrics("schedule")
+        self.metrics_dir = metrics_dir
+        self.api_key = api_key
+        self.ttl = ttl
+        self.jobs = {job.name: job for job in (jobs or default_jobs())}
+        self.tz = ZoneInfo(tz)
+        self.coins_store, self.categories_store = open_stores(data_dir)
+        self.resolver = CoinIdResolver(
+            os.path.join(data_dir, "coin_id_map.json"),
+            overrides=overrides,
+            ttl=ttl["detail"],
+        )
+        self.detail_journal = CrawlJournal(
+            os.path.join(data_dir, "detail_journal.jsonl"), max_age=ttl["detail"]
+        )
+        self.df_coins = self.coins_store.load_latest()
+        self.df_categories = self.categories_store.load_latest()
+        self.change_feed_path = os.path.join(data_dir, "change_feed.jsonl")
+        self.state_path = os.path.join(data_dir, "scheduler.json")
+        self.state = self._read_state()
+        self._lock = threading.Lock()
+        self._running = set()
+        self._stop = threading.Event()
+
+    def _read_state(self):
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        return {name: state.get(name, {"runs": 0}) for name in self.jobs}
+
+    def _write_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _now(self):
+        return datetime.now().astimezone(self.tz)
+
+    # ジョブの次の実行時刻 (基準の時刻の後の実行間隔の区切り、またはその実行間隔後にジッタを加える)
+    def next_run_time(self, job, after):
+        if job.align:
+            step = job.interval.total_seconds()
+            boundary = (math.floor(after.timestamp() / step) + 1) * step
+            base = datetime.fromtimestamp(boundary, self.tz)
+        else:
+            base = after + job.interval
+        return base + timedelta(seconds=random.uniform(0, job.jitter.total_seconds()))
+
+    # ジョブの次の実行時刻 (一度も実行していなければすぐに実行する)
+    def due_time(self, name):
+        next_run = self.state[name].get("nextRun")
+        if next_run is None:
+            return datetime.fromtimestamp(0, self.tz)
+        return datetime.fromisoformat(next_run)
+
+    # ジョブの結果を最新のスナップショットに適用し、変更があれば履歴ストアに追記してから置き換える
+    def _apply(self, apply):
+        with self._lock:
+            df_coins, df_categories, coins_changed, categories_changed = apply(
+                self.df_coins, self.df_categories
+            )
+            now = self._now()
+            if coins_changed:
+                entry = self.coins_store.append(df_coins, now)
+                print(f'Data saved to "{entry["path"]}" ({entry["rows"]} rows)')
+                update_change_feed(self.coins_store, self.change_feed_path)
+            if categories_changed:
+                entry = self.categories_store.append(df_categories, now)
+                print(f'Data saved to "{entry["path"]}" ({entry["rows"]} rows)')
+            self.df_coins, self.df_categories = df_coins, df_categories
+
+    # ジョブを1回実行する関数 (例外はジョブごとに記録し、スケジューラは止めない)
+    def run_job(self, name):
+        job = self.jobs[name]
+        started = self._now()
+        error = None
+        try:
+            with self.metrics.stage(name):
+                apply = job.run(self)
+                if apply is not None:
+                    self._apply(apply)
+        except Exception as e:
+            apply = None
+            error = str(e)
+            print(f"Error in scheduled job {name}: {e}")
+        finished = self._now()
+        next_run = self.next_run_time(job, finished)
+        if apply is None:
+            next_run = min(next_run, finished + RETRY_DELAY)
+        with self._lock:
+            self.state[name] = {
+                "runs": self.state[name].get("runs", 0) + 1,
+                "lastRun": started.isoformat(),
+                "lastSeconds": round((finished - started).total_seconds(), 3),
+                "lastError": error,
+                "nextRun": next_run.isoformat(),
+            }
+            self._running.discard(name)
+            self._write_state()
+        if self.metrics_dir is not None:
+            self.metrics.save(os.path.join(self.metrics_dir, "run_report.json"))
+            self.metrics.write_prometheus(
+                os.path.join(self.metrics_dir, "cryptolens.prom")
+            )
+        print(f"Job {name} finished, next run at {next_run.replace(microsecond=0)}")
+        return error is None
+
+    # 実行時刻の来たジョブを実行し続ける関数 (durationは実行を続ける秒数、Noneの場合はstopまで)
+    # max_pollは実行時刻を確認する最大の間隔[s]
+    def run(self, duration=None, max_poll=60):
+        deadline = None
+        if duration is not None:
+            deadline = self._now() + timedelta(seconds=duration)
+        self._stop.clear()
+        with ThreadPoolExecutor(max_workers=len(self.jobs)) as executor:
+            while not self._stop.is_set():
+                now = self._now()
+                if deadline is not None and now >= deadline:
+                    break
+                for name in self.jobs:
+                    with self._lock:
+                        if name in self._running or self.due_time(name) > now:
+                            continue
+                        self._running.add(name)
+                    executor.submit(self.run_job, name)
+                with self._lock:
+                    l_waiting = [
+                        self.due_time(name)
+                        for name in self.jobs
+                        if name not in self._running
+                    ]
+                wake = min(l_waiting + [now + timedelta(seconds=max_poll)])
+                if deadline is not None:
+                    wake = min(wake, deadline)
+                self._stop.wait(max((wake - self._now()).total_seconds(), 0.1))
+            # 実行中のジョブは最後まで実行して適用する
+            self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.detail_journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
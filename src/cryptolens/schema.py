@@ -0,0 +1,125 @@
+import pandas as pd
+import pyarrow as pa
+
+# 仮想通貨データとカテゴリデータの列の型 (Arrowのスキーマ)
+# - キー・名前の列は辞書エンコード (同じ値は1回だけ保存する)
+# - 比率・変化率・順位はfloat32 (有効桁数7桁で足りる)、価格・時価総額・人数はfloat64
+# - 日時はタイムゾーン付きのミリ秒、カテゴリ・プラットフォームはlist<string>
+# nullable=Falseの列はデータを作るときに必ずなければならない
+TZ = "Asia/Tokyo"
+KEY = pa.dictionary(pa.int32(), pa.string())
+TIMESTAMP = pa.timestamp("ms", tz=TZ)
+STRINGS = pa.list_(pa.string())
+
+COINS_SCHEMA = pa.schema(
+    [
+        pa.field("symbol", KEY, nullable=False),
+        pa.field("coin", KEY),
+        pa.field("coinLaunchTime", TIMESTAMP),
+        pa.field("coinMultiplier", pa.int32()),
+        pa.field("coinId", KEY, nullable=False),
+        pa.field("coinName", KEY),
+        pa.field("coinPlatforms", STRINGS),
+        pa.field("buyRatio", pa.float32()),
+        pa.field("ratioUpdateTime", TIMESTAMP),
+        pa.field("coinSlug", KEY),
+        pa.field("categories", STRINGS),
+        pa.field("assetPlatformId", KEY),
+        pa.field("platforms", STRINGS),
+        pa.field("facebookLikes", pa.float64()),
+        pa.field("redditSubscribers", pa.float64()),
+        pa.field("telegramUserCount", pa.float64()),
+        pa.field("xFollowers", pa.float64()),
+        pa.field("coinCap", pa.float64()),
+        pa.field("coinCapRank", pa.float32()),
+        pa.field("coinCapFdvRatio", pa.float32()),
+        pa.field("coinCapChg%24h", pa.float32()),
+        pa.field("ath", pa.float64()),
+        pa.field("athChg%", pa.float32()),
+        pa.field("athDate", TIMESTAMP),
+        pa.field("atl", pa.float64()),
+        pa.field("atlChg%", pa.float32()),
+        pa.field("atlDate", TIMESTAMP),
+        pa.field("currentPrice", pa.float64()),
+        pa.field("priceChg%1h", pa.float32()),
+        pa.field("priceChg%24h", pa.float32()),
+        pa.field("priceChg%7d", pa.float32()),
+        pa.field("priceChg%14d", pa.float32()),
+        pa.field("priceChg%30d", pa.float32()),
+        pa.field("priceChg%60d", pa.float32()),
+        pa.field("priceChg%200d", pa.float32()),
+        pa.field("sentimentVotesUp%", pa.float32()),
+        pa.field("watchlistUsers", pa.float64()),
+        pa.field("coinUpdateTime", TIMESTAMP),
+        pa.field("marketFetchTime", TIMESTAMP),
+        pa.field("detailUpdateTime", TIMESTAMP),
+    ]
+)
+
+CATEGORIES_SCHEMA = pa.schema(
+    [
+        pa.field("categoryId", KEY, nullable=False),
+        pa.field("categoryName", KEY),
+        pa.field("categoryCap", pa.float64()),
+        pa.field("categoryCapChg24h", pa.float32()),
+        pa.field("categoryVol24h", pa.float64()),
+        pa.field("categoryUpdateTime", TIMESTAMP),
+    ]
+)
+
+
+# 列をスキーマの型に変換する関数 (辞書エンコードの列は値の型にしてからエンコードし直す)
+# 日時のミリ秒未満と、float32に収まらない桁は切り捨てる
+def cast_column(column, type):
+    if column.type == type:
+        return column
+    if pa.types.is_dictionary(type):
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        column = column.cast(type.value_type, safe=False).dictionary_encode()
+        return column.cast(type)
+    return column.cast(type, safe=False)
+
+
+# テーブルのスキーマにある列をスキーマの型に変換する関数 (スキーマにない列はそのまま残す)
+def cast_table(table, schema):
+    for i, name in enumerate(table.column_names):
+        if name in schema.names:
+            field = schema.field(name)
+            table = table.set_column(i, field, cast_column(table.column(i), field.type))
+    return table
+
+
+# dfをスキーマに従ったArrowのテーブルにする関数
+# nullable=Falseの列がない・欠損している場合と、型に変換できない値がある場合はエラーにする
+def to_table(df, schema):
+    for field in schema:
+        if field.nullable:
+            continue
+        if field.name not in df.columns:
+            raise ValueError(f"Missing required column: {field.name}")
+        if df[field.name].isna().any():
+            raise ValueError(f"Null values in required column: {field.name}")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return cast_table(table, schema)
+
+
+# Arrowのテーブルをdfにする関数 (数値・日時の列はArrowのバッファから直接変換する)
+# 辞書エンコードの列はpandasのCategoricalにする (値の文字列は辞書の1回分だけ持ち、行ごとの文字列を作らない)
+def to_frame(table):
+    return table.to_pandas(split_blocks=True)
+
+
+# 作ったdfの数値・日時の列をスキーマの型にする関数 (float32の列はメモリが半分になる)
+def conform(df, schema):
+    df = df.copy()
+    for field in schema:
+        if field.name not in df.columns:
+            continue
+        if pa.types.is_float32(field.type):
+            df[field.name] = pd.to_numeric(df[field.name]).astype("float32")
+        elif pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name], utc=True).dt.tz_convert(
+                field.type.tz
+            )
+    return df
@@ -0,0 +1,216 @@
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+# スクリーニングに使う仮想通貨データの列 (特徴量)
+FEATURE_COLUMNS = [
+    "buyRatio",
+    "priceChg%1h",
+    "priceChg%24h",
+    "priceChg%7d",
+    "priceChg%14d",
+    "priceChg%30d",
+    "priceChg%60d",
+    "priceChg%200d",
+    "athChg%",
+    "atlChg%",
+    "coinCap",
+    "coinCapChg%24h",
+    "xFollowers",
+    "watchlistUsers",
+    "sentimentVotesUp%",
+]
+
+# 抽出の条件
+# op: ">", ">=", "<", "<=", "==", "!=" (valueと比べる)、"between" (value=(下限, 上限)、両端を含む)、
+#     "notnull" (欠損値でない)、"any" (value=Filterのリストのどれかを満たす)
+# scale: "raw" (元の値)、"zscore" (標準化した値)、"rank" (0から1のパーセンタイル順位) のどれと比べるか
+# 欠損値はどの比較も満たさない
+Filter = namedtuple(
+    "Filter", ["column", "op", "value", "scale"], defaults=[None, "raw"]
+)
+
+# スコアの項 (weight × 正規化した値、ascending=Trueなら値が小さいほどスコアを高くする)
+# normalize: "zscore" (平均0・標準偏差1)、"rank" (0から1のパーセンタイル順位)、"raw" (元の値)
+Term = namedtuple(
+    "Term",
+    ["column", "weight", "normalize", "ascending"],
+    defaults=[1.0, "zscore", False],
+)
+
+# スクリーニングの定義 (filtersをすべて満たす仮想通貨をtermsの合計のスコアで上位k件選ぶ)
+Screen = namedtuple("Screen", ["name", "filters", "terms", "k"], defaults=[(), (), 20])
+
+# 標準のスクリーニング (変化率・割合の列は0.01 = 1%の小数)
+DEFAULT_SCREENS = [
+    # 買いが多く、直近で上昇している仮想通貨
+    Screen(
+        "buy pressure",
+        [Filter("buyRatio", ">", 0.5), Filter("priceChg%24h", ">", 0)],
+        [Term("buyRatio"), Term("priceChg%24h", 0.5)],
+    ),
+    # 30日で上昇し、7日で下落した仮想通貨 (押し目)
+    Screen(
+        "pullback",
+        [Filter("priceChg%30d", ">", 0), Filter("priceChg%7d", "<", 0)],
+        [
+            Term("priceChg%30d", normalize="rank"),
+            Term("priceChg%7d", 1.0, "rank", True),
+        ],
+    ),
+    # ATHから大きく下落しているが、Xのフォロワー・ウォッチリストのユーザーが多い仮想通貨
+    Screen(
+        "discounted attention",
+        [Filter("athChg%", "<", -0.8)],
+        [
+            Term("xFollowers", normalize="rank"),
+            Term("watchlistUsers", normalize="rank"),
+            Term("athChg%", 0.5, "rank", True),
+        ],
+    ),
+    # センチメントが強く、時価総額が上位半分にない仮想通貨
+    Screen(
+        "small cap sentiment",
+        [Filter("sentimentVotesUp%", ">=", 0.7), Filter("coinCap", "<", 0.5, "rank")],
+        [Term("sentimentVotesUp%"), Term("priceChg%7d", 0.5)],
+    ),
+]
+
+# 比較の演算子
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+# 仮想通貨 × 特徴量 の行列 (float64) と、列ごとに標準化した行列・パーセンタイル順位の行列を持つクラス
+# 正規化はスナップショット全体で1回だけ行い、スクリーニングごとに並べ替えや結合をしない
+# (抽出は列の配列の比較、スコアは列の重み付きの和、上位k件はnp.partitionで選ぶ)
+class FeatureMatrix:
+    def __init__(self, keys, columns, values):
+        self.keys = np.asarray(keys, dtype=object)
+        self.columns = list(columns)
+        # 列ごとに取り出すため列優先の配列で持つ
+        self.values = np.asfortranarray(values, dtype=np.float64)
+        self._column_index = {column: j for j, column in enumerate(self.columns)}
+        # すべて欠損している列は標準化した値も欠損値にする
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(self.values, axis=0)
+            std = np.nanstd(self.values, axis=0)
+            std[std == 0] = np.nan
+            self.zscores = np.asfortranarray((self.values - mean) / std)
+        # 同じ値は平均の順位にし、欠損値は欠損値のままにする
+        ranks = rankdata(self.values, axis=0, nan_policy="omit")
+        n_valid = (~np.isnan(self.values)).sum(axis=0)
+        self.ranks = np.asfortranarray((ranks - 1) / np.maximum(n_valid - 1, 1))
+
+    # 仮想通貨データから特徴量の行列を作る関数 (dfにない列はすべて欠損値にする)
+    @classmethod
+    def build(cls, df_coins, columns=FEATURE_COLUMNS, key="coinId"):
+        values = df_coins.reindex(columns=columns).to_numpy(
+            dtype=np.float64, na_value=np.nan
+        )
+        return cls(df_coins[key].to_numpy(dtype=object), columns, values)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # 列の値の配列 (scaleは"raw", "zscore", "rank")
+    def column(self, name, scale="raw"):
+        matrix = {"raw": self.values, "zscore": self.zscores, "rank": self.ranks}[scale]
+        if name not in self._column_index:
+            raise KeyError(f"Unknown feature column: {name}")
+        return matrix[:, self._column_index[name]]
+
+    # 条件をすべて満たす行のマスクを返す関数
+    def mask(self, filters):
+        mask = np.ones(len(self), dtype=bool)
+        for f in filters:
+            mask &= self._filter_mask(f)
+        return mask
+
+    def _filter_mask(self, f):
+        if f.op == "any":
+            mask = np.zeros(len(self), dtype=bool)
+            for sub_filter in f.value:
+                mask |= self._filter_mask(sub_filter)
+            return mask
+        values = self.column(f.column, f.scale)
+        if f.op == "notnull":
+            return ~np.isnan(values)
+        with np.errstate(invalid="ignore"):
+            if f.op == "between":
+                low, high = f.value
+                return (values >= low) & (values <= high)
+            if f.op not in OPERATORS:
+                raise ValueError(f"Unknown filter op: {f.op}")
+            # "!="は欠損値でも真になるため、欠損値を除く
+            return OPERATORS[f.op](values, f.value) & ~np.isnan(values)
+
+    # スコアの配列を返す関数 (項の値のどれかが欠損している行は欠損値)
+    def score(self, terms):
+        score = np.zeros(len(self))
+        for term in terms:
+            values = self.column(term.column, term.normalize)
+            score += -term.weight * values if term.ascending else term.weight * values
+        return score
+
+    # スクリーニングを1つ実行し、スコアの高い順に上位k件の (行の位置の配列, スコアの配列) を返す関数
+    # 条件を満たしスコアが欠損していない行から、np.partitionでk番目のスコアを求めてk件を選んでからk件だけ並べる
+    # (同じスコアの行は前の行を優先する。kが候補の数より多ければ候補をすべて、0以下なら空の結果を返す)
+    def select(self, screen):
+        mask = self.mask(screen.filters)
+        score = self.score(screen.terms)
+        positions = np.flatnonzero(mask & ~np.isnan(score))
+        selected = -score[positions]
+        k = min(max(screen.k, 0), len(positions))
+        if k == 0:
+            return positions[:0], score[positions[:0]]
+        if k < len(positions):
+            threshold = np.partition(selected, k - 1)[k - 1]
+            better = np.flatnonzero(selected < threshold)
+            ties = np.flatnonzero(selected == threshold)[: k - len(better)]
+            top = np.concatenate([better, ties])
+        else:
+            top = np.arange(len(positions))
+        top = top[np.argsort(selected[top], kind="stable")]
+        return positions[top], score[positions[top]]
+
+    # スクリーニングを1つ実行し、上位k件の (coinId, score, 条件とスコアに使った列の元の値) のdfを返す関数
+    def screen(self, screen):
+        positions, score = self.select(screen)
+        result = {"coinId": self.keys[positions], "score": score}
+        l_columns = [f.column for f in screen.filters if f.op != "any"]
+        l_columns += [term.column for term in screen.terms]
+        for column in dict.fromkeys(l_columns):
+            result[column] = self.column(column)[positions]
+        return pd.DataFrame(result)
+
+    # 複数のスクリーニングを実行し、結果を1つのdf (screen, rank, coinId, score) にまとめて返す関数
+    # (スクリーニングごとにdfを作らず、最後に1回だけ作る)
+    def run(self, screens):
+        l_names, l_positions, l_scores = [], [], []
+        for screen in screens:
+            positions, score = self.select(screen)
+            l_names.append(np.full(len(positions), screen.name, dtype=object))
+            l_positions.append(positions)
+            l_scores.append(score)
+        if not l_positions:
+            return pd.DataFrame(columns=["screen", "rank", "coinId", "score"])
+        positions = np.concatenate(l_positions)
+        return pd.DataFrame(
+            {
+                "screen": np.concatenate(l_names),
+                "rank": np.concatenate([np.arange(1, len(p) + 1) for p in l_positions]),
+                "coinId": self.keys[positions],
+                "score": np.concatenate(l_scores),
+            }
+        )
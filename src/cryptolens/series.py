@@ -0,0 +1,159 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+
+# symbolごとの時系列をParquetに追記していく列指向のストア
+# <root>/<partition_key>=<partition>/part-<作成時刻[ns]>.parquet に追記し、
+# manifest.json にsymbolごとの最新のtimestampと行数を記録する (差分取得の起点にする)
+# schemaは "symbol" (辞書エンコードの文字列) と "timestamp" (int64, UNIXタイムスタンプ[ms]) を含むこと
+class SeriesStore:
+    def __init__(self, root, schema, partition_key):
+        self.root = root
+        self.schema = schema
+        self.partition_key = partition_key
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _partition_dir(self, partition):
+        return os.path.join(self.root, f"{self.partition_key}={partition}")
+
+    # 保存済みの最新のtimestamp[ms]を返す関数 (なければNone)
+    def last_timestamp(self, partition, symbol):
+        return self.manifest.get(partition, {}).get("last", {}).get(symbol)
+
+    # symbolごとの時系列をまとめて1ファイルとして追記する関数
+    # series: {symbol: {列名: 配列}} (配列はtimestamp昇順)
+    def append(self, partition, series):
+        series = {s: v for s, v in series.items() if len(v["timestamp"]) > 0}
+        if not series:
+            return 0
+        columns = {
+            "symbol": pa.array(
+                np.concatenate(
+                    [
+                        np.full(len(v["timestamp"]), s, dtype=object)
+                        for s, v in series.items()
+                    ]
+                ),
+                pa.string(),
+            ).dictionary_encode()
+        }
+        for field in self.schema:
+            if field.name != "symbol":
+                columns[field.name] = pa.array(
+                    np.concatenate([v[field.name] for v in series.values()]),
+                    field.type,
+                )
+        table = pa.table(columns, schema=self.schema)
+
+        partition_dir = self._partition_dir(partition)
+        os.makedirs(partition_dir, exist_ok=True)
+        file_name = f"part-{time.time_ns()}.parquet"
+        tmp_path = os.path.join(partition_dir, f".{file_name}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(partition_dir, file_name))
+
+        manifest = self.manifest.setdefault(partition, {"last": {}, "rows": 0})
+        for symbol, v in series.items():
+            last = manifest["last"].get(symbol)
+            manifest["last"][symbol] = int(max(v["timestamp"][-1], last or 0))
+        manifest["rows"] += table.num_rows
+        self._write_manifest()
+        return table.num_rows
+
+    # 保存した時系列を読み込む関数 (symbolと期間の条件はParquetの読み込み時に適用する)
+    def load(self, partition, symbols=None, start_time=None, end_time=None):
+        partition_dir = self._partition_dir(partition)
+        if not os.path.isdir(partition_dir):
+            return pd.DataFrame(columns=self.schema.names)
+        # 同じtimestampの行は後から追記した行を優先するため、ファイルを作成した順に読む
+        l_names = [
+            name
+            for name in os.listdir(partition_dir)
+            if name.startswith("part-") and name.endswith(".parquet")
+        ]
+        l_paths = [
+            os.path.join(partition_dir, name)
+            for name in sorted(l_names, key=lambda name: int(name[5:-8]))
+        ]
+        dataset = ds.dataset(l_paths, format="parquet", schema=self.schema)
+        filter = None
+        conditions = []
+        if symbols is not None:
+            conditions.append(ds.field("symbol").isin(list(symbols)))
+        if start_time is not None:
+            conditions.append(ds.field("timestamp") >= start_time)
+        if end_time is not None:
+            conditions.append(ds.field("timestamp") <= end_time)
+        for condition in conditions:
+            filter = condition if filter is None else filter & condition
+        df = dataset.to_table(filter=filter).to_pandas()
+        # 差分取得の境界で重複した行を除いて並べ替える
+        df = df.drop_duplicates(subset=["symbol", "timestamp"], keep="last")
+        return df.sort_values(["symbol", "timestamp"]).reset_index(drop=True)
+
+
+# symbolごとの時系列を並列に差分取得してストアに追記する関数
+# fetch(symbol, partition, start_time, end_time) は列名ごとの配列 (timestamp昇順) を返す
+# steps: {partition: 1期間の長さ[ms]}
+# 保存済みのsymbolは最新のtimestampの期間から、未保存のsymbolはstart_timeから取得する
+# (最新の期間は保存した時点で終わっていない足・期間のことがあるため取得し直し、
+#  読み込むときに同じtimestampの後から追記した行を優先する)
+def backfill_series(
+    store, fetch, l_symbols, steps, start_time, end_time, max_workers=16, desc=None
+):
+    tasks = []
+    for partition in steps:
+        for symbol in l_symbols:
+            last = store.last_timestamp(partition, symbol)
+            start = start_time if last is None else last
+            if start <= end_time:
+                tasks.append((symbol, partition, start))
+
+    results = {partition: {} for partition in steps}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch, symbol, partition, start, end_time): (
+                symbol,
+                partition,
+            )
+            for symbol, partition, start in tasks
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+            symbol, partition = futures[future]
+            try:
+                results[partition][symbol] = future.result()
+            except Exception as e:
+                errors.append((symbol, partition, str(e)))
+
+    if errors:
+        print("Errors occurred for the following symbols:")
+        for error in errors:
+            print(
+                f"Symbol: {error[0]}, {store.partition_key}: {error[1]}, Error: {error[2]}"
+            )
+
+    return {
+        partition: store.append(partition, results[partition]) for partition in steps
+    }
@@ -0,0 +1,563 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+
+
+# ByBitの公開WebSocket (ティッカー) の代わりにローカルで動かすサーバー
+# 購読されたsymbolごとにsnapshotを1回送り、その後はinterval秒ごとにランダムなdeltaを送る
+# テストやベンチマークで実際のAPIに接続せずにストリーミングを動かすために使う
+class TickerStandInServer:
+    def __init__(self, host="127.0.0.1", port=0, interval=0.01, seed=None):
+        self.interval = interval
+        self._random = random.Random(seed)
+        self._server = serve(self._handler, host, port)
+        self.host, self.port = self._server.socket.getsockname()[:2]
+        self.url = f"ws://{self.host}:{self.port}"
+        self._thread = None
+        self.n_sent = 0
+
+    # symbolの初期状態のティッカー (snapshot)
+    def _initial_ticker(self, symbol):
+        price = self._random.uniform(0.01, 50000)
+        return {
+            "symbol": symbol,
+            "lastPrice": f"{price:.4f}",
+            "price24hPcnt": f"{self._random.uniform(-0.2, 0.2):.4f}",
+            "highPrice24h": f"{price * 1.05:.4f}",
+            "lowPrice24h": f"{price * 0.95:.4f}",
+            "volume24h": f"{self._random.uniform(1e3, 1e7):.2f}",
+            "turnover24h": f"{self._random.uniform(1e5, 1e9):.2f}",
+            "openInterest": f"{self._random.uniform(1e3, 1e7):.2f}",
+            "openInterestValue": f"{self._random.uniform(1e5, 1e9):.2f}",
+            "fundingRate": f"{self._random.uniform(-0.001, 0.001):.6f}",
+            "nextFundingTime": str((int(time.time()) // 28800 + 1) * 28800 * 1000),
+        }
+
+    def _send(self, websocket, topic, kind, data):
+        websocket.send(
+            json.dumps(
+                {
+                    "topic": topic,
+                    "type": kind,
+                    "data": data,
+                    "ts": int(time.time() * 1000),
+                }
+            )
+        )
+        self.n_sent += 1
+
+    # 接続ごとの処理 (購読・ping・ティッカーの配信)
+    def _handler(self, websocket):
+        tickers = {}
+        try:
+            while True:
+                try:
+                    raw = websocket.recv(timeout=self.interval)
+                except TimeoutError:
+                    raw = None
+                if raw is not None:
+                    request = json.loads(raw)
+                    if request.get("op") == "ping":
+                        websocket.send(json.dumps({"op": "pong", "success": True}))
+                    elif request.get("op") == "subscribe":
+                        websocket.send(
+                            json.dumps(
+                                {"op": "subscribe", "success": True, "ret_msg": ""}
+                            )
+                        )
+                        for topic in request.get("args", []):
+                            symbol = topic.split(".", 1)[1]
+                            tickers[topic] = self._initial_ticker(symbol)
+                            self._send(websocket, topic, "snapshot", tickers[topic])
+                    continue
+                if not tickers:
+                    continue
+                # ランダムに選んだsymbolの価格と建玉が変化したdeltaを送る
+                topic = self._random.choice(list(tickers))
+                ticker = tickers[topic]
+                price = float(ticker["lastPrice"]) * self._random.uniform(0.99, 1.01)
+                ticker["lastPrice"] = f"{price:.4f}"
+                delta = {
+                    "symbol": ticker["symbol"],
+                    "lastPrice": ticker["lastPrice"],
+                    "openInterest": f"{self._random.uniform(1e3, 1e7):.2f}",
+                }
+                self._send(websocket, topic, "delta", delta)
+        except ConnectionClosed:
+            pass
+
+    # 別スレッドでサーバーを起動する
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# 売買比率の期間の秒数
+RATIO_PERIODS = {
+    "5min": 300,
+    "15min": 900,
+    "30min": 1800,
+    "1h": 3600,
+    "4h": 14400,
+    "1d": 86400,
+}
+
+
+# /coins/{id}の多言語の名前・説明の言語
+LANGUAGES = [
+    "en",
+    "de",
+    "es",
+    "fr",
+    "it",
+    "pl",
+    "ro",
+    "hu",
+    "nl",
+    "pt",
+    "sv",
+    "vi",
+    "tr",
+    "ru",
+    "ja",
+    "zh",
+    "zh-tw",
+    "ko",
+    "ar",
+    "th",
+    "id",
+    "cs",
+    "da",
+    "el",
+    "hi",
+    "no",
+    "sk",
+    "uk",
+    "he",
+    "fi",
+    "bg",
+    "hr",
+    "lt",
+    "sl",
+]
+
+
+# ApiStandInServerへのリクエストを処理するハンドラ
+class _ApiHandler(BaseHTTPRequestHandler):
+    # keep-aliveでコネクションを使い回す (HttpClientのコネクションプールと同じ条件にする)
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に送るため、Nagleのアルゴリズムで応答が遅れないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        standin = self.server.standin
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        api_key = self.headers.get("x-cg-demo-api-key")
+        status, headers, body = standin.handle(url.path, params, api_key)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # リクエストごとのログは出力しない
+    def log_message(self, format, *args):
+        pass
+
+
+# ByBitとCoinGeckoのREST API (main.pyで使うエンドポイント) の代わりにローカルで動かすサーバー
+# n_coins件の仮想通貨 (CoinGecko) と、そのうちn_symbols件のsymbol (ByBit) の合成データを返す
+# - 一部の仮想通貨は前の仮想通貨と同じシンボルにする (symbolに複数のidの候補がある状態を再現する)
+# - latency: 応答までの平均の遅延[s] (0.5倍から1.5倍の範囲でばらつかせる)
+# - rate_limits: {"coingecko" または "bybit": (リクエスト数, 秒数)} で上限を超えたリクエストに429を返す
+#   (CoinGeckoはRetry-After、ByBitはX-Bapi-Limit-Status/X-Bapi-Limit-Reset-Timestampのヘッダーを付ける)
+#   CoinGeckoの上限はAPIキー (x-cg-demo-api-key) ごと、ByBitの上限はサーバー全体で数える
+# - error_rate: 上限に関係なくランダムに429を返す割合
+# base_urlsをHttpClient (make_client) に渡すと、実際のAPIの代わりにこのサーバーに送信する
+class ApiStandInServer:
+    def __init__(
+        self,
+        n_coins=1000,
+        n_symbols=None,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        rate_limits=None,
+        error_rate=0.0,
+        retry_after=1,
+        seed=0,
+    ):
+        self.n_coins = n_coins
+        self.latency = latency
+        self.rate_limits = dict(rate_limits or {})
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # APIごとの現在の時間枠の開始時刻とリクエスト数
+        self._windows = {}
+        self.n_requests = 0
+        self.n_throttled = 0
+        # APIキーごとのCoinGeckoへのリクエスト数
+        self.requests_by_key = Counter()
+
+        # 50件ごとに前の仮想通貨と同じシンボルにする
+        self.symbols = [
+            f"c{i - 1}" if i % 50 == 49 else f"c{i}" for i in range(n_coins)
+        ]
+        self.index = {f"coin-{i}": i for i in range(n_coins)}
+        n_categories = max(10, n_coins // 50)
+        self.category_names = [f"Category {i}" for i in range(n_categories)]
+        # 半分の仮想通貨はEthereumのトークンにする
+        self.platforms = [
+            {"ethereum": f"0x{i:040x}"} if i % 2 else {} for i in range(n_coins)
+        ]
+        # /coins/listは変わらないため、本文を作っておく
+        self._coins_list = json.dumps(
+            [
+                {
+                    "id": f"coin-{i}",
+                    "symbol": self.symbols[i],
+                    "name": f"Coin {i}",
+                    "platforms": self.platforms[i],
+                }
+                for i in range(n_coins)
+            ]
+        ).encode()
+        # ByBitのsymbolは重複しないシンボルの先頭からn_symbols件 (97件ごとに倍率付きのsymbolにする)
+        l_base_coins = list(dict.fromkeys(self.symbols))[: n_symbols or n_coins]
+        self.instruments = [
+            {
+                "symbol": f"{'1000' if i % 97 == 96 else ''}{coin.upper()}USDT",
+                "baseCoin": f"{'1000' if i % 97 == 96 else ''}{coin.upper()}",
+                "quoteCoin": "USDT",
+                "contractType": "LinearPerpetual",
+                "status": "Trading",
+                "launchTime": str(1_600_000_000_000 + i * 3_600_000),
+            }
+            for i, coin in enumerate(l_base_coins)
+        ]
+        self.bybit_symbols = {instrument["symbol"] for instrument in self.instruments}
+
+        self._server = ThreadingHTTPServer((host, port), _ApiHandler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}"
+        # HttpClientのbase_urlsに渡す置き換え先
+        self.base_urls = {
+            "https://api.coingecko.com": self.url,
+            "https://api.bybit.com": self.url,
+        }
+        self._thread = None
+
+    # 仮想通貨ごとに決まった乱数 (リクエストの順序によらず同じ値を返す)
+    def _coin_random(self, i):
+        return random.Random(self.seed * 1_000_003 + i)
+
+    @staticmethod
+    def _now_iso():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    # API (CoinGeckoはAPIキー) ごとの時間枠のリクエスト数を数え、上限を超えたら時間枠の残り秒数を返す
+    # 返り値は (残り回数, 時間枠の終了時刻[s], 待機が必要な秒数)
+    def _take(self, api, api_key=None):
+        limit = self.rate_limits.get(api)
+        if limit is None:
+            return None, None, 0
+        n_requests, period = limit
+        window = (api, api_key if api == "coingecko" else None)
+        now = time.time()
+        with self._lock:
+            started, count = self._windows.get(window, (now, 0))
+            if now - started >= period:
+                started, count = now, 0
+            count += 1
+            self._windows[window] = (started, count)
+        reset = started + period
+        if count > n_requests:
+            return 0, reset, reset - now
+        return n_requests - count, reset, 0
+
+    # リクエストを処理してステータスコード・ヘッダー・本文を返す関数
+    def handle(self, path, params, api_key=None):
+        api = "bybit" if path.startswith("/v5/") else "coingecko"
+        with self._lock:
+            self.n_requests += 1
+            if api == "coingecko":
+                self.requests_by_key[api_key] += 1
+        if self.latency > 0:
+            time.sleep(self.latency * self._random.uniform(0.5, 1.5))
+
+        remaining, reset, wait = self._take(api, api_key)
+        headers = {}
+        if api == "bybit" and remaining is not None:
+            headers["X-Bapi-Limit-Status"] = str(remaining)
+            headers["X-Bapi-Limit-Reset-Timestamp"] = str(int(reset * 1000))
+        if wait > 0 or self._random.random() < self.error_rate:
+            with self._lock:
+                self.n_throttled += 1
+            if api == "coingecko":
+                headers["Retry-After"] = str(max(self.retry_after, round(wait, 3)))
+            body = {"status": {"error_code": 429, "error_message": "Rate limited"}}
+            return 429, headers, json.dumps(body).encode()
+
+        if path == "/api/v3/coins/list":
+            return 200, headers, self._coins_list
+        if path == "/api/v3/coins/categories":
+            return 200, headers, json.dumps(self._categories()).encode()
+        if path == "/api/v3/coins/markets":
+            return 200, headers, json.dumps(self._markets(params)).encode()
+        if path.startswith("/api/v3/coins/"):
+            i = self.index.get(path.rsplit("/", 1)[1])
+            if i is None:
+                return 404, headers, b'{"error":"coin not found"}'
+            return 200, headers, json.dumps(self._detail(i, params)).encode()
+        if path == "/v5/market/instruments-info":
+            return 200, headers, json.dumps(self._instruments(params)).encode()
+        if path == "/v5/market/account-ratio":
+            return 200, headers, json.dumps(self._ratios(params)).encode()
+        return 404, headers, b'{"error":"not found"}'
+
+    # /coins/categories
+    def _categories(self):
+        now = self._now_iso()
+        rng = random.Random(self.seed)
+        return [
+            {
+                "id": f"category-{i}",
+                "name": name,
+                "market_cap": rng.uniform(1e6, 1e11),
+                "market_cap_change_24h": rng.uniform(-10, 10),
+                "volume_24h": rng.uniform(1e5, 1e10),
+                "updated_at": now,
+            }
+            for i, name in enumerate(self.category_names)
+        ]
+
+    # 仮想通貨ごとの市場データ (/coins/marketsと/coins/{id}で共通の値)
+    def _market_values(self, i):
+        rng = self._coin_random(i)
+        price = rng.uniform(1e-4, 1e4)
+        values = {
+            "current_price": price,
+            "market_cap": price * rng.uniform(1e6, 1e9),
+            "market_cap_rank": i + 1,
+            "market_cap_change_percentage_24h": rng.uniform(-20, 20),
+            "ath": price * rng.uniform(1, 10),
+            "ath_change_percentage": rng.uniform(-99, 0),
+            "ath_date": "2021-11-10T14:24:11.849Z",
+            "atl": price * rng.uniform(0.01, 1),
+            "atl_change_percentage": rng.uniform(0, 10000),
+            "atl_date": "2020-03-13T02:22:55.044Z",
+            "last_updated": self._now_iso(),
+        }
+        for horizon in ["1h", "24h", "7d", "14d", "30d", "60d", "200d"]:
+            values[f"price_change_percentage_{horizon}_in_currency"] = rng.uniform(
+                -50, 50
+            )
+        return values
+
+    # /coins/markets (idsで指定した仮想通貨をper_page件ずつ返す)
+    def _markets(self, params):
+        l_ids = [id for id in params.get("ids", "").split(",") if id in self.index]
+        per_page = int(params.get("per_page", 100))
+        page = int(params.get("page", 1))
+        l_markets = []
+        for id in l_ids[(page - 1) * per_page : page * per_page]:
+            i = self.index[id]
+            l_markets.append(
+                {
+                    "id": id,
+                    "symbol": self.symbols[i],
+                    "name": f"Coin {i}",
+                    **self._market_values(i),
+                }
+            )
+        return l_markets
+
+    # /coins/{id}
+    # 実際のAPIと同じく、多言語の名前・説明、ティッカー、開発者の情報は指定しなければ含める
+    def _detail(self, i, params):
+        rng = self._coin_random(i)
+        market = self._market_values(i)
+        l_categories = rng.sample(
+            self.category_names, rng.randint(0, min(3, len(self.category_names)))
+        )
+        platforms = self.platforms[i]
+        detail = {
+            "id": f"coin-{i}",
+            "symbol": self.symbols[i],
+            "name": f"Coin {i}",
+            "web_slug": f"coin-{i}",
+            "categories": l_categories,
+            "asset_platform_id": next(iter(platforms), None),
+            "platforms": platforms or {"": ""},
+            "community_data": {
+                "facebook_likes": None,
+                "reddit_subscribers": rng.randint(0, 100_000),
+                "telegram_channel_user_count": rng.randint(0, 100_000),
+                "twitter_followers": rng.randint(0, 1_000_000),
+            },
+            "market_cap_rank": market["market_cap_rank"],
+            "market_cap_fdv_ratio": rng.uniform(0.1, 1),
+            "market_data": {
+                "market_cap": {"usd": market["market_cap"]},
+                "market_cap_change_percentage_24h_in_currency": {
+                    "usd": market["market_cap_change_percentage_24h"]
+                },
+                **{
+                    key: {"usd": market[key]}
+                    for key in [
+                        "current_price",
+                        "ath",
+                        "ath_change_percentage",
+                        "ath_date",
+                        "atl",
+                        "atl_change_percentage",
+                        "atl_date",
+                    ]
+                },
+                **{
+                    key: {"usd": value}
+                    for key, value in market.items()
+                    if key.startswith("price_change_percentage_")
+                },
+            },
+            "sentiment_votes_up_percentage": rng.uniform(0, 100),
+            "watchlist_portfolio_users": rng.randint(0, 1_000_000),
+            "last_updated": market["last_updated"],
+        }
+        languages = LANGUAGES if params.get("localization") != "false" else ["en"]
+        detail["description"] = {
+            language: f"Coin {i} is a synthetic coin for benchmarks. " * 20
+            for language in languages
+        }
+        if params.get("localization") != "false":
+            detail["localization"] = {language: f"Coin {i}" for language in languages}
+        if params.get("tickers") != "false":
+            detail["tickers"] = [
+                {
+                    "base": self.symbols[i].upper(),
+                    "target": "USDT",
+                    "market": {"name": f"Exchange {k}", "identifier": f"exchange-{k}"},
+                    "last": market["current_price"],
+                    "volume": rng.uniform(1e3, 1e7),
+                    "converted_last": {"usd": market["current_price"]},
+                    "trust_score": "green",
+                    "trade_url": f"https://exchange-{k}.example.com/trade/coin-{i}",
+                }
+                for k in range(100)
+            ]
+        if params.get("developer_data") != "false":
+            detail["developer_data"] = {
+                "forks": rng.randint(0, 1000),
+                "stars": rng.randint(0, 10000),
+                "commit_count_4_weeks": rng.randint(0, 500),
+                "last_4_weeks_commit_activity_series": [
+                    rng.randint(0, 50) for _ in range(28)
+                ],
+            }
+        if params.get("sparkline") == "true":
+            detail["market_data"]["sparkline_7d"] = {
+                "price": [
+                    market["current_price"] * rng.uniform(0.9, 1.1) for _ in range(168)
+                ]
+            }
+        return detail
+
+    # /v5/market/instruments-info (limit件ずつ、cursorは次の先頭の位置)
+    def _instruments(self, params):
+        limit = min(int(params.get("limit", 500)), 1000)
+        start = int(params.get("cursor") or 0)
+        end = start + limit
+        return {
+            "retCode": 0,
+            "retMsg": "OK",
+            "result": {
+                "category": params.get("category", "linear"),
+                "list": self.instruments[start:end],
+                "nextPageCursor": str(end) if end < len(self.instruments) else "",
+            },
+        }
+
+    # /v5/market/account-ratio (期間の区切りの時刻から新しい順にlimit件ずつ、cursorは次の先頭の位置)
+    def _ratios(self, params):
+        symbol = params.get("symbol")
+        step = RATIO_PERIODS.get(params.get("period"))
+        if symbol not in self.bybit_symbols or step is None:
+            return {"retCode": 10001, "retMsg": "params error", "result": {}}
+        step *= 1000
+        limit = min(int(params.get("limit", 50)), 500)
+        now = int(time.time() * 1000)
+        end = min(int(params.get("endTime", now)), now) // step * step
+        start = int(params.get("startTime", end - 500 * step))
+        offset = int(params.get("cursor") or 0)
+        l_timestamps = [
+            end - (offset + k) * step
+            for k in range(limit)
+            if end - (offset + k) * step >= start
+        ]
+        rng = random.Random(f"{self.seed}:{symbol}")
+        l_records = []
+        for timestamp in l_timestamps:
+            buy_ratio = round(rng.uniform(0.3, 0.7), 4)
+            l_records.append(
+                {
+                    "symbol": symbol,
+                    "buyRatio": str(buy_ratio),
+                    "sellRatio": str(round(1 - buy_ratio, 4)),
+                    "timestamp": str(timestamp),
+                }
+            )
+        more = len(l_timestamps) == limit and end - (offset + limit) * step >= start
+        return {
+            "retCode": 0,
+            "retMsg": "OK",
+            "result": {
+                "list": l_records,
+                "nextPageCursor": str(offset + limit) if more else "",
+            },
+        }
+
+    # 別スレッドでサーバーを起動する
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,193 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cryptolens.schema import cast_table, to_frame, to_table
+
+# スナップショットの取得日時の列 (履歴を横断して検索するときに使う)
+SNAPSHOT_COLUMN = "snapshotTime"
+
+
+# スナップショットを取得日ごとのパーティションにArrow IPC (非圧縮) で追記していく履歴ストア
+# <root>/<name>/date=YYYY-MM-DD/<name>_YYYYMMDDHHMM.arrow に保存し、
+# manifest.json に最新のスナップショットとパーティションごとの行数を記録する
+# schemaを指定すると書き込むときに列の型をスキーマに合わせる (変換できない値はエラーにする)
+# 読み込みはメモリマップで行い、必要な列だけをコピーせずに参照する
+# (以前のParquetのスナップショットもmanifestに記録されたまま読める)
+class HistoryStore:
+    def __init__(self, root, name, schema=None):
+        self.name = name
+        self.schema = schema
+        self.dir = os.path.join(root, name)
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"latest": None, "partitions": {}}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    # manifestを一時ファイルに書いてから置き換える (書き込み途中で壊れないように)
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def __len__(self):
+        return sum(len(p["files"]) for p in self.manifest["partitions"].values())
+
+    # スナップショットを追記する関数 (snapshot_timeはtz-awareのdatetime)
+    def append(self, df, snapshot_time):
+        snapshot_time = snapshot_time.replace(second=0, microsecond=0)
+        date = snapshot_time.strftime("%Y-%m-%d")
+        snapshot = snapshot_time.strftime("%Y%m%d%H%M")
+        partition_dir = os.path.join(self.dir, f"date={date}")
+        os.makedirs(partition_dir, exist_ok=True)
+
+        if self.schema is not None:
+            table = to_table(df, self.schema)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.append_column(
+            SNAPSHOT_COLUMN,
+            pa.array(
+                [snapshot_time] * table.num_rows,
+                pa.timestamp("s", tz=str(snapshot_time.tzinfo)),
+            ),
+        )
+        file_name = f"{self.name}_{snapshot}.arrow"
+        tmp_path = os.path.join(partition_dir, f".{file_name}.tmp")
+        with pa.ipc.new_file(tmp_path, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, os.path.join(partition_dir, file_name))
+
+        entry = {
+            "snapshot": snapshot,
+            "snapshotTime": snapshot_time.isoformat(),
+            "path": f"date={date}/{file_name}",
+            "rows": table.num_rows,
+        }
+        partition = self.manifest["partitions"].setdefault(
+            date, {"files": [], "rows": 0}
+        )
+        partition["files"] = [
+            f for f in partition["files"] if f["path"] != entry["path"]
+        ]
+        partition["files"].append(entry)
+        partition["rows"] = sum(f["rows"] for f in partition["files"])
+        latest = self.manifest["latest"]
+        if latest is None or latest["snapshot"] <= snapshot:
+            self.manifest["latest"] = entry
+        self._write_manifest()
+        return entry
+
+    # スナップショットのファイルを読み込む関数
+    # Arrow IPCはメモリマップしたファイルをそのまま参照する (列の選択はコピーしない)
+    @staticmethod
+    def _read(path, columns=None):
+        if path.endswith(".parquet"):
+            return pq.read_table(path, columns=columns, memory_map=True)
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        if columns is not None:
+            table = table.select([col for col in columns if col in table.column_names])
+        return table
+
+    # manifestに記録されたスナップショット (snapshot, snapshotTime, path, rows) を古い順に返す関数
+    def entries(self):
+        l_entries = [
+            f
+            for partition in self.manifest["partitions"].values()
+            for f in partition["files"]
+        ]
+        return sorted(l_entries, key=lambda entry: entry["snapshot"])
+
+    # 最新のスナップショットをArrowのテーブルとして読み込む関数 (manifestから1ファイルだけ読む)
+    def load_latest_table(self, columns=None):
+        latest = self.manifest["latest"]
+        if latest is None:
+            return None
+        return self.load_table(latest, columns)
+
+    # manifestのエントリのスナップショットをArrowのテーブルとして読み込む関数
+    def load_table(self, entry, columns=None):
+        table = self._read(os.path.join(self.dir, entry["path"]), columns)
+        if SNAPSHOT_COLUMN in table.column_names and (
+            columns is None or SNAPSHOT_COLUMN not in columns
+        ):
+            table = table.drop_columns([SNAPSHOT_COLUMN])
+        if self.schema is not None:
+            table = cast_table(table, self.schema)
+        return table
+
+    # 最新のスナップショットを読み込む関数
+    def load_latest(self, columns=None):
+        table = self.load_latest_table(columns)
+        if table is None:
+            return pd.DataFrame()
+        return to_frame(table)
+
+    # 最新のスナップショットの取得日時を返す関数 (なければNone)
+    def latest_time(self):
+        latest = self.manifest["latest"]
+        if latest is None:
+            return None
+        return datetime.fromisoformat(latest["snapshotTime"])
+
+    # 期間内のスナップショットのファイルパスをmanifestから選ぶ関数 (ディレクトリを走査しない)
+    # パーティションの日付はスナップショットのタイムゾーンなので、前後1日の余裕を持たせて絞り込む
+    def _paths(self, start=None, end=None):
+        paths = []
+        for date, partition in sorted(self.manifest["partitions"].items()):
+            if start is not None and date < (start - timedelta(days=1)).strftime(
+                "%Y-%m-%d"
+            ):
+                continue
+            if end is not None and date > (end + timedelta(days=1)).strftime(
+                "%Y-%m-%d"
+            ):
+                continue
+            for f in partition["files"]:
+                snapshot_time = datetime.fromisoformat(f["snapshotTime"])
+                if start is not None and snapshot_time < start:
+                    continue
+                if end is not None and snapshot_time > end:
+                    continue
+                paths.append(os.path.join(self.dir, f["path"]))
+        return paths
+
+    # 期間・列・条件を指定してスナップショットを横断検索する関数
+    # filter: pyarrow.datasetの式 (例: ds.field("coinId") == "bitcoin")
+    # 期間外のパーティションは読まず、列と条件はファイルの読み込み時に適用する
+    # (以前のParquetとArrow IPCのスナップショットは形式ごとに読み、型をスキーマに揃えてから結合する)
+    # 列はすべてのファイルのスキーマを合わせたもの (後のスナップショットで増えた列は、ない行を欠損値にする)
+    def query(self, start=None, end=None, columns=None, filter=None):
+        paths = self._paths(start, end)
+        if not paths:
+            return pd.DataFrame(columns=columns)
+        if columns is not None and SNAPSHOT_COLUMN not in columns:
+            columns = list(columns) + [SNAPSHOT_COLUMN]
+        tables = []
+        for format, suffix in [("parquet", ".parquet"), ("ipc", ".arrow")]:
+            l_paths = [path for path in paths if path.endswith(suffix)]
+            if not l_paths:
+                continue
+            dataset = ds.dataset(l_paths, format=format)
+            schema = pa.unify_schemas(
+                [fragment.physical_schema for fragment in dataset.get_fragments()],
+                promote_options="permissive",
+            )
+            dataset = ds.dataset(l_paths, format=format, schema=schema)
+            table = dataset.to_table(columns=columns, filter=filter)
+            if self.schema is not None:
+                table = cast_table(table, self.schema)
+            tables.append(table)
+        table = pa.concat_tables(tables, promote_options="permissive")
+        return to_frame(table)
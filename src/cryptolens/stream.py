@@ -0,0 +1,201 @@
+import json
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect
+
+# ByBitの無期限先物 (USDT) の公開WebSocket
+BYBIT_PUBLIC_LINEAR_URL = "wss://stream.bybit.com/v5/public/linear"
+
+# ティッカーのフィールドと最新状態テーブルの列名 (df_coinsと同じ列名にそろえる)
+TICKER_FIELDS = {
+    "lastPrice": "currentPrice",
+    "price24hPcnt": "priceChg%24h",
+    "highPrice24h": "high24h",
+    "lowPrice24h": "low24h",
+    "volume24h": "volume24h",
+    "turnover24h": "turnover24h",
+    "openInterest": "openInterest",
+    "openInterestValue": "openInterestValue",
+    "fundingRate": "fundingRate",
+}
+# 整数 (UNIXタイムスタンプ[ms]) のフィールド
+TICKER_TIME_FIELDS = {"nextFundingTime": "nextFundingTime"}
+
+
+# symbolごとのティッカーの最新状態を事前に確保した配列で持ち、受信したメッセージでその場で更新するテーブル
+class TickerTable:
+    def __init__(self, symbols, tz="Asia/Tokyo"):
+        self.symbols = np.array(list(symbols), dtype=object)
+        self.tz = tz
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        n = len(self.symbols)
+        self._floats = {col: np.full(n, np.nan) for col in TICKER_FIELDS.values()}
+        self._ints = {
+            col: np.zeros(n, dtype=np.int64) for col in TICKER_TIME_FIELDS.values()
+        }
+        self._ints["tickerUpdateTime"] = np.zeros(n, dtype=np.int64)
+        self._lock = threading.Lock()
+        self.n_messages = 0
+
+    # ティッカーのメッセージ (snapshot/delta) の値を該当する行に書き込む
+    # deltaは変化したフィールドだけを含むので、含まれるフィールドだけ更新する
+    def update(self, message):
+        data = message.get("data")
+        if not data:
+            return False
+        i = self._index.get(data.get("symbol"))
+        if i is None:
+            return False
+        with self._lock:
+            for field, col in TICKER_FIELDS.items():
+                value = data.get(field)
+                if value not in (None, ""):
+                    self._floats[col][i] = float(value)
+            for field, col in TICKER_TIME_FIELDS.items():
+                value = data.get(field)
+                if value not in (None, ""):
+                    self._ints[col][i] = int(value)
+            self._ints["tickerUpdateTime"][i] = int(message.get("ts", 0))
+            self.n_messages += 1
+        return True
+
+    # 現在の状態のスナップショットをdfで返す
+    # ロック中に配列を1回だけ複製し、dfはその配列をコピーせずに参照する
+    def snapshot(self):
+        with self._lock:
+            floats = {col: values.copy() for col, values in self._floats.items()}
+            ints = {col: values.copy() for col, values in self._ints.items()}
+        data = {"symbol": self.symbols, **floats}
+        for col, values in ints.items():
+            times = pd.to_datetime(values, unit="ms", utc=True).tz_convert(self.tz)
+            data[col] = pd.Series(times).where(values > 0)
+        return pd.DataFrame(data, copy=False)
+
+
+# ByBitの公開WebSocketでティッカーを購読し、TickerTableを更新し続けるクラス
+# 切断・ハンドシェイクの拒否・不正なメッセージの場合はジッター付きの指数バックオフで再接続して購読し直す
+# 呼び出し側はis_alive()、connected、last_error、last_message_timeで受信が続いているかを確認できる
+class TickerStream:
+    def __init__(
+        self,
+        table,
+        url=BYBIT_PUBLIC_LINEAR_URL,
+        topics_per_request=10,
+        ping_interval=20,
+        max_backoff=60,
+    ):
+        self.table = table
+        self.url = url
+        self.topics_per_request = topics_per_request
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread = None
+        self.n_connects = 0
+        # 接続中かどうか、最後に起きたエラー、最後にメッセージを受信した日時 (UNIXタイムスタンプ[s])
+        self.connected = False
+        self.last_error = None
+        self.last_message_time = None
+
+    # 購読リクエスト (1リクエストあたりの購読数に上限があるので分割する)
+    def _subscribe(self, websocket):
+        topics = [f"tickers.{symbol}" for symbol in self.table.symbols]
+        for i in range(0, len(topics), self.topics_per_request):
+            websocket.send(
+                json.dumps(
+                    {"op": "subscribe", "args": topics[i : i + self.topics_per_request]}
+                )
+            )
+
+    # 1回の接続で受信し続ける (stopされるか切断されるまで)
+    def _run_once(self):
+        with connect(self.url, open_timeout=10) as websocket:
+            self.n_connects += 1
+            self.connected = True
+            try:
+                self._subscribe(websocket)
+                last_ping = time.monotonic()
+                while not self._stop.is_set():
+                    if time.monotonic() - last_ping > self.ping_interval:
+                        websocket.send(json.dumps({"op": "ping"}))
+                        last_ping = time.monotonic()
+                    try:
+                        raw = websocket.recv(timeout=1)
+                    except TimeoutError:
+                        continue
+                    self.last_message_time = time.time()
+                    message = json.loads(raw)
+                    # オブジェクトでないメッセージ (配列・数値など) は読み飛ばす
+                    if not isinstance(message, dict):
+                        continue
+                    topic = message.get("topic")
+                    if isinstance(topic, str) and topic.startswith("tickers."):
+                        self.table.update(message)
+            finally:
+                self.connected = False
+
+    # 切断されたら再接続しながら受信し続ける (接続できた後のエラーではバックオフを最初からにする)
+    # 想定外のエラーで終了する場合もlast_errorに記録する
+    def run(self):
+        attempt = 0
+        try:
+            while not self._stop.is_set():
+                n_connects = self.n_connects
+                try:
+                    self._run_once()
+                    attempt = 0
+                except (WebSocketException, OSError, ValueError) as e:
+                    self.last_error = e
+                    if self.n_connects > n_connects:
+                        attempt = 0
+                    delay = random.uniform(0, min(self.max_backoff, 2**attempt))
+                    print(f"Ticker stream error: {e!r}, reconnecting in {delay:.1f}s")
+                    attempt += 1
+                    self._stop.wait(delay)
+        except Exception as e:
+            self.last_error = e
+            print(f"Ticker stream stopped: {e!r}")
+            raise
+
+    # 受信のスレッドが動いているかどうか
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # 別スレッドで受信を開始する
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# ティッカーを購読しながらinterval秒ごとにスナップショットを作ってon_snapshotに渡す関数
+# durationを指定するとその秒数で終了する (Noneの場合はKeyboardInterruptまで続ける)
+# 受信のスレッドが終了していた場合は古いスナップショットを渡さずにエラーにする
+def run_ticker_stream(
+    symbols, on_snapshot, interval=60, duration=None, url=BYBIT_PUBLIC_LINEAR_URL
+):
+    table = TickerTable(symbols)
+    stream = TickerStream(table, url=url).start()
+    started = time.monotonic()
+    try:
+        while duration is None or time.monotonic() - started < duration:
+            time.sleep(interval)
+            if not stream.is_alive():
+                raise RuntimeError(f"Ticker stream stopped: {stream.last_error!r}")
+            on_snapshot(table.snapshot())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.stop()
+    return table
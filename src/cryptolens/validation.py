@@ -0,0 +1,177 @@
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# データ品質のルールの定義
+# kind:
+#   "list_equal"    columnsの2つのリストの列が要素の順序まで等しい (欠損値は空のリストとみなす)
+#   "first_element" columns[1]の値がcolumns[0]のリストの最初の要素と等しい (columns[1]が欠損の行は対象外)
+#   "not_null"      columnsのすべての列が欠損値でない
+#   "positive"      columnsのすべての列が0より大きい (欠損値は違反としない)
+#   "fresh"         columnsの日時の列がparam (timedelta) より古くない (欠損値は違反とする)
+Rule = namedtuple("Rule", ["name", "kind", "columns", "param"], defaults=[None])
+
+
+# リストの列をArrowのListArrayにする関数 (欠損値はnullにする)
+def to_list_array(values):
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    elif not isinstance(values, pa.Array):
+        values = pa.array(values, from_pandas=True)
+    if pa.types.is_large_list(values.type):
+        values = values.cast(pa.list_(values.type.value_type))
+    return values
+
+
+# ListArrayの行ごとの長さ (欠損値は0) と、全要素を並べた配列を返す関数
+def list_parts(values):
+    lengths = pc.fill_null(pc.list_value_length(values), 0).to_numpy()
+    return lengths.astype(np.int64), values.flatten()
+
+
+# 2つのリストの列が行ごとに等しいかどうかの配列を返す関数 (要素をまとめて比べ、行ごとに集計する)
+def list_equal(left, right):
+    left_lengths, left_values = list_parts(to_list_array(left))
+    right_lengths, right_values = list_parts(to_list_array(right))
+    same_length = left_lengths == right_lengths
+    # 長さの等しい行の要素だけを取り出して比べる
+    left_mask = np.repeat(same_length, left_lengths)
+    right_mask = np.repeat(same_length, right_lengths)
+    left_values = left_values.filter(pa.array(left_mask))
+    right_values = right_values.filter(pa.array(right_mask))
+    if left_values.type != right_values.type:
+        right_values = right_values.cast(left_values.type)
+    element_equal = pc.fill_null(pc.equal(left_values, right_values), False)
+    element_equal = element_equal.to_numpy(zero_copy_only=False)
+    # 要素が違う位置を行番号に戻す
+    rows = np.repeat(np.flatnonzero(same_length), left_lengths[same_length])
+    equal = same_length.copy()
+    equal[rows[~element_equal]] = False
+    return equal
+
+
+# リストの列の最初の要素の配列を返す関数 (空のリストは欠損値)
+def first_elements(values):
+    lengths, flat = list_parts(to_list_array(values))
+    starts = np.cumsum(lengths) - lengths
+    index = np.where(lengths > 0, starts, -1)
+    if len(flat) == 0:
+        return pa.nulls(len(lengths), flat.type)
+    # 空のリストの行はnullを取り出す
+    return flat.take(pa.array(index, mask=index < 0))
+
+
+# データ品質のチェックの結果
+# results: ルールごとの {"rule", "kind", "columns", "checked", "failed", "ids"} (idsは違反した行のkeyの配列)
+class ValidationReport:
+    def __init__(self, results, created):
+        self.results = results
+        self.created = created
+
+    # 違反のあったルールがあるかどうか
+    @property
+    def ok(self):
+        return all(result["failed"] == 0 for result in self.results)
+
+    def to_frame(self):
+        return pd.DataFrame(self.results)
+
+    # JSONにできる形にする (idsは重複を除いた文字列のリストにする)
+    def to_dict(self):
+        rules = [
+            {**result, "ids": [str(id) for id in pd.unique(result["ids"])]}
+            for result in self.results
+        ]
+        return {"created": self.created.isoformat(), "rules": rules}
+
+    # レポートをJSONに保存する関数
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # 違反のあったルールごとに件数と先頭のidを表示する関数
+    def print_summary(self, n_ids=10):
+        for result in self.results:
+            if result["failed"] == 0:
+                continue
+            ids = ", ".join(map(str, pd.unique(result["ids"][: n_ids * 2])[:n_ids]))
+            more = "" if result["failed"] <= n_ids else ", ..."
+            print(
+                f'Warning: {result["failed"]} / {result["checked"]} rows violate "{result["rule"]}": {ids}{more}'
+            )
+
+
+# ルールに違反している行のマスクと、チェックの対象の行数を返す関数
+# list_arrays: 列名ごとのListArray (同じリストの列を使う複数のルールで変換を1回で済ませる)
+def check_rule(df, rule, now, list_arrays):
+    n = len(df)
+
+    def get_list_array(column):
+        if column not in list_arrays:
+            list_arrays[column] = to_list_array(df[column])
+        return list_arrays[column]
+
+    if rule.kind == "list_equal":
+        left, right = rule.columns
+        return ~list_equal(get_list_array(left), get_list_array(right)), n
+    if rule.kind == "first_element":
+        list_column, column = rule.columns
+        values = pa.array(df[column], from_pandas=True)
+        target = values.is_valid().to_numpy(zero_copy_only=False)
+        first = first_elements(get_list_array(list_column))
+        if first.type != values.type:
+            first = first.cast(values.type)
+        match = pc.fill_null(pc.equal(first, values), False)
+        mismatch = ~match.to_numpy(zero_copy_only=False)
+        return target & mismatch, int(target.sum())
+    if rule.kind == "not_null":
+        return df[list(rule.columns)].isna().any(axis=1).to_numpy(), n
+    if rule.kind == "positive":
+        values = df[list(rule.columns)].to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid="ignore"):
+            return (values <= 0).any(axis=1), n
+    if rule.kind == "fresh":
+        violated = np.zeros(n, dtype=bool)
+        for column in rule.columns:
+            values = df[column]
+            violated |= (values.isna() | ((now - values) > rule.param)).to_numpy()
+        return violated, n
+    raise ValueError(f"Unknown rule kind: {rule.kind}")
+
+
+# dfに対してルールをまとめてチェックし、ルールごとに違反した行のkeyを列挙したレポートを返す関数
+# dfにない列を使うルールは対象外にする
+# リストの列はArrowのListArrayにして処理する (pd.ArrowDtypeの列ならコピーせずにそのまま使う)
+def validate(df, rules, key="coinId", now=None):
+    if now is None:
+        now = pd.Timestamp.now(tz="Asia/Tokyo")
+    keys = df[key]
+    list_arrays = {}
+    results = []
+    for rule in rules:
+        missing = [column for column in rule.columns if column not in df.columns]
+        if missing:
+            print(f'Skipping rule "{rule.name}": missing columns {missing}')
+            continue
+        violated, checked = check_rule(df, rule, now, list_arrays)
+        results.append(
+            {
+                "rule": rule.name,
+                "kind": rule.kind,
+                "columns": list(rule.columns),
+                "checked": int(checked),
+                "failed": int(violated.sum()),
+                "ids": keys[violated].to_numpy(dtype=object),
+            }
+        )
+    created = now.to_pydatetime() if isinstance(now, pd.Timestamp) else now
+    return ValidationReport(results, created or datetime.now())
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+# requestsのレスポンスを作る関数 (bodyが辞書ならJSONにする)
+def make_response(status_code=200, body=None, headers=None, url=""):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.headers = CaseInsensitiveDict(
+        {"Content-Type": "application/json", **(headers or {})}
+    )
+    if body is None:
+        body = {}
+    response._content = body if isinstance(body, bytes) else json.dumps(body).encode()
+    # 本文は読み込み済み (stream=Falseで受信したレスポンスと同じ)
+    response._content_consumed = True
+    return response
+
+
+# 送られたリクエストを記録し、用意したレスポンス (または例外) を順番に返すセッション
+class StubSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False):
+        self.requests.append({"url": url, "params": params, "headers": headers or {}})
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        response.url = url
+        return response
+
+
+# HttpClientのホストのセッションをStubSessionに置き換えるフィクスチャ
+# stub_session(client, host, responses) で置き換えたStubSessionを返す
+@pytest.fixture
+def stub_session():
+    def install(client, host, responses):
+        session = StubSession(responses)
+        client._sessions[host] = session
+        return session
+
+    return install
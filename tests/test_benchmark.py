@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from cryptolens.benchmark import benchmark_refresh, find_regressions, load_history
+
+
+# 合計とfetch・storeの段階の処理時間 [s] の記録を作る関数
+def make_record(total, fetch, store):
+    return {
+        "totalSeconds": total,
+        "stages": {"fetch": {"wallSeconds": fetch}, "store": {"wallSeconds": store}},
+    }
+
+
+# thresholdを超えて遅くなった段階だけを返し、min_seconds未満の差と前回の時間が0の段階は無視することを確かめる
+def test_find_regressions():
+    previous = make_record(10.0, 1.0, 0.0)
+    record = make_record(10.5, 1.5, 0.2)
+    assert find_regressions(record, previous) == [
+        {"stage": "fetch", "previousSeconds": 1.0, "seconds": 1.5, "ratio": 1.5}
+    ]
+    assert find_regressions(record, previous, threshold=0.6) == []
+
+    # 割合はthresholdを超えても、差がmin_seconds未満ならばらつきとして無視する
+    previous = make_record(0.01, 0.01, 0.01)
+    record = make_record(0.05, 0.05, 0.05)
+    assert find_regressions(record, previous) == []
+    regressions = find_regressions(record, previous, min_seconds=0.01)
+    assert [r["stage"] for r in regressions] == ["total", "fetch", "store"]
+    assert regressions[0]["ratio"] == pytest.approx(5.0)
+
+    # 前回にない段階は比べない
+    del previous["stages"]["fetch"]
+    assert [r["stage"] for r in find_regressions(record, previous, 0.2, 0.01)] == [
+        "total",
+        "store",
+    ]
+
+
+# ファイルがなければ空のリストを返し、空行を読み飛ばすことを確かめる
+def test_load_history(tmp_path):
+    path = tmp_path / "history.jsonl"
+    assert load_history(str(path)) == []
+    path.write_text('{"a": 1}\n\n{"a": 2}\n', encoding="utf-8")
+    assert load_history(str(path)) == [{"a": 1}, {"a": 2}]
+
+
+# 前回の結果は条件 (config) が同じ記録だけから選び、結果を履歴に追記することを確かめる
+def test_benchmark_compares_same_config(tmp_path):
+    path = tmp_path / "history.jsonl"
+    config = {
+        "coins": 20,
+        "latency": 0.0,
+        "rateLimits": {},
+        "errorRate": 0.0,
+        "clientRateLimits": {},
+        "formats": ["parquet"],
+        "seed": 0,
+    }
+    # 同じ条件の記録は極端に速く、後に追記した別の条件の記録は極端に遅い
+    l_history = [
+        {"config": config, **make_record(1e-6, 1e-6, 1e-6), "stages": {}},
+        {"config": {**config, "coins": 21}, **make_record(1e6, 1e6, 1e6)},
+    ]
+    path.write_text(
+        "".join(json.dumps(record) + "\n" for record in l_history), encoding="utf-8"
+    )
+
+    df = benchmark_refresh(sizes=(20,), history_path=str(path))
+    assert df["coins"].tolist() == [20]
+    l_history = load_history(str(path))
+    assert len(l_history) == 3
+    record = l_history[-1]
+    assert record["config"] == config
+    assert record["rows"] == df["rows"].iloc[0] > 0
+    assert [r["stage"] for r in record["regressions"]] == ["total"]
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+from conftest import make_response
+
+from cryptolens.cache import CacheMissError, ResponseCache
+from cryptolens.client import HttpClient
+
+COINGECKO_URL = "https://api.coingecko.com/api/v3/coins/categories"
+BYBIT_URL = "https://api.bybit.com/v5/market/instruments-info"
+
+
+def make_client(tmp_path, replay=False):
+    cache = ResponseCache(
+        str(tmp_path / "cache.sqlite"),
+        ttls={"api.coingecko.com/*": 3600, "api.bybit.com/*": 3600},
+        replay=replay,
+    )
+    return HttpClient(cache=cache, max_retries=0)
+
+
+# キャッシュの取得日時をseconds秒前にする
+def age_entries(cache, seconds):
+    with cache._lock:
+        cache._conn.execute(
+            "UPDATE responses SET fetched_at = ?", (time.time() - seconds,)
+        )
+        cache._conn.commit()
+
+
+# 有効期間内は通信せず、期限切れ後は条件付きリクエストで再検証し、304ならキャッシュを使い続けることを確かめる
+def test_cache_revalidates_after_ttl(tmp_path, stub_session):
+    client = make_client(tmp_path)
+    session = stub_session(
+        client,
+        "api.coingecko.com",
+        [
+            make_response(body=[{"id": "defi"}], headers={"ETag": '"v1"'}),
+            make_response(304),
+        ],
+    )
+    assert client.get(COINGECKO_URL).json() == [{"id": "defi"}]
+    assert client.get(COINGECKO_URL).json() == [{"id": "defi"}]
+    assert len(session.requests) == 1
+
+    age_entries(client.cache, 7200)
+    assert client.get(COINGECKO_URL).json() == [{"id": "defi"}]
+    assert len(session.requests) == 2
+    assert session.requests[1]["headers"]["If-None-Match"] == '"v1"'
+
+    # 304で取得日時を更新したため、再び有効期間内になる
+    assert client.get(COINGECKO_URL).json() == [{"id": "defi"}]
+    assert len(session.requests) == 2
+    stats = client.stats["api.coingecko.com/api/v3/coins/categories"]
+    assert stats["cache_hit"] == 2
+    assert stats["not_modified"] == 1
+
+
+# 期限切れ後に200が返った場合は新しい本文に置き換えることを確かめる
+def test_cache_replaces_expired_entry(tmp_path, stub_session):
+    client = make_client(tmp_path)
+    stub_session(
+        client,
+        "api.coingecko.com",
+        [make_response(body=[{"id": "defi"}]), make_response(body=[{"id": "meme"}])],
+    )
+    client.get(COINGECKO_URL)
+    age_entries(client.cache, 7200)
+    assert client.get(COINGECKO_URL).json() == [{"id": "meme"}]
+    assert client.get(COINGECKO_URL).json() == [{"id": "meme"}]
+
+
+# リプレイモードでは期限に関係なくキャッシュを返し、キャッシュにないリクエストは例外にすることを確かめる
+def test_cache_replay(tmp_path, stub_session):
+    client = make_client(tmp_path)
+    stub_session(client, "api.coingecko.com", [make_response(body=[{"id": "defi"}])])
+    client.get(COINGECKO_URL, params={"order": "name"})
+    client.cache.close()
+
+    client = make_client(tmp_path, replay=True)
+    age_entries(client.cache, 7 * 86400)
+    session = stub_session(client, "api.coingecko.com", [])
+    assert client.get(COINGECKO_URL, params={"order": "name"}).json() == [
+        {"id": "defi"}
+    ]
+    with pytest.raises(CacheMissError):
+        client.get(COINGECKO_URL, params={"order": "market_cap"})
+    assert session.requests == []
+
+
+# Bybitが200で返したエラー (retCodeが0以外) はキャッシュしないことを確かめる
+def test_cache_skips_bybit_errors(tmp_path, stub_session):
+    client = make_client(tmp_path)
+    ok = {"retCode": 0, "retMsg": "OK", "result": {"list": []}}
+    session = stub_session(
+        client,
+        "api.bybit.com",
+        [
+            make_response(body={"retCode": 10006, "retMsg": "Too many visits"}),
+            make_response(body=ok),
+        ],
+    )
+    assert client.get(BYBIT_URL).json()["retCode"] == 10006
+    assert client.get(BYBIT_URL).json() == ok
+    assert client.get(BYBIT_URL).json() == ok
+    assert len(session.requests) == 2
+
+
+# max_ageを指定して開くと、取得日時がmax_ageより古いレスポンスだけを削除することを確かめる
+def test_cache_prunes_old_entries(tmp_path, stub_session):
+    client = make_client(tmp_path)
+    stub_session(
+        client,
+        "api.coingecko.com",
+        [make_response(body=[{"id": "defi"}]), make_response(body=[{"id": "meme"}])],
+    )
+    client.get(COINGECKO_URL, params={"page": 1})
+    age_entries(client.cache, 8 * 86400)
+    client.get(COINGECKO_URL, params={"page": 2})
+    client.cache.close()
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_age=7 * 86400)
+    assert cache.get(cache.make_key(COINGECKO_URL, {"page": 1})) is None
+    assert cache.get(cache.make_key(COINGECKO_URL, {"page": 2})) is not None
+    assert cache.prune(7 * 86400) == 0
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cryptolens.categories import CategoryIndex
+
+
+# 5件の仮想通貨と3件のカテゴリ (Gamingには仮想通貨がなく、Memeはカテゴリデータにない)
+# L1: coin-a, coin-e / DeFi: coin-a, coin-b, coin-c / Meme: coin-c / coin-dはカテゴリなし
+# coin-cは時価総額が欠損値、coin-eは時価総額が0
+def make_frames():
+    df_coins = pd.DataFrame(
+        {
+            "coinId": ["coin-a", "coin-b", "coin-c", "coin-d", "coin-e"],
+            "categories": [
+                ["L1", "DeFi"],
+                ["DeFi", ""],
+                ["DeFi", "Meme", "DeFi"],
+                None,
+                ["L1"],
+            ],
+            "coinCap": [100.0, 300.0, np.nan, 50.0, 0.0],
+            "priceChg%24h": [10.0, 20.0, 50.0, 1.0, -5.0],
+            "buyRatio": [0.6, 0.4, np.nan, 0.9, 0.5],
+        }
+    )
+    df_categories = pd.DataFrame({"categoryName": ["L1", "DeFi", "Gaming"]})
+    return df_coins, df_categories
+
+
+# カテゴリデータの順にカテゴリを並べ、ないカテゴリ名は後ろに追加し、空・重複したカテゴリ名は除くことを確かめる
+def test_build():
+    index = CategoryIndex.build(*make_frames())
+    assert index.category_names.tolist() == ["L1", "DeFi", "Gaming", "Meme"]
+    assert index.n_listed_categories == 3
+    assert index.matrix.toarray().tolist() == [
+        [1, 1, 0, 0],
+        [0, 1, 0, 0],
+        [0, 1, 0, 1],
+        [0, 0, 0, 0],
+        [1, 0, 0, 0],
+    ]
+    assert index.categories_of("coin-c").tolist() == ["DeFi", "Meme"]
+    assert index.coins_in("DeFi").tolist() == ["coin-a", "coin-b", "coin-c"]
+    assert index.coin_counts().tolist() == [2, 3, 0, 1]
+    assert index.unlisted_categories().tolist() == ["Meme"]
+    assert index.empty_categories().tolist() == ["Gaming"]
+
+
+# npzに保存して読み込んだインデックスが同じ疎行列・id・カテゴリ名を持つことを確かめる
+def test_save_load_round_trip(tmp_path):
+    index = CategoryIndex.build(*make_frames())
+    path = str(tmp_path / "index" / "categories.npz")
+    index.save(path)
+    loaded = CategoryIndex.load(path)
+    assert loaded.coin_ids.tolist() == index.coin_ids.tolist()
+    assert loaded.category_names.tolist() == index.category_names.tolist()
+    assert loaded.n_listed_categories == 3
+    assert loaded.matrix.indptr.tolist() == index.matrix.indptr.tolist()
+    assert loaded.matrix.indices.tolist() == index.matrix.indices.tolist()
+    assert (loaded.matrix != index.matrix).nnz == 0
+    assert loaded.coins_in("Meme").tolist() == ["coin-c"]
+
+
+# 時価総額での加重平均と単純平均を手計算した値で確かめる
+# (時価総額が欠損値・0の仮想通貨は加重平均に効かず、仮想通貨のないカテゴリは欠損値)
+def test_aggregate():
+    df_coins, df_categories = make_frames()
+    index = CategoryIndex.build(df_coins, df_categories)
+    df = index.aggregate(df_coins).set_index("categoryName")
+    assert df["coinCount"].tolist() == [2, 3, 0, 1]
+    assert df["coinCap"].tolist() == [100.0, 400.0, 0.0, 0.0]
+    # L1: (100 * 10 + 0 * -5) / 100、DeFi: (100 * 10 + 300 * 20) / 400
+    assert df.loc["L1", "priceChg%24h"] == pytest.approx(10.0)
+    assert df.loc["DeFi", "priceChg%24h"] == pytest.approx(17.5)
+    assert np.isnan(df.loc["Gaming", "priceChg%24h"])
+    assert np.isnan(df.loc["Meme", "priceChg%24h"])
+    # 単純平均は欠損値を除く (DeFiのcoin-c)
+    assert df.loc["L1", "buyRatio"] == pytest.approx(0.55)
+    assert df.loc["DeFi", "buyRatio"] == pytest.approx(0.5)
+    assert np.isnan(df.loc["Gaming", "buyRatio"])
+    # 読み込んだスナップショットのようにcoinIdがCategoricalでも同じ結果になる
+    df_coins["coinId"] = df_coins["coinId"].astype("category")
+    pd.testing.assert_frame_equal(
+        index.aggregate(df_coins).set_index("categoryName"), df
+    )
+
+
+# 共起行列は対称で、対角成分はカテゴリの仮想通貨の数になることを確かめる
+def test_cooccurrence():
+    index = CategoryIndex.build(*make_frames())
+    matrix = index.cooccurrence().toarray()
+    assert (matrix == matrix.T).all()
+    assert np.diag(matrix).tolist() == [2, 3, 0, 1]
+    assert matrix.tolist() == [
+        [2, 1, 0, 0],
+        [1, 3, 0, 1],
+        [0, 0, 0, 0],
+        [0, 1, 0, 1],
+    ]
+    related = index.related_categories("DeFi")
+    assert related.to_dict() == {"L1": 1, "Meme": 1}
+
+
+# 値の大きい (小さい) 順にk個を返し、欠損値の仮想通貨は除き、kが仮想通貨の数より多くてもよいことを確かめる
+def test_top_movers():
+    df_coins, df_categories = make_frames()
+    index = CategoryIndex.build(df_coins, df_categories)
+    changes = index.align(df_coins, "priceChg%24h")
+    top = index.top_movers("DeFi", changes, k=2)
+    assert top.index.tolist() == ["coin-c", "coin-b"]
+    assert top.tolist() == [50.0, 20.0]
+    bottom = index.top_movers("DeFi", changes, k=2, ascending=True)
+    assert bottom.index.tolist() == ["coin-a", "coin-b"]
+    assert index.top_movers("L1", changes, k=5).index.tolist() == ["coin-a", "coin-e"]
+
+    ratios = index.align(df_coins, "buyRatio")
+    assert index.top_movers("DeFi", ratios).to_dict() == {"coin-a": 0.6, "coin-b": 0.4}
+    assert index.top_movers("Gaming", ratios).empty
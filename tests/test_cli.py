@@ -0,0 +1,149 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+from conftest import make_response
+
+from cryptolens import api, cli
+from cryptolens.klines import INTERVALS, KlineStore
+from cryptolens.ratios import PERIODS, RatioHistory
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+HEAVY_MODULES = ["pandas", "pyarrow", "polars", "scipy"]
+
+# テストの中で固定する現在時刻 (期間・足の区切りの途中)
+NOW = datetime(2024, 6, 1, 10, 30).timestamp()
+
+
+# 別のプロセスでコードを実行し、読み込まれた重い依存ライブラリのリストを返す
+def loaded_heavy_modules(code):
+    script = f"""
+import json, sys
+{code}
+print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))
+"""
+    env = {**os.environ, "PYTHONPATH": SRC_DIR}
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+# cryptolens.cliのimportと--helpでは重い依存ライブラリを読み込まないことを確かめる
+def test_import_and_help_are_light():
+    assert loaded_heavy_modules("import cryptolens.cli") == []
+    code = """
+from cryptolens.cli import main
+try:
+    main(["--help"])
+except SystemExit:
+    pass
+"""
+    assert loaded_heavy_modules(code) == []
+
+
+# statusは履歴ストアのmanifestからスナップショットの件数と最新のスナップショットを表示することを確かめる
+def test_status(tmp_path, capsys):
+    data_dir = str(tmp_path)
+    assert cli.main(["--data-dir", data_dir, "status"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "df_coins: no snapshots",
+        "df_categories: no snapshots",
+    ]
+
+    coins_store, _ = api.open_stores(data_dir)
+    df = pd.DataFrame({"coinId": ["bitcoin", "ethereum"], "symbol": ["BTC", "ETH"]})
+    coins_store.append(df, datetime(2024, 6, 1, 9, 0))
+    coins_store.append(df.head(1), datetime(2024, 6, 1, 10, 0))
+    assert cli.main(["--data-dir", data_dir, "status"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("df_coins: 2 snapshots, latest 2024-06-01T10:00:00")
+    assert lines[0].endswith("(1 rows)")
+    assert lines[1] == "df_categories: no snapshots"
+
+
+# ByBitの売買比率とローソク足の期間内のレコードを返すセッション (送られたリクエストを記録する)
+class BybitSession:
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False):
+        self.requests.append(url)
+        if url.endswith("/account-ratio"):
+            step = PERIODS[params["period"]]
+            timestamps = range(params["endTime"], params["startTime"] - 1, -step)
+            result = {
+                "list": [{"timestamp": str(t), "buyRatio": "0.6"} for t in timestamps],
+                "nextPageCursor": "",
+            }
+        else:
+            step = INTERVALS[params["interval"]]
+            timestamps = range(params["end"], params["start"] - 1, -step)
+            result = {
+                "list": [[str(t), "1", "1", "1", "2", "1", "1"] for t in timestamps]
+            }
+        response = make_response(body={"retCode": 0, "retMsg": "OK", "result": result})
+        response.url = url
+        return response
+
+
+# 並列に取得した行の順序によらずに比べるため、symbol・timestamp順に並べたdfを返す
+def load_sorted(store, key):
+    df = store.load(key).astype({"symbol": str})
+    return df.sort_values(["symbol", "timestamp"], ignore_index=True)
+
+
+# 現在時刻を固定したdatetime (api.fetch_dataの取得開始時刻に使う)
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(NOW, tz)
+
+
+# fetch --replayは通信せず、事前に保存したレスポンスのキャッシュから売買比率とローソク足を取得することを確かめる
+def test_fetch_replay_uses_seeded_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(time, "time", lambda: NOW)
+    monkeypatch.setattr(api, "datetime", FixedDatetime)
+    data_dir = str(tmp_path)
+    coins_store, _ = api.open_stores(data_dir)
+    df_coins = pd.DataFrame(
+        {"coinId": ["bitcoin", "ethereum"], "symbol": ["BTCUSDT", "ETHUSDT"]}
+    )
+    coins_store.append(df_coins, FixedDatetime.now())
+    options = ["--ratio-periods", "1d", "--ratio-days", "5"]
+    options += ["--kline-interval", "60", "--kline-days", "1"]
+
+    # 通信して取得した結果を期待値にし、レスポンスのキャッシュだけを残す
+    client = api.make_client(data_dir)
+    session = BybitSession()
+    client._sessions["api.bybit.com"] = session
+    api.fetch_data(client, df_coins, data_dir, ["1d"], 5, "60", 1)
+    client.cache.close()
+    assert len(session.requests) == 4
+    df_ratios = load_sorted(RatioHistory(os.path.join(data_dir, "ratio_history")), "1d")
+    df_klines = load_sorted(KlineStore(os.path.join(data_dir, "klines")), "60")
+    for name in ["ratio_history", "klines"]:
+        os.rename(os.path.join(data_dir, name), os.path.join(data_dir, f"{name}_live"))
+    capsys.readouterr()
+
+    assert cli.main(["--data-dir", data_dir, "--replay", "fetch", *options]) == 0
+    out = capsys.readouterr().out
+    assert "Error" not in out
+    assert f"Ratio history rows added: {{'1d': {len(df_ratios)}}}" in out
+    assert f"Kline rows added: {len(df_klines)}" in out
+    pd.testing.assert_frame_equal(
+        load_sorted(RatioHistory(os.path.join(data_dir, "ratio_history")), "1d"),
+        df_ratios,
+    )
+    pd.testing.assert_frame_equal(
+        load_sorted(KlineStore(os.path.join(data_dir, "klines")), "60"), df_klines
+    )
+    assert os.path.exists(os.path.join(data_dir, "metrics", "run_report.json"))
@@ -0,0 +1,172 @@
+from email.utils import formatdate
+
+import pytest
+import requests
+from conftest import make_response
+
+from cryptolens import client as client_module
+from cryptolens.client import HttpClient
+
+URL = "https://api.bybit.com/v5/market/tickers"
+ENDPOINT = "api.bybit.com/v5/market/tickers"
+
+
+# time.sleepで進み、待った秒数を記録する時計 (HttpClientのtimeモジュールの代わり)
+class FakeTime:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(client_module, "time", clock)
+    return clock
+
+
+# 5xxはジッター付きの指数バックオフ (0からbackoff * 2^試行回数までの乱数) で待ってリトライすることを確かめる
+def test_retries_server_errors_with_backoff(clock, stub_session, monkeypatch):
+    monkeypatch.setattr(client_module.random, "uniform", lambda low, high: high)
+    client = HttpClient(backoff=1.0, max_backoff=3.0)
+    session = stub_session(
+        client,
+        "api.bybit.com",
+        [make_response(503), make_response(502), make_response(500), make_response()],
+    )
+    assert client.get(URL).status_code == 200
+    assert len(session.requests) == 4
+    assert clock.sleeps == [1.0, 2.0, 3.0]
+    stats = client.stats[ENDPOINT]
+    assert (stats["success"], stats["retry"], stats["error"]) == (1, 3, 0)
+
+
+# リトライし尽くした場合は最後のレスポンスを返し、4xx (429以外) はリトライしないことを確かめる
+def test_gives_up_after_max_retries(clock, stub_session):
+    client = HttpClient(max_retries=2)
+    session = stub_session(
+        client,
+        "api.bybit.com",
+        [
+            make_response(500),
+            make_response(500),
+            make_response(500),
+            make_response(404),
+        ],
+    )
+    assert client.get(URL).status_code == 500
+    assert len(session.requests) == 3
+    assert client.get(URL).status_code == 404
+    assert len(session.requests) == 4
+    stats = client.stats[ENDPOINT]
+    assert (stats["retry"], stats["error"], stats["success"]) == (2, 2, 0)
+
+
+# 通信エラーはリトライし、リトライし尽くした場合は例外を送出することを確かめる
+def test_retries_connection_errors(clock, stub_session):
+    client = HttpClient(max_retries=1)
+    stub_session(
+        client,
+        "api.bybit.com",
+        [requests.ConnectionError("reset"), make_response()],
+    )
+    assert client.get(URL).status_code == 200
+
+    stub_session(
+        client,
+        "api.bybit.com",
+        [requests.ConnectionError("reset"), requests.ConnectionError("reset")],
+    )
+    with pytest.raises(requests.ConnectionError):
+        client.get(URL)
+    stats = client.stats[ENDPOINT]
+    assert (stats["retry"], stats["error"], stats["success"]) == (2, 1, 1)
+
+
+# 429のRetry-Afterの秒数 (max_backoffまで) だけホスト全体を待たせてからリトライすることを確かめる
+def test_honors_retry_after(clock, stub_session):
+    client = HttpClient(max_backoff=10.0)
+    session = stub_session(
+        client,
+        "api.bybit.com",
+        [
+            make_response(429, headers={"Retry-After": "3"}),
+            make_response(429, headers={"Retry-After": "60"}),
+            make_response(),
+        ],
+    )
+    assert client.get(URL).status_code == 200
+    assert len(session.requests) == 3
+    assert clock.sleeps == [3.0, 10.0]
+    assert client.stats[ENDPOINT]["throttle"] == 2
+
+
+# HTTPの日時のRetry-Afterはその時刻までの秒数にし、0からmax_backoffの範囲に収めることを確かめる
+def test_honors_retry_after_http_date(clock, stub_session):
+    client = HttpClient(max_backoff=10.0)
+    session = stub_session(
+        client,
+        "api.bybit.com",
+        [
+            make_response(429, headers={"Retry-After": formatdate(clock.now + 4)}),
+            make_response(429, headers={"Retry-After": formatdate(clock.now + 600)}),
+            make_response(429, headers={"Retry-After": formatdate(clock.now - 30)}),
+            make_response(),
+        ],
+    )
+    assert client.get(URL).status_code == 200
+    assert len(session.requests) == 4
+    assert clock.sleeps == [4.0, 10.0]
+    assert client.stats[ENDPOINT]["throttle"] == 3
+
+
+# X-Bapi-Limit-Statusの残りが0なら解除時刻まで、少ない場合は解除時刻まで均等に間隔を空けることを確かめる
+def test_paces_by_bybit_limit_headers(clock, stub_session):
+    client = HttpClient()
+    reset_ms = str(int((clock.now + 5) * 1000))
+    stub_session(
+        client,
+        "api.bybit.com",
+        [
+            make_response(
+                headers={
+                    "X-Bapi-Limit-Status": "0",
+                    "X-Bapi-Limit-Reset-Timestamp": reset_ms,
+                }
+            ),
+            make_response(
+                headers={
+                    "X-Bapi-Limit-Status": "4",
+                    "X-Bapi-Limit-Reset-Timestamp": str(int((clock.now + 7) * 1000)),
+                }
+            ),
+            make_response(),
+            make_response(headers={"X-Bapi-Limit-Status": "50"}),
+            make_response(),
+        ],
+    )
+    client.get(URL)
+    assert clock.sleeps == []
+    # 残り0: 解除時刻 (5秒後) まで待つ
+    client.get(URL)
+    assert clock.sleeps == [pytest.approx(5.0)]
+    # 残り4: 解除時刻までの2秒を4回で分けて0.5秒ずつ空ける
+    client.get(URL)
+    assert clock.sleeps[1:] == [pytest.approx(0.5)]
+    # 残りが多い・解除時刻がない場合は待たない
+    client.get(URL)
+    client.get(URL)
+    assert len(clock.sleeps) == 2
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from cryptolens.cache import ResponseCache
+from cryptolens.client import HttpClient
+from cryptolens.coingecko import (
+    get_all_info,
+    get_coingecko_coins_list,
+    get_stale_detail_ids,
+)
+from cryptolens.standin import ApiStandInServer
+
+DETAIL_ENDPOINT = "api.coingecko.com/coins/{id}"
+
+
+# 詳細情報が取得済みで新しいidは/coins/{id}を呼ばず、/coins/marketsだけで市場データを更新することを確かめる
+def test_get_all_info_fetches_only_stale_details():
+    with ApiStandInServer(30) as server:
+        client = HttpClient(base_urls=server.base_urls)
+        l_ids = [f"coin-{i}" for i in range(30)]
+
+        df_info = get_all_info(client, l_ids, "key")
+        assert client.stats[DETAIL_ENDPOINT]["success"] == 30
+        assert get_stale_detail_ids(df_info) == []
+
+        # 5件は詳細情報が古く、5件は詳細情報の列が未取得
+        df_known = df_info.copy()
+        df_known.loc[:4, "detailUpdateTime"] -= timedelta(days=30)
+        df_known.loc[5:9, ["categories", "xFollowers", "watchlistUsers"]] = None
+        df_known.loc[5:9, "detailUpdateTime"] = None
+        n_requests = server.n_requests
+        df_info = get_all_info(client, l_ids, "key", df_known=df_known)
+
+        assert client.stats[DETAIL_ENDPOINT]["success"] == 40
+        assert server.n_requests - n_requests == 10 + 1
+        assert sorted(df_info["coinId"]) == sorted(l_ids)
+        assert df_info["currentPrice"].notna().all()
+
+
+# 仮想通貨一覧をストリーミングで受信しながらキャッシュに書き込み、2回目はキャッシュから同じ一覧を作ることを確かめる
+def test_coins_list_streams_through_cache(tmp_path):
+    with ApiStandInServer(500) as server:
+        cache = ResponseCache(
+            str(tmp_path / "cache.sqlite"), ttls={"api.coingecko.com/*": 3600}
+        )
+        client = HttpClient(cache=cache, base_urls=server.base_urls)
+        df = get_coingecko_coins_list(client, "key")
+        assert len(df) == 500
+        assert df["coinPlatforms"].map(len).sum() == 250
+
+        n_requests = server.n_requests
+        df_cached = get_coingecko_coins_list(client, "key")
+        assert server.n_requests == n_requests
+        assert client.stats["api.coingecko.com/api/v3/coins/list"]["cache_hit"] == 1
+        assert df_cached.equals(df)
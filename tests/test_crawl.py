@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import struct
+import time
+
+import pytest
+
+from cryptolens import ratelimit
+from cryptolens.client import HttpClient
+from cryptolens.crawl import crawl_detail_info
+from cryptolens.journal import CrawlJournal
+from cryptolens.ratelimit import FileTokenBucket
+from cryptolens.standin import ApiStandInServer
+
+
+# time.timeとtime.sleepの代わりに、sleepした分だけ進む時計
+class FakeTime:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+# 同じファイルのバケット同士でトークンを分け合い、経過時間に応じて上限まで補充することを確かめる
+def test_file_token_bucket_shares_and_refills(tmp_path, monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    path = str(tmp_path / "bucket")
+    a = FileTokenBucket(path, 5, 1.0)
+    b = FileTokenBucket(path, 5, 1.0)
+    try:
+        assert a.acquire(3) == 0
+        assert b.acquire(2) == 0
+        # 残りは0で、1件分の補充 (1 / 5秒) を待つ
+        assert b.acquire() == pytest.approx(0.2)
+        assert a._try_acquire(1) == pytest.approx(0.2)
+
+        # 長く待っても補充はcapacityまで
+        clock.sleep(10)
+        assert a.acquire(5) == 0
+        assert b._try_acquire(1) == pytest.approx(0.2)
+        with open(path, "rb") as f:
+            available, updated = struct.unpack("<dd", f.read())
+        assert available == pytest.approx(0)
+        assert updated == clock.now
+    finally:
+        a.close()
+        b.close()
+
+
+def acquire_tokens(path, n_tokens, capacity, period, times):
+    bucket = FileTokenBucket(path, capacity, period)
+    for _ in range(n_tokens):
+        bucket.acquire()
+        times.append(time.monotonic())
+    bucket.close()
+
+
+# 2つのプロセスが同じファイルのバケットを使うと、合計がperiod秒あたりcapacity回を超えないことを確かめる
+@pytest.mark.skipif(ratelimit.fcntl is None, reason="requires fcntl")
+def test_file_token_bucket_limits_across_processes(tmp_path):
+    path = str(tmp_path / "bucket")
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        times = manager.list()
+        processes = [
+            context.Process(target=acquire_tokens, args=(path, 10, 5, 0.5, times))
+            for _ in range(2)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            assert process.exitcode == 0
+        times = sorted(times)
+
+    # 20件のうち最初の5件はすぐに取得でき、残りの15件は10件/秒で補充される
+    assert len(times) == 20
+    assert times[-1] - times[0] >= 1.5 * 0.9
+    # どの1秒間でも、取得できるのはcapacity + 補充分の15件まで
+    for i, start in enumerate(times):
+        assert sum(1 for t in times[i:] if t < start + 1.0) <= 15 + 1
+
+
+# idをAPIキーごとのシャードに分けて取得し、シャードのジャーナルを取り込んで全件のdfを作ることを確かめる
+# (前回の実行で取り込めなかったシャードのジャーナルは最初に取り込み、そのidは取得しない)
+def test_crawl_detail_info_shards_and_merges(tmp_path):
+    l_ids = [f"coin-{i}" for i in range(40)]
+    with ApiStandInServer(40) as server:
+        client = HttpClient(
+            base_urls=server.base_urls, rate_limits={"api.coingecko.com": (100, 1)}
+        )
+        journal_path = str(tmp_path / "journal.jsonl")
+        with CrawlJournal(f"{journal_path}.3") as leftover:
+            leftover.record("coin-0", {"coinId": "coin-0", "coinName": "Leftover"})
+
+        with CrawlJournal(journal_path) as journal:
+            df = crawl_detail_info(
+                client,
+                l_ids,
+                journal,
+                ["key-a", "key-b"],
+                data_dir=str(tmp_path),
+                workers_per_key=2,
+            )
+            assert set(journal.done()) == set(l_ids)
+
+        assert sorted(df["coinId"]) == sorted(l_ids)
+        assert df.set_index("coinId").loc["coin-0", "coinName"] == "Leftover"
+        # 残りの39件を4つのシャードに分け、シャードiはi % 2番目のAPIキーを使う
+        assert server.requests_by_key["key-a"] == 10 + 10
+        assert server.requests_by_key["key-b"] == 10 + 9
+        assert client.stats["api.coingecko.com/coins/{id}"]["success"] == 39
+        # APIキーごとのトークンバケットのファイル
+        assert len(os.listdir(tmp_path / "ratelimit")) == 2
+        assert not any(
+            name.startswith("journal.jsonl.") for name in os.listdir(tmp_path)
+        )
@@ -0,0 +1,197 @@
+import json
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pyarrow as pa
+
+from cryptolens.diff import (
+    Threshold,
+    diff_tables,
+    read_last_line,
+    update_change_feed,
+)
+from cryptolens.schema import KEY
+from cryptolens.store import HistoryStore
+
+THRESHOLDS = [Threshold("buyRatio", 0.5), Threshold("buyRatio", 0.6)]
+
+
+# symbol, coinId (辞書エンコード), categories, buyRatio (float32) のテーブルを作る関数
+def make_table(rows):
+    return pa.table(
+        {
+            "symbol": pa.array([row[0] for row in rows]).cast(KEY),
+            "coinId": pa.array([row[1] for row in rows]).cast(KEY),
+            "categories": pa.array([row[2] for row in rows], pa.list_(pa.string())),
+            "buyRatio": pa.array([row[3] for row in rows], pa.float32()),
+        }
+    )
+
+
+# 変化のテーブルからtypeの行を欠損値の項目を除いた辞書のリストにする関数
+def events_of(events, type):
+    return [
+        {key: value for key, value in event.items() if value is not None}
+        for event in events.to_pylist()
+        if event["type"] == type
+    ]
+
+
+# 今回だけにある行は新規上場、前回だけにある行は上場廃止として記録することを確かめる
+# (symbolが同じでもcoinIdが違えば別の行とみなす)
+def test_diff_listing_and_delisting():
+    previous = make_table(
+        [("BTCUSDT", "bitcoin", [], 0.5), ("XUSDT", "x-old", [], 0.5)]
+    )
+    current = make_table([("XUSDT", "x-new", [], 0.5), ("BTCUSDT", "bitcoin", [], 0.5)])
+    events = diff_tables(previous, current, THRESHOLDS)
+    assert events_of(events, "listing") == [
+        {"type": "listing", "symbol": "XUSDT", "coinId": "x-new"}
+    ]
+    assert events_of(events, "delisting") == [
+        {"type": "delisting", "symbol": "XUSDT", "coinId": "x-old"}
+    ]
+    assert events.num_rows == 2
+
+
+# 両方にある行の追加・削除されたカテゴリだけを記録し、新規上場の行のカテゴリは記録しないことを確かめる
+def test_diff_categories():
+    previous = make_table(
+        [
+            ("BTCUSDT", "bitcoin", ["Layer 1", "PoW"], 0.5),
+            ("ETHUSDT", "ethereum", ["Layer 1"], 0.5),
+        ]
+    )
+    current = make_table(
+        [
+            ("ETHUSDT", "ethereum", ["Layer 1", "Smart Contract"], 0.5),
+            ("BTCUSDT", "bitcoin", ["PoW"], 0.5),
+            ("SOLUSDT", "solana", ["Layer 1"], 0.5),
+        ]
+    )
+    events = diff_tables(previous, current, THRESHOLDS)
+    assert events_of(events, "category_added") == [
+        {
+            "type": "category_added",
+            "symbol": "ETHUSDT",
+            "coinId": "ethereum",
+            "category": "Smart Contract",
+        }
+    ]
+    assert events_of(events, "category_removed") == [
+        {
+            "type": "category_removed",
+            "symbol": "BTCUSDT",
+            "coinId": "bitcoin",
+            "category": "Layer 1",
+        }
+    ]
+
+
+# しきい値をまたいだ値を上向き・下向きに記録し、どちらかが欠損している行は記録しないことを確かめる
+def test_diff_thresholds():
+    previous = make_table(
+        [
+            ("AUSDT", "a", [], 0.45),
+            ("BUSDT", "b", [], 0.65),
+            ("CUSDT", "c", [], None),
+            ("DUSDT", "d", [], 0.3),
+            ("EUSDT", "e", [], 0.55),
+        ]
+    )
+    current = make_table(
+        [
+            ("AUSDT", "a", [], 0.55),
+            ("BUSDT", "b", [], 0.55),
+            ("CUSDT", "c", [], 0.7),
+            ("DUSDT", "d", [], None),
+            ("EUSDT", "e", [], 0.58),
+        ]
+    )
+    events = diff_tables(previous, current, THRESHOLDS)
+    assert events_of(events, "threshold_up") == [
+        {
+            "type": "threshold_up",
+            "symbol": "AUSDT",
+            "coinId": "a",
+            "column": "buyRatio",
+            "level": 0.5,
+            "previous": 0.45,
+            "current": 0.55,
+        }
+    ]
+    assert events_of(events, "threshold_down") == [
+        {
+            "type": "threshold_down",
+            "symbol": "BUSDT",
+            "coinId": "b",
+            "column": "buyRatio",
+            "level": 0.6,
+            "previous": 0.65,
+            "current": 0.55,
+        }
+    ]
+    assert events.num_rows == 2
+
+
+# block_sizeより長い行も、ファイルの最後の行として読めることを確かめる
+def test_read_last_line(tmp_path):
+    path = tmp_path / "feed.jsonl"
+    assert read_last_line(str(path)) is None
+    lines = [{"n": 1}, {"n": 2, "pad": "x" * 100}]
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    assert read_last_line(str(path), block_size=16) == lines[-1]
+
+
+# フィードが空の場合は最新のスナップショットだけを記録し、
+# その後はまとめの行のスナップショットより後のスナップショットだけを記録することを確かめる
+def test_update_change_feed_resumes(tmp_path):
+    store = HistoryStore(str(tmp_path), "coins")
+    path = str(tmp_path / "change_feed.jsonl")
+    start = datetime(2024, 6, 1, 9, 0, tzinfo=ZoneInfo("Asia/Tokyo"))
+
+    def append(i, l_symbols):
+        df = pd.DataFrame(
+            {
+                "symbol": l_symbols,
+                "coinId": [s.lower() for s in l_symbols],
+                "categories": [[] for _ in l_symbols],
+                "buyRatio": [0.5] * len(l_symbols),
+            }
+        )
+        return store.append(df, start + timedelta(hours=i))
+
+    append(0, ["A"])
+    append(1, ["A", "B"])
+    entry = append(2, ["A", "B", "C"])
+    l_results = update_change_feed(store, path, THRESHOLDS)
+    assert [events.column("symbol").to_pylist() for events in l_results] == [["C"]]
+    assert read_last_line(path)["snapshot"] == entry["snapshot"]
+
+    append(3, ["B", "C", "D"])
+    entry = append(4, ["B", "C", "D", "E"])
+    l_results = update_change_feed(store, path, THRESHOLDS)
+    assert [events.column("symbol").to_pylist() for events in l_results] == [
+        ["D", "A"],
+        ["E"],
+    ]
+    assert update_change_feed(store, path, THRESHOLDS) == []
+
+    with open(path, encoding="utf-8") as f:
+        l_lines = [json.loads(line) for line in f]
+    summaries = [line for line in l_lines if line["type"] == "snapshot"]
+    assert [line["events"] for line in summaries] == [1, 2, 1]
+    assert summaries[-1] == {
+        "snapshotTime": entry["snapshotTime"],
+        "type": "snapshot",
+        "snapshot": entry["snapshot"],
+        "previousSnapshot": "202406011200",
+        "events": 1,
+    }
+    assert [line["type"] for line in l_lines if line["type"] != "snapshot"] == [
+        "listing",
+        "listing",
+        "delisting",
+        "listing",
+    ]
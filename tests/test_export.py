@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+from cryptolens.export import export_frames, format_lists
+
+
+# 文字列、float32、タイムゾーン付きの日時、リスト (空と欠損値を含む) の列を持つdf
+def make_frame():
+    return pd.DataFrame(
+        {
+            "coinId": ["bitcoin", "ethereum", "tether"],
+            "buyRatio": np.array([0.6, 0.55, np.nan], dtype="float32"),
+            "coinCap": [1.3e12, 4.1e11, 1.1e11],
+            "coinUpdateTime": pd.to_datetime(
+                ["2024-06-01 00:00", "2024-06-01 00:30", None], utc=True
+            ).tz_convert("Asia/Tokyo"),
+            "categories": [["Layer 1", "PoW"], [], None],
+        }
+    )
+
+
+# リストはPythonの表記、空のリストは "[]"、欠損値は欠損値のままにすることを確かめる
+def test_format_lists():
+    column = pa.array([["a", "b"], [], None, ["c"]], pa.list_(pa.string()))
+    assert format_lists(column).to_pylist() == ["['a', 'b']", "[]", None, "['c']"]
+
+
+# 4つの形式で出力したファイルを読み直し、形式ごとの変換 (現地時刻・リストの文字列・float32) を確かめる
+def test_export_round_trip(tmp_path):
+    df = make_frame()
+    results = export_frames(
+        {"coins": df}, str(tmp_path), formats=("xlsx", "csv", "parquet", "arrow")
+    )
+    assert sorted(results) == sorted(
+        str(tmp_path / f"coins.{ext}") for ext in ["xlsx", "csv", "parquet", "arrow"]
+    )
+    assert not [p for p in tmp_path.iterdir() if p.name.endswith(".tmp")]
+
+    # Parquet, Arrow IPCはタイムゾーン付きの日時とリストをそのまま持つ
+    for table in [
+        pq.read_table(tmp_path / "coins.parquet"),
+        pa.ipc.open_file(pa.memory_map(str(tmp_path / "coins.arrow"))).read_all(),
+    ]:
+        assert table.schema.field("buyRatio").type == pa.float32()
+        assert table.schema.field("coinUpdateTime").type.tz == "Asia/Tokyo"
+        pd.testing.assert_frame_equal(table.to_pandas(), df)
+
+    # xlsxは書き込み専用モードで、日時はタイムゾーンなしの現地時刻、リストは文字列
+    worksheet = load_workbook(tmp_path / "coins.xlsx")["coins"]
+    rows = list(worksheet.iter_rows(values_only=True))
+    assert rows[0] == tuple(df.columns)
+    assert rows[1] == (
+        "bitcoin",
+        0.6,
+        1.3e12,
+        datetime(2024, 6, 1, 9, 0),
+        "['Layer 1', 'PoW']",
+    )
+    assert rows[2][4] == "[]"
+    assert rows[3][1:5] == (None, 1.1e11, None, None)
+
+    # CSVも日時は現地時刻、float32の値は10進数の表記のまま
+    df_csv = pd.read_csv(tmp_path / "coins.csv")
+    assert df_csv["buyRatio"].tolist()[:2] == [0.6, 0.55]
+    assert pd.to_datetime(df_csv["coinUpdateTime"]).tolist()[:2] == [
+        pd.Timestamp("2024-06-01 09:00"),
+        pd.Timestamp("2024-06-01 09:30"),
+    ]
+    assert df_csv["categories"].tolist()[:2] == ["['Layer 1', 'PoW']", "[]"]
+    assert df_csv.iloc[2].isna().tolist() == [False, True, False, True, True]
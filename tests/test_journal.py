@@ -0,0 +1,66 @@
+import json
+from datetime import timedelta
+
+from cryptolens.client import HttpClient
+from cryptolens.coingecko import get_all_detail_info
+from cryptolens.journal import CrawlJournal
+from cryptolens.standin import ApiStandInServer
+
+
+# 書き込み途中の最後の行は読み飛ばし、同じidの行は後の行を優先して1行にまとめることを確かめる
+def test_journal_skips_truncated_line_and_keeps_last_entry(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    with CrawlJournal(str(path)) as journal:
+        journal.record_error("bitcoin", "timeout")
+        journal.record("ethereum", {"coinId": "ethereum"})
+        journal.record("bitcoin", {"coinId": "bitcoin"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "solana", "status": "do')
+
+    with CrawlJournal(str(path)) as journal:
+        assert set(journal.done()) == {"bitcoin", "ethereum"}
+        assert journal.failed() == {}
+        assert journal.pending(["bitcoin", "solana", "ethereum"]) == ["solana"]
+    with open(path, encoding="utf-8") as f:
+        l_ids = [json.loads(line)["id"] for line in f]
+    assert sorted(l_ids) == ["bitcoin", "ethereum"]
+
+
+# 開いたままのジャーナルでも、max_ageを過ぎた結果は取得済みとみなさないことを確かめる
+def test_journal_expires_entries_while_open(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with CrawlJournal(path, max_age=timedelta(hours=1)) as journal:
+        journal.record("bitcoin", {"coinId": "bitcoin"})
+        journal.record_error("ethereum", "timeout")
+        assert list(journal.done()) == ["bitcoin"]
+        assert journal.pending(["bitcoin", "ethereum"]) == ["ethereum"]
+
+        now = journal._clock()
+        journal._clock = lambda: now + timedelta(hours=2)
+        assert journal.done() == {}
+        assert journal.failed() == {}
+        assert journal.pending(["bitcoin", "ethereum"]) == ["bitcoin", "ethereum"]
+
+
+# 中断した後の再実行では、エラーになったidと未取得のidだけを取得し、取得済みの結果は記録した値を使うことを確かめる
+def test_detail_crawl_resumes_from_journal(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    with ApiStandInServer(10) as server:
+        client = HttpClient(base_urls=server.base_urls)
+        # 1回目は3件だけ取得し、存在しないidはエラーとして記録する
+        with CrawlJournal(path) as journal:
+            get_all_detail_info(
+                client, ["coin-0", "coin-1", "coin-2", "missing"], "key", journal
+            )
+            assert journal.failed() == {"missing": "no data"}
+
+        n_requests = server.n_requests
+        l_ids = ["coin-0", "coin-1", "coin-2", "coin-3", "coin-4", "missing"]
+        with CrawlJournal(path) as journal:
+            df = get_all_detail_info(client, l_ids, "key", journal)
+            assert set(journal.done()) == {f"coin-{i}" for i in range(5)}
+
+        # coin-3, coin-4とエラーになったidだけを取得する
+        assert server.n_requests - n_requests == 3
+        assert sorted(df["coinId"]) == [f"coin-{i}" for i in range(5)]
+        assert df["detailUpdateTime"].notna().all()
@@ -0,0 +1,137 @@
+import json
+import re
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from cryptolens.metrics import LATENCY_BUCKETS, RunMetrics
+
+ENDPOINT = 'api.example.com/v1/"quoted"\\path\nnext'
+
+# Prometheusのテキスト形式のサンプルの行とラベル (値の中のエスケープを含む)
+SAMPLE_PATTERN = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def unescape(value):
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+# textfileを (HELPの名前の件数, TYPEの {名前: 種類}, サンプルのリスト) に分ける
+def parse_prometheus(text):
+    helps = Counter()
+    types = {}
+    samples = []
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            helps[line.split(" ")[2]] += 1
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name not in types
+            types[name] = kind
+        else:
+            match = SAMPLE_PATTERN.match(line)
+            assert match, line
+            name, label_text, value = match.groups()
+            labels = {
+                key: unescape(val)
+                for key, val in LABEL_PATTERN.findall(label_text or "")
+            }
+            samples.append((name, labels, float(value)))
+    return helps, types, samples
+
+
+# 応答時間 (0.03, 0.2, 0.2, 3, 100秒) のリクエストと、待機時間・DataFrame・エラーを記録した計測値
+def make_metrics():
+    metrics = RunMetrics('bench "1"')
+    for seconds, status in [(0.03, 200), (0.2, 200), (0.2, 429), (3, 200), (100, 500)]:
+        metrics.observe_request(ENDPOINT, seconds, 1000, status)
+    metrics.observe_sleep("api.example.com", 1.5, "rate_limit")
+    metrics.observe_sleep("api.example.com", 0.5, "backoff")
+    metrics.observe_sleep("api.example.com", 0.0, "backoff")
+    with metrics.stage("fetch"):
+        metrics.observe_frame("coins", pd.DataFrame({"a": range(100)}))
+    with pytest.raises(RuntimeError), metrics.stage("store"):
+        raise RuntimeError("disk full")
+    return metrics
+
+
+# ヒストグラムのバケットが累積の件数で、+Infが_count、_sumが合計になることを確かめる
+def test_prometheus_histogram():
+    _, types, samples = parse_prometheus(make_metrics().to_prometheus())
+    name = "cryptolens_http_request_duration_seconds"
+    assert types[name] == "histogram"
+    buckets = {
+        labels["le"]: value for n, labels, value in samples if n == f"{name}_bucket"
+    }
+    assert list(buckets) == [str(upper) for upper in LATENCY_BUCKETS] + ["+Inf"]
+    assert list(buckets.values()) == [1, 1, 3, 3, 3, 3, 4, 4, 4, 5]
+    (count,) = [value for n, _, value in samples if n == f"{name}_count"]
+    (total,) = [value for n, _, value in samples if n == f"{name}_sum"]
+    assert buckets["+Inf"] == count == 5
+    assert total == pytest.approx(103.43)
+
+    responses = {
+        labels["status"]: value
+        for n, labels, value in samples
+        if n == "cryptolens_http_responses_total"
+    }
+    assert responses == {"200": 3, "429": 1, "500": 1}
+
+
+# HELPとTYPEはメトリクスごとに1回だけ出力し、ラベルの値の " \ 改行 をエスケープすることを確かめる
+def test_prometheus_help_type_and_escaping(tmp_path):
+    metrics = make_metrics()
+    path = tmp_path / "metrics" / "cryptolens.prom"
+    metrics.write_prometheus(str(path))
+    text = path.read_text(encoding="utf-8")
+    helps, types, samples = parse_prometheus(text)
+    assert set(helps.values()) == {1}
+    assert set(helps) == set(types)
+    assert types["cryptolens_errors_total"] == "counter"
+    assert types["cryptolens_stage_wall_seconds"] == "gauge"
+    # サンプルの名前はTYPEのメトリクス名 (histogramは_bucket, _sum, _countを付けた名前)
+    for name, _, _ in samples:
+        assert re.sub(r"_(bucket|sum|count)$", "", name) in types or name in types
+
+    assert '\\"quoted\\"\\\\path\\nnext' in text
+    endpoints = {labels["endpoint"] for _, labels, _ in samples if "endpoint" in labels}
+    assert endpoints == {ENDPOINT}
+    assert {labels["run"] for _, labels, _ in samples} == {'bench "1"'}
+
+    sleeps = {
+        labels["reason"]: value
+        for name, labels, value in samples
+        if name == "cryptolens_sleep_seconds_total"
+    }
+    assert sleeps == {"rate_limit": 1.5, "backoff": 0.5}
+    errors = {
+        labels["source"]: value
+        for name, labels, value in samples
+        if name == "cryptolens_errors_total"
+    }
+    assert errors == {"store": 1}
+
+
+# JSONのレポートにベンチマーク (benchmark_refresh) が読むキーがあることを確かめる
+def test_json_report(tmp_path):
+    path = tmp_path / "run_report.json"
+    make_metrics().save(str(path))
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    assert set(report["stages"]) == {"fetch", "store"}
+    for stage in report["stages"].values():
+        assert stage["runs"] == 1
+        assert stage["wallSeconds"] >= 0
+        assert "cpuSeconds" in stage and "peakRssBytes" in stage
+    http = report["http"][ENDPOINT]
+    assert http["bytes"] == 5000
+    assert http["latency"]["count"] == 5
+    assert http["latency"]["buckets"]["0.25"] == 3
+    assert report["framePeakBytes"]["coins"] > 0
+    assert report["sleepSeconds"] == {
+        "api.example.com backoff": 0.5,
+        "api.example.com rate_limit": 1.5,
+    }
+    assert report["errors"] == {"store": 1}
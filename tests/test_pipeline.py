@@ -0,0 +1,22 @@
+from cryptolens.benchmark import frames_equal, make_dummy_data
+from cryptolens.pipeline import run_pipeline
+
+
+# polarsのエンジン (ロックファイルのバージョン) の出力がpandasのエンジンと一致することを確かめる
+def test_polars_engine_matches_pandas():
+    df_coins, df_categories = make_dummy_data(2000, seed=1)
+    outputs_pandas = run_pipeline(df_coins, df_categories, engine="pandas")
+    outputs_polars = run_pipeline(df_coins, df_categories, engine="polars")
+    for df_pandas, df_polars in zip(outputs_pandas, outputs_polars):
+        assert frames_equal(df_pandas, df_polars)
+    assert set(outputs_polars[2]["_merge"]) == {"left_only", "right_only", "both"}
+
+
+# 展開しない場合は3つ目の返り値がNoneになることを確かめる
+def test_polars_engine_without_explode():
+    df_coins, df_categories = make_dummy_data(200, seed=2)
+    df_coins, df_categories, df_exploded = run_pipeline(
+        df_coins, df_categories, engine="polars", explode=False
+    )
+    assert df_exploded is None
+    assert df_coins["coinCap"].is_monotonic_decreasing
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from cryptolens.records import iter_json_array
+
+RECORDS = [
+    {"id": "bitcoin", "symbol": "btc", "platforms": {}},
+    {"id": 'quote"s', "name": "back\\slash \\u005b [not, an] array\n", "n": 1.5e-7},
+    {"id": "nested", "platforms": {"ethereum": "0xabc", "x": {"y": [1, [2, {}]]}}},
+    {"id": "unicode", "name": "ビットコイン 🚀"},
+    [1, 2, 3],
+    12345678901234567890,
+    None,
+    "plain string, with ] and }",
+]
+
+
+# 本文をsize bytesごとのチャンクに分ける
+def split(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+# 文字列・エスケープ・ネストした要素・マルチバイト文字の途中でチャンクが切れても、同じ要素を返すことを確かめる
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_iter_json_array_chunk_boundaries(size):
+    data = json.dumps(RECORDS, ensure_ascii=False, indent=1).encode()
+    assert list(iter_json_array(split(data, size))) == RECORDS
+
+
+# 空の配列と、文字列のチャンクも読めることを確かめる
+def test_iter_json_array_empty_and_str_chunks():
+    assert list(iter_json_array([b" [ ", b" ] "])) == []
+    assert list(iter_json_array(['[{"a": 1', "}, 2", "]"])) == [{"a": 1}, 2]
+
+
+# 配列でない本文、途中で終わった本文と配列の後に続きがある本文はエラーにすることを確かめる
+@pytest.mark.parametrize(
+    "data", [b'{"a": 1}', b'[{"a": 1}, {"b"', b"[1, 2", b"", b"[1, 2]  [3]"]
+)
+def test_iter_json_array_rejects_invalid(data):
+    with pytest.raises(ValueError):
+        list(iter_json_array(split(data, 3)))
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from cryptolens import config
+from cryptolens.client import HttpClient
+from cryptolens.refresh import refresh_coin_data
+from cryptolens.resolver import CoinIdResolver
+from cryptolens.standin import ApiStandInServer
+
+MARKETS_ENDPOINT = "api.coingecko.com/coins/markets"
+
+
+# CoinGecko側の更新日時 (last_updated) が古いままの仮想通貨を、取得した直後の実行で再取得しないことを確かめる
+def test_market_ttl_uses_fetch_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        ApiStandInServer, "_now_iso", staticmethod(lambda: "2020-01-01T00:00:00.000Z")
+    )
+    with ApiStandInServer(20) as server:
+        client = HttpClient(base_urls=server.base_urls)
+        resolver = CoinIdResolver(str(tmp_path / "resolver.json"))
+        df, _ = refresh_coin_data(client, pd.DataFrame(), "key", config.TTL, resolver)
+        assert df["marketFetchTime"].notna().all()
+        assert (df["marketFetchTime"] > df["coinUpdateTime"]).all()
+        n_markets = client.stats[MARKETS_ENDPOINT]["success"]
+
+        df, updated = refresh_coin_data(client, df, "key", config.TTL, resolver)
+        assert client.stats[MARKETS_ENDPOINT]["success"] == n_markets
+        assert not updated
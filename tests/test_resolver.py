@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cryptolens.resolver import CoinIdResolver, normalize_base_coins
+
+
+# 先頭・末尾の倍率 (10, 100, 1000, ...) だけを除き、0が続かない数値は残すことを確かめる
+def test_normalize_base_coins():
+    base_coins = pd.Series(
+        ["1000PEPE", "10000SATS", "SHIB1000", "1INCH", " BTC ", "10000000AIDOGE", "A8"]
+    )
+    coins, multipliers = normalize_base_coins(base_coins)
+    assert coins.tolist() == ["pepe", "sats", "shib", "1inch", "btc", "aidoge", "a8"]
+    assert multipliers.tolist() == [1000, 10000, 1000, 1, 1, 10000000, 1]
+
+
+# BTCUSDTは候補が1つ、USDCUSDTはブリッジされたトークンと、ETHUSDTは順位の違う仮想通貨と候補が2つ
+def make_frames():
+    df_bybit = pd.DataFrame(
+        {"symbol": ["BTCUSDT", "USDCUSDT", "ETHUSDT"], "coin": ["btc", "usdc", "eth"]}
+    )
+    df_coingecko = pd.DataFrame(
+        {
+            "coinId": ["bitcoin", "usd-coin", "bridged-usdc", "ethereum", "eth-fork"],
+            "coin": ["btc", "usdc", "usdc", "eth", "eth"],
+            "coinName": ["Bitcoin", "USDC", "Bridged USDC", "Ethereum", "ETH Fork"],
+            "coinPlatforms": [[], ["ethereum", "solana"], ["ethereum"], [], []],
+        }
+    )
+    return df_bybit, df_coingecko
+
+
+# 候補が複数あるsymbolだけ順位を取得し、順位が同じ (不明な) 場合はブリッジされたトークンでない方を選ぶことを確かめる
+def test_resolver_scores_ambiguous_symbols(tmp_path):
+    df_bybit, df_coingecko = make_frames()
+    calls = []
+
+    def fetch_ranks(l_ids):
+        calls.append(sorted(l_ids))
+        return pd.DataFrame(
+            {"coinId": ["ethereum", "eth-fork"], "coinCapRank": [2, 900]}
+        )
+
+    resolver = CoinIdResolver(str(tmp_path / "map.json"))
+    df = resolver.resolve(df_bybit, df_coingecko, fetch_ranks)
+    assert dict(zip(df["symbol"], df["coinId"])) == {
+        "BTCUSDT": "bitcoin",
+        "USDCUSDT": "usd-coin",
+        "ETHUSDT": "ethereum",
+    }
+    assert calls == [["bridged-usdc", "eth-fork", "ethereum", "usd-coin"]]
+    sources = {s: e["source"] for s, e in resolver.table["mapping"].items()}
+    assert sources == {"BTCUSDT": "single", "USDCUSDT": "platform", "ETHUSDT": "rank"}
+
+
+# 手動の指定はスコアより優先し、CoinGeckoのリストにないidの指定は無視することを確かめる
+def test_resolver_overrides(tmp_path):
+    df_bybit, df_coingecko = make_frames()
+    resolver = CoinIdResolver(
+        str(tmp_path / "map.json"),
+        overrides={"ETHUSDT": "eth-fork", "USDCUSDT": "not-a-coin"},
+    )
+    df = resolver.resolve(
+        df_bybit, df_coingecko, lambda l_ids: pd.DataFrame(columns=["coinId"])
+    )
+    assert dict(zip(df["symbol"], df["coinId"]))["ETHUSDT"] == "eth-fork"
+    assert dict(zip(df["symbol"], df["coinId"]))["USDCUSDT"] == "usd-coin"
+    assert resolver.table["mapping"]["ETHUSDT"]["source"] == "override"
+
+
+# 有効期間内は前回の結果を使って順位を取得せず、期限切れ後・候補が変わった後は選び直すことを確かめる
+def test_resolver_mapping_ttl(tmp_path):
+    df_bybit, df_coingecko = make_frames()
+    path = str(tmp_path / "map.json")
+    calls = []
+
+    def fetch_ranks(l_ids):
+        calls.append(sorted(l_ids))
+        return pd.DataFrame(
+            {"coinId": ["ethereum", "eth-fork"], "coinCapRank": [2, 900]}
+        )
+
+    CoinIdResolver(path, ttl=timedelta(days=7)).resolve(
+        df_bybit, df_coingecko, fetch_ranks
+    )
+    assert len(calls) == 1
+
+    # 保存したファイルから読み込んだ前回の結果を使う
+    resolver = CoinIdResolver(path, ttl=timedelta(days=7))
+    resolver.resolve(df_bybit, df_coingecko, fetch_ranks)
+    assert len(calls) == 1
+    assert resolver.table["version"] == 1
+
+    # 前回の結果を8日前にすると、曖昧なsymbolだけを選び直す
+    with open(path, encoding="utf-8") as f:
+        table = json.load(f)
+    for entry in table["mapping"].values():
+        resolved = datetime.fromisoformat(entry["resolvedAt"])
+        entry["resolvedAt"] = (resolved - timedelta(days=8)).isoformat()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f)
+    resolver = CoinIdResolver(path, ttl=timedelta(days=7))
+    resolver.resolve(df_bybit, df_coingecko, fetch_ranks)
+    assert calls[-1] == ["bridged-usdc", "eth-fork", "ethereum", "usd-coin"]
+    assert len(calls) == 2
+
+    # 候補が変わったsymbolは有効期間内でも選び直し、結果が変われば変更履歴に残す
+    df_coingecko = df_coingecko[df_coingecko["coinId"] != "ethereum"]
+    resolver = CoinIdResolver(path, ttl=timedelta(days=7))
+    df = resolver.resolve(df_bybit, df_coingecko, fetch_ranks)
+    assert dict(zip(df["symbol"], df["coinId"]))["ETHUSDT"] == "eth-fork"
+    assert len(calls) == 2
+    assert resolver.table["version"] == 2
+    assert resolver.table["changes"][-1]["symbol"] == "ETHUSDT"
+    assert resolver.table["changes"][-1]["to"] == "eth-fork"
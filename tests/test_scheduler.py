@@ -0,0 +1,205 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cryptolens import scheduler as scheduler_module
+from cryptolens.api import open_stores
+from cryptolens.client import HttpClient
+from cryptolens.scheduler import Job, Scheduler, run_markets, run_ratios
+from cryptolens.standin import ApiStandInServer
+
+TZ = ZoneInfo("Asia/Tokyo")
+START = datetime(2024, 6, 1, 10, 30, tzinfo=TZ)
+
+
+# テストの中で進める時計 (Scheduler._nowの代わり)
+class FakeClock:
+    def __init__(self, now=START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, delta):
+        self.now += delta
+
+
+# condが真になるまで待つ (timeout秒で失敗にする)
+def wait_for(cond, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Condition not met")
+        time.sleep(0.01)
+
+
+# スタンドインサーバーの先頭n件のsymbolと、売買比率・価格が未取得のスナップショットを保存する
+def seed_store(data_dir, standin, n=5):
+    coins_store, _ = open_stores(data_dir)
+    instruments = standin.instruments[:n]
+    df = pd.DataFrame(
+        {
+            "symbol": [instrument["symbol"] for instrument in instruments],
+            "coinId": [f"coin-{i}" for i in range(n)],
+            "coinName": [f"Coin {i}" for i in range(n)],
+            "buyRatio": np.nan,
+            "currentPrice": np.nan,
+        }
+    )
+    coins_store.append(df, START - timedelta(days=1))
+
+
+# スタンドインサーバーに送信するクライアントと、時計を置き換えたスケジューラを作る
+def make_scheduler(data_dir, standin, jobs, clock):
+    client = HttpClient(base_urls=standin.base_urls, max_retries=0)
+    scheduler = Scheduler(client, None, data_dir, jobs=jobs)
+    scheduler._now = clock
+    return scheduler
+
+
+# 別スレッドでスケジューラを動かす (stopで止める)
+def start(scheduler):
+    thread = threading.Thread(target=scheduler.run, kwargs={"max_poll": 0.02})
+    thread.start()
+    return thread
+
+
+# align=Trueのジョブは実行間隔の区切り (UTC) に、それ以外は実行間隔の後にジッタを加えた時刻に実行することを確かめる
+def test_next_run_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler_module.random, "uniform", lambda low, high: high)
+    with Scheduler(HttpClient(), None, str(tmp_path), jobs=[]) as scheduler:
+        daily = Job("daily", None, timedelta(days=1), timedelta(minutes=10), True)
+        # 10:30 (JST) の後の日の区切りは翌日の0:00 (UTC) = 9:00 (JST)
+        assert scheduler.next_run_time(daily, START) == datetime(
+            2024, 6, 2, 9, 10, tzinfo=TZ
+        )
+        hourly = Job("hourly", None, timedelta(hours=1), timedelta(0), True)
+        assert scheduler.next_run_time(hourly, START) == datetime(
+            2024, 6, 1, 11, 0, tzinfo=TZ
+        )
+        # 区切りちょうどの時刻からは次の区切り
+        assert scheduler.next_run_time(hourly, START.replace(minute=0)) == datetime(
+            2024, 6, 1, 11, 0, tzinfo=TZ
+        )
+        fixed = Job("fixed", None, timedelta(hours=1), timedelta(minutes=5))
+        assert scheduler.next_run_time(fixed, START) == datetime(
+            2024, 6, 1, 11, 35, tzinfo=TZ
+        )
+
+
+# 並列に実行した2つのジョブの結果を両方とも最新のスナップショットに適用し、次の実行時刻を保存することを確かめる
+def test_jobs_apply_to_latest_snapshot(tmp_path):
+    data_dir = str(tmp_path)
+    clock = FakeClock()
+    jobs = [
+        Job("ratios", run_ratios, timedelta(hours=1), timedelta(0), True),
+        Job("markets", run_markets, timedelta(hours=1), timedelta(0)),
+    ]
+    with ApiStandInServer(n_coins=20) as standin:
+        seed_store(data_dir, standin)
+        with make_scheduler(data_dir, standin, jobs, clock) as scheduler:
+            thread = start(scheduler)
+            wait_for(lambda: all(s["runs"] == 1 for s in scheduler.state.values()))
+            scheduler.stop()
+            thread.join()
+
+    assert scheduler.df_coins["buyRatio"].notna().all()
+    assert scheduler.df_coins["currentPrice"].notna().all()
+    df_saved = scheduler.coins_store.load_latest()
+    assert df_saved["buyRatio"].notna().all()
+    assert df_saved["currentPrice"].notna().all()
+    assert scheduler.state["ratios"]["nextRun"] == "2024-06-01T11:00:00+09:00"
+    assert scheduler.state["markets"]["nextRun"] == "2024-06-01T11:30:00+09:00"
+    assert scheduler.state["ratios"]["lastError"] is None
+
+    # 保存した実行時刻は再起動後も引き継ぐ
+    with Scheduler(HttpClient(), None, data_dir, jobs=jobs) as restarted:
+        assert restarted.due_time("ratios") == datetime(2024, 6, 1, 11, 0, tzinfo=TZ)
+
+
+# 実行中のジョブは次の実行時刻を過ぎても重ねて実行せず、終わってから次の実行時刻を決めることを確かめる
+def test_overlapping_runs_are_coalesced(tmp_path):
+    data_dir = str(tmp_path)
+    clock = FakeClock()
+    calls = []
+    release = threading.Event()
+
+    def slow_ratios(scheduler):
+        calls.append(clock())
+        release.wait(10)
+        return run_ratios(scheduler)
+
+    jobs = [Job("ratios", slow_ratios, timedelta(hours=1), timedelta(0))]
+    with ApiStandInServer(n_coins=20) as standin:
+        seed_store(data_dir, standin)
+        with make_scheduler(data_dir, standin, jobs, clock) as scheduler:
+            thread = start(scheduler)
+            wait_for(lambda: len(calls) == 1)
+            # 実行中に2回分の実行時刻が過ぎても、2回目は始まらない
+            clock.advance(timedelta(hours=2))
+            time.sleep(0.3)
+            assert len(calls) == 1
+
+            release.set()
+            wait_for(lambda: scheduler.state["ratios"]["runs"] == 1)
+            assert scheduler.due_time("ratios") == START + timedelta(hours=3)
+            time.sleep(0.3)
+            assert len(calls) == 1
+
+            clock.advance(timedelta(hours=1))
+            wait_for(lambda: scheduler.state["ratios"]["runs"] == 2)
+            scheduler.stop()
+            thread.join()
+    assert calls == [START, START + timedelta(hours=3)]
+
+
+# 結果の適用はロックの中で行い、後のジョブは前のジョブが適用したスナップショットに適用することを確かめる
+def test_apply_is_serialized(tmp_path):
+    data_dir = str(tmp_path)
+    with ApiStandInServer(n_coins=20) as standin:
+        seed_store(data_dir, standin)
+        with make_scheduler(data_dir, standin, [], FakeClock()) as scheduler:
+            order = []
+            inside = threading.Event()
+            release = threading.Event()
+
+            def apply_first(df_coins, df_categories):
+                order.append("first")
+                inside.set()
+                release.wait(10)
+                df_coins = df_coins.assign(buyRatio=0.5)
+                return df_coins, df_categories, True, False
+
+            def apply_second(df_coins, df_categories):
+                order.append("second")
+                df_coins = df_coins.assign(currentPrice=2.0)
+                return df_coins, df_categories, True, False
+
+            first = threading.Thread(target=scheduler._apply, args=(apply_first,))
+            first.start()
+            inside.wait(10)
+            second = threading.Thread(target=scheduler._apply, args=(apply_second,))
+            second.start()
+            time.sleep(0.2)
+            assert order == ["first"]
+            release.set()
+            first.join()
+            second.join()
+
+    assert order == ["first", "second"]
+    assert (scheduler.df_coins["buyRatio"] == 0.5).all()
+    assert (scheduler.df_coins["currentPrice"] == 2.0).all()
+    df_saved = scheduler.coins_store.load_latest()
+    assert df_saved["buyRatio"].tolist() == pytest.approx([0.5] * 5)
+
+
+# with文の終わりで詳細情報のジャーナルを閉じることを確かめる
+def test_scheduler_closes_journal(tmp_path):
+    with Scheduler(HttpClient(), None, str(tmp_path), jobs=[]) as scheduler:
+        assert not scheduler.detail_journal._file.closed
+    assert scheduler.detail_journal._file.closed
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cryptolens.benchmark import make_dummy_data
+from cryptolens.screening import (
+    DEFAULT_SCREENS,
+    FeatureMatrix,
+    Filter,
+    Screen,
+    Term,
+)
+
+
+# 実際と同じ尺度 (変化率・割合は小数) のデータで、標準のスクリーニングがすべて結果を返すことを確かめる
+def test_default_screens_return_rows():
+    df_coins, _ = make_dummy_data(2000, seed=3)
+    df_results = FeatureMatrix.build(df_coins).run(DEFAULT_SCREENS)
+    counts = df_results["screen"].value_counts()
+    for screen in DEFAULT_SCREENS:
+        assert counts.get(screen.name, 0) == screen.k
+
+
+# 手計算できる6件の特徴量 (coin-eのx、coin-dのyは欠損値)
+# xのパーセンタイル順位: coin-a 0, coin-b 0.25, coin-c 0.5, coin-d 0.75, coin-f 1
+# xの標準化した値: 平均3.2を超えるのはcoin-dとcoin-f
+def make_matrix():
+    keys = [f"coin-{c}" for c in "abcdef"]
+    values = np.array(
+        [
+            [1.0, 10.0],
+            [2.0, 10.0],
+            [3.0, 30.0],
+            [4.0, np.nan],
+            [np.nan, 50.0],
+            [6.0, 10.0],
+        ]
+    )
+    return FeatureMatrix(keys, ["x", "y"], values)
+
+
+def selected(matrix, filters):
+    return matrix.keys[matrix.mask(filters)].tolist()
+
+
+# 演算子ごと・尺度ごとの抽出と、欠損値がどの比較も満たさないことを確かめる
+def test_filter_ops_and_scales():
+    matrix = make_matrix()
+    assert selected(matrix, [Filter("x", ">", 3)]) == ["coin-d", "coin-f"]
+    assert selected(matrix, [Filter("x", "!=", 3)]) == [
+        "coin-a",
+        "coin-b",
+        "coin-d",
+        "coin-f",
+    ]
+    assert selected(matrix, [Filter("x", "between", (2, 4))]) == [
+        "coin-b",
+        "coin-c",
+        "coin-d",
+    ]
+    assert selected(matrix, [Filter("y", "notnull")]) == [
+        "coin-a",
+        "coin-b",
+        "coin-c",
+        "coin-e",
+        "coin-f",
+    ]
+    assert selected(
+        matrix, [Filter(None, "any", [Filter("x", "<", 2), Filter("y", ">", 40)])]
+    ) == ["coin-a", "coin-e"]
+    # 条件はすべて満たす行だけを残す
+    assert selected(matrix, [Filter("x", ">=", 2), Filter("y", "==", 10)]) == [
+        "coin-b",
+        "coin-f",
+    ]
+
+    assert matrix.column("x", "rank")[[0, 1, 2, 3, 5]].tolist() == [
+        0,
+        0.25,
+        0.5,
+        0.75,
+        1,
+    ]
+    assert selected(matrix, [Filter("x", ">=", 0.5, "rank")]) == [
+        "coin-c",
+        "coin-d",
+        "coin-f",
+    ]
+    assert matrix.column("x", "zscore")[0] == pytest.approx(-2.2 / np.sqrt(2.96))
+    assert selected(matrix, [Filter("x", ">", 0, "zscore")]) == ["coin-d", "coin-f"]
+
+    with pytest.raises(ValueError):
+        matrix.mask([Filter("x", "~", 1)])
+    with pytest.raises(KeyError):
+        matrix.mask([Filter("z", ">", 1)])
+
+
+# weightとascendingでスコアが変わり、項のどれかが欠損値の行は選ばれないことを確かめる
+def test_terms_weight_and_ascending():
+    matrix = make_matrix()
+    # スコア = 2x - y: coin-a -8, coin-b -6, coin-c -24, coin-f 2 (coin-d, coin-eは欠損値)
+    terms = [Term("x", 2.0, "raw"), Term("y", 1.0, "raw", True)]
+    df = matrix.screen(Screen("test", [], terms, k=10))
+    assert df["coinId"].tolist() == ["coin-f", "coin-b", "coin-a", "coin-c"]
+    assert df["score"].tolist() == [2.0, -6.0, -8.0, -24.0]
+    assert df.columns.tolist() == ["coinId", "score", "x", "y"]
+
+    df = matrix.screen(Screen("test", [], [Term("x", normalize="raw", ascending=True)]))
+    assert df["coinId"].tolist() == ["coin-a", "coin-b", "coin-c", "coin-d", "coin-f"]
+
+
+# kを候補の数に合わせ、0以下なら空の結果を返すことを確かめる
+def test_select_clamps_k():
+    matrix = make_matrix()
+    terms = [Term("x", normalize="raw")]
+    for k, expected in [(2, ["coin-f", "coin-d"]), (5, 5), (100, 5), (0, 0), (-1, 0)]:
+        positions, score = matrix.select(Screen("test", [], terms, k))
+        if isinstance(expected, list):
+            assert matrix.keys[positions].tolist() == expected
+        else:
+            assert len(positions) == len(score) == expected
+    df = matrix.run([Screen("empty", [], terms, 0), Screen("top", [], terms, 1)])
+    assert df["coinId"].tolist() == ["coin-f"]
+
+
+# 同じスコアが多いデータでも、上位k件がすべての行を安定ソートした結果の先頭k件と一致することを確かめる
+def test_select_matches_full_sort_with_ties():
+    rng = np.random.default_rng(0)
+    n = 500
+    values = rng.integers(0, 5, size=(n, 2)).astype(np.float64)
+    values[rng.random(n) < 0.1, 0] = np.nan
+    matrix = FeatureMatrix([f"coin-{i}" for i in range(n)], ["x", "y"], values)
+    terms = [Term("x", normalize="raw"), Term("y", 0.5, "raw")]
+    filters = [Filter("y", ">=", 1)]
+
+    df = pd.DataFrame({"score": matrix.score(terms)})
+    df = df[matrix.mask(filters) & df["score"].notna()]
+    df_sorted = df.sort_values("score", ascending=False, kind="stable")
+    for k in [1, 7, 50, len(df) - 1, len(df), len(df) + 10]:
+        positions, score = matrix.select(Screen("test", filters, terms, k))
+        assert positions.tolist() == df_sorted.index[:k].tolist()
+        assert score.tolist() == df_sorted["score"].iloc[:k].tolist()
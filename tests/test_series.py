@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import make_response
+
+from cryptolens.cache import ResponseCache
+from cryptolens.client import HttpClient
+from cryptolens.klines import (
+    INTERVALS,
+    KlineStore,
+    backfill_klines,
+    compute_kline_metrics,
+)
+from cryptolens.ratios import PERIODS, RatioHistory, backfill_ratios
+from cryptolens.series import backfill_series
+
+STEP = INTERVALS["60"]
+
+
+# 渡した {timestamp: 終値} のローソク足を返す取得関数を作る関数
+def make_fetch(closes, calls):
+    def fetch(symbol, interval, start, end):
+        calls.append((symbol, start))
+        timestamps = np.array(
+            [t for t in sorted(closes) if start <= t <= end], dtype=np.int64
+        )
+        values = np.array([closes[t] for t in timestamps], dtype=np.float64)
+        return {
+            "timestamp": timestamps,
+            "open": values,
+            "high": values,
+            "low": values,
+            "close": values,
+            "volume": values,
+            "turnover": values,
+        }
+
+    return fetch
+
+
+# 最後の足が2回の差分取得の間に変わった場合、後から取得した値に置き換わることを確かめる
+def test_backfill_refetches_last_bar(tmp_path):
+    store = KlineStore(str(tmp_path))
+    calls = []
+    closes = {0: 1.0, STEP: 2.0, 2 * STEP: 3.0}
+    backfill_series(
+        store, make_fetch(closes, calls), ["BTCUSDT"], {"60": STEP}, 0, 2 * STEP
+    )
+
+    # 最後の足 (2 * STEP) が確定し、次の足ができる
+    closes = {0: 1.0, STEP: 2.0, 2 * STEP: 3.5, 3 * STEP: 4.0}
+    backfill_series(
+        store, make_fetch(closes, calls), ["BTCUSDT"], {"60": STEP}, 0, 3 * STEP
+    )
+
+    assert calls == [("BTCUSDT", 0), ("BTCUSDT", 2 * STEP)]
+    df = store.load("60")
+    assert df["timestamp"].tolist() == [0, STEP, 2 * STEP, 3 * STEP]
+    assert df["close"].tolist() == [1.0, 2.0, 3.5, 4.0]
+    assert store.last_timestamp("60", "BTCUSDT") == 3 * STEP
+
+
+# 変化率は最新の時刻からhorizonだけ前に終わる足の終値と比べることを、手計算した値で確かめる
+# (時刻は足の開始時刻。BTCUSDTは5 * STEP、ETHUSDTは4 * STEPに始まる足が最新)
+def test_kline_price_changes_use_bar_end_times():
+    closes = {
+        "BTCUSDT": [100.0, 110.0, 120.0, 130.0, 140.0, 150.0],
+        "ETHUSDT": [10.0, 20.0, 30.0, 40.0, 50.0],
+    }
+    df = pd.DataFrame(
+        [
+            {"symbol": symbol, "timestamp": i * STEP, "high": c, "low": c, "close": c}
+            for symbol, l_closes in closes.items()
+            for i, c in enumerate(l_closes)
+        ]
+    )
+    horizons = {"1h": STEP, "2h": 2 * STEP, "24h": 24 * STEP}
+    df_metrics = compute_kline_metrics(df, "60", horizons).set_index("symbol")
+
+    # BTCUSDT: 1h前に終わる足は3 * STEPに始まる足 (130)、2h前は2 * STEP (120)
+    assert df_metrics.loc["BTCUSDT", "1h"] == pytest.approx(150 / 130 - 1)
+    assert df_metrics.loc["BTCUSDT", "2h"] == pytest.approx(150 / 120 - 1)
+    # ETHUSDT: 1h前に終わる足は2 * STEPに始まる足 (30)、2h前は1 * STEP (20)
+    assert df_metrics.loc["ETHUSDT", "1h"] == pytest.approx(50 / 30 - 1)
+    assert df_metrics.loc["ETHUSDT", "2h"] == pytest.approx(50 / 20 - 1)
+    # 取得した期間より前の足が必要な変化率は欠損値
+    assert df_metrics["24h"].isna().all()
+    assert df_metrics["currentPrice"].tolist() == [150.0, 50.0]
+
+
+# 同じ期間の中で再実行した売買比率の取得は同じリクエストになり、リプレイモードでもキャッシュから取得できることを確かめる
+def test_backfill_ratios_reuses_cached_pages(tmp_path, stub_session):
+    day = PERIODS["1d"]
+    body = {
+        "retCode": 0,
+        "retMsg": "OK",
+        "result": {
+            "list": [
+                {"timestamp": str(10 * day), "buyRatio": "0.6"},
+                {"timestamp": str(9 * day), "buyRatio": "0.5"},
+            ],
+            "nextPageCursor": "",
+        },
+    }
+    cache_path = str(tmp_path / "cache.sqlite")
+    client = HttpClient(cache=ResponseCache(cache_path, default_ttl=0))
+    session = stub_session(client, "api.bybit.com", [make_response(body=body)])
+    history = RatioHistory(str(tmp_path / "ratios"))
+    backfill_ratios(
+        client, history, ["BTCUSDT"], ["1d"], 9 * day + 1, 10 * day + 3600 * 1000
+    )
+    params = session.requests[0]["params"]
+    assert (params["startTime"], params["endTime"]) == (9 * day, 10 * day)
+    client.cache.close()
+
+    # 同じ日の後の時刻から再実行しても、通信せずに保存したレスポンスを使える
+    client = HttpClient(cache=ResponseCache(cache_path, replay=True))
+    history = RatioHistory(str(tmp_path / "ratios_replay"))
+    backfill_ratios(
+        client, history, ["BTCUSDT"], ["1d"], 9 * day + 2, 10 * day + 5 * 3600 * 1000
+    )
+    df = history.load("1d")
+    assert df["timestamp"].tolist() == [9 * day, 10 * day]
+    assert df["buyRatio"].tolist() == pytest.approx([0.5, 0.6])
+
+
+# 同じ足の中で再実行したローソク足の取得は同じリクエストになり、キャッシュの行が増えないことを確かめる
+def test_backfill_klines_reuses_cache_keys(tmp_path, stub_session):
+    body = {
+        "retCode": 0,
+        "retMsg": "OK",
+        "result": {"list": [[str(10 * STEP), "1", "1", "1", "1", "1", "1"]]},
+    }
+    client = HttpClient(cache=ResponseCache(str(tmp_path / "cache.sqlite")))
+    session = stub_session(
+        client, "api.bybit.com", [make_response(body=body), make_response(body=body)]
+    )
+    for offset in [60 * 1000, 30 * 60 * 1000]:
+        store = KlineStore(str(tmp_path / f"klines{offset}"))
+        backfill_klines(
+            client, store, ["BTCUSDT"], "60", 10 * STEP - 1, 10 * STEP + offset
+        )
+    assert [(r["params"]["start"], r["params"]["end"]) for r in session.requests] == [
+        (9 * STEP, 10 * STEP),
+        (9 * STEP, 10 * STEP),
+    ]
+    (count,) = client.cache._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+    assert count == 1
@@ -0,0 +1,63 @@
+import requests
+
+from cryptolens.standin import ApiStandInServer
+
+COINS_LIST = "/api/v3/coins/list"
+INSTRUMENTS = "/v5/market/instruments-info"
+
+
+# error_rateの割合のリクエストに上限に関係なく429 (CoinGeckoはRetry-After付き) を返すことを確かめる
+def test_error_rate():
+    with ApiStandInServer(n_coins=10, error_rate=1.0, retry_after=3) as standin:
+        status, headers, _ = standin.handle(COINS_LIST, {}, "key")
+        assert status == 429
+        assert headers["Retry-After"] == "3"
+        status, headers, _ = standin.handle(INSTRUMENTS, {"category": "linear"})
+        assert status == 429
+        assert "Retry-After" not in headers
+
+    with ApiStandInServer(n_coins=10, error_rate=0.3, seed=1) as standin:
+        l_status = [standin.handle(COINS_LIST, {})[0] for _ in range(1000)]
+    assert 200 < l_status.count(429) < 400
+    assert standin.n_throttled == l_status.count(429)
+    assert standin.n_requests == 1000
+
+
+# CoinGeckoの上限はAPIキーごと、ByBitの上限はサーバー全体で数え、リクエスト数と429の数を数えることを確かめる
+def test_rate_limits_and_counters():
+    rate_limits = {"coingecko": (2, 60), "bybit": (2, 60)}
+    with ApiStandInServer(n_coins=10, rate_limits=rate_limits) as standin:
+        l_status = [standin.handle(COINS_LIST, {}, "a")[0] for _ in range(3)]
+        assert l_status == [200, 200, 429]
+        status, headers, _ = standin.handle(COINS_LIST, {}, "a")
+        assert status == 429
+        assert 59 <= float(headers["Retry-After"]) <= 60
+        # 別のAPIキーは別に数える
+        assert standin.handle(COINS_LIST, {}, "b")[0] == 200
+
+        # ByBitはAPIキーによらず数え、残り回数と時間枠の終了時刻をヘッダーで返す
+        l_responses = [
+            standin.handle(INSTRUMENTS, {"category": "linear"}, f"key-{i}")
+            for i in range(3)
+        ]
+    assert [status for status, _, _ in l_responses] == [200, 200, 429]
+    assert [h["X-Bapi-Limit-Status"] for _, h, _ in l_responses] == ["1", "0", "0"]
+    assert len({h["X-Bapi-Limit-Reset-Timestamp"] for _, h, _ in l_responses}) == 1
+
+    assert standin.n_requests == 8
+    assert standin.n_throttled == 3
+    assert standin.requests_by_key == {"a": 4, "b": 1}
+
+
+# HTTPのリクエストも同じように数え、429のヘッダーを返すことを確かめる
+def test_http_requests():
+    with ApiStandInServer(n_coins=10, rate_limits={"coingecko": (1, 60)}) as standin:
+        url = standin.url + COINS_LIST
+        headers = {"x-cg-demo-api-key": "a"}
+        assert requests.get(url, headers=headers).status_code == 200
+        response = requests.get(url, headers=headers)
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        assert requests.get(standin.url + "/unknown").status_code == 404
+    assert standin.n_requests == 3
+    assert standin.n_throttled == 1
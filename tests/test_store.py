@@ -0,0 +1,171 @@
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from cryptolens.schema import CATEGORIES_SCHEMA, COINS_SCHEMA, to_frame
+from cryptolens.store import SNAPSHOT_COLUMN, HistoryStore
+
+START = datetime(2024, 6, 1, 23, 0, tzinfo=ZoneInfo("Asia/Tokyo"))
+
+
+# n件のカテゴリデータ (最初の行の取引高は欠損値)
+def make_categories(n, cap=1e9):
+    return pd.DataFrame(
+        {
+            "categoryId": [f"cat-{i}" for i in range(n)],
+            "categoryName": [f"Category {i}" for i in range(n)],
+            "categoryCap": [cap * (i + 1) for i in range(n)],
+            "categoryCapChg24h": [0.1 * i for i in range(n)],
+            "categoryVol24h": [np.nan] + [1e6] * (n - 1),
+            "categoryUpdateTime": pd.Timestamp("2024-06-01 09:00", tz="Asia/Tokyo"),
+        }
+    )
+
+
+# 取得日ごとのパーティションに追記してmanifestに記録し、開き直しても最新のスナップショットを型どおりに読めることを確かめる
+def test_append_and_load_latest(tmp_path):
+    store = HistoryStore(str(tmp_path), "categories", CATEGORIES_SCHEMA)
+    store.append(make_categories(3), START)
+    # 同じ時刻 (分単位) のスナップショットは置き換える
+    store.append(make_categories(3, cap=2e9), START + timedelta(seconds=30))
+    entry = store.append(make_categories(4), START + timedelta(hours=2))
+
+    store = HistoryStore(str(tmp_path), "categories", CATEGORIES_SCHEMA)
+    assert len(store) == 2
+    assert store.manifest["latest"] == entry
+    assert entry["path"] == "date=2024-06-02/categories_202406020100.arrow"
+    assert {date: p["rows"] for date, p in store.manifest["partitions"].items()} == {
+        "2024-06-01": 3,
+        "2024-06-02": 4,
+    }
+    assert [e["snapshot"] for e in store.entries()] == ["202406012300", "202406020100"]
+    assert not [
+        name
+        for _, _, files in os.walk(store.dir)
+        for name in files
+        if name.endswith(".tmp")
+    ]
+
+    table = store.load_latest_table()
+    assert (
+        table.schema.field("categoryId").type
+        == CATEGORIES_SCHEMA.field("categoryId").type
+    )
+    assert table.schema.field("categoryCapChg24h").type == pa.float32()
+    df = store.load_latest()
+    assert df["categoryId"].tolist() == [f"cat-{i}" for i in range(4)]
+    assert SNAPSHOT_COLUMN not in df.columns
+    assert df["categoryCapChg24h"].dtype == np.float32
+    assert str(df["categoryUpdateTime"].dt.tz) == "Asia/Tokyo"
+    assert np.isnan(df["categoryVol24h"].iloc[0])
+
+    df_first = to_frame(store.load_table(store.entries()[0]))
+    assert df_first["categoryCap"].tolist() == [2e9, 4e9, 6e9]
+
+
+# 必須の列 (nullable=False) がない・欠損している場合は書き込まないことを確かめる
+def test_append_rejects_missing_keys(tmp_path):
+    store = HistoryStore(str(tmp_path), "categories", CATEGORIES_SCHEMA)
+    df = make_categories(2)
+    df.loc[1, "categoryId"] = None
+    with pytest.raises(ValueError, match="categoryId"):
+        store.append(df, START)
+    with pytest.raises(ValueError, match="categoryId"):
+        store.append(make_categories(2).drop(columns=["categoryId"]), START)
+    assert len(store) == 0
+    assert store.load_latest().empty
+
+
+# 後のスナップショットで増えた列も横断検索で読め、前のスナップショットの行は欠損値になることを確かめる
+def test_query_unifies_schemas(tmp_path):
+    store = HistoryStore(str(tmp_path), "coins")
+    store.append(pd.DataFrame({"coinId": ["a", "b"], "price": [1.0, 2.0]}), START)
+    store.append(
+        pd.DataFrame(
+            {"coinId": ["a", "b"], "price": [1.5, 2.5], "volume": [10.0, 20.0]}
+        ),
+        START + timedelta(hours=1),
+    )
+
+    df = store.query()
+    assert df["volume"].tolist()[2:] == [10.0, 20.0]
+    assert df["volume"].isna().tolist()[:2] == [True, True]
+    df = store.query(columns=["coinId", "volume"], filter=ds.field("coinId") == "b")
+    assert "price" not in df.columns
+    assert df["volume"].isna().tolist() == [True, False]
+    df = store.query(start=START + timedelta(minutes=30))
+    assert df["price"].tolist() == [1.5, 2.5]
+
+
+# 以前のParquetのスナップショット (manifestに記録されたもの) も、Arrow IPCのスナップショットと合わせて読めることを確かめる
+def test_reads_legacy_parquet_snapshots(tmp_path):
+    store = HistoryStore(str(tmp_path), "categories", CATEGORIES_SCHEMA)
+    df_legacy = make_categories(2)
+    table = pa.Table.from_pandas(df_legacy, preserve_index=False)
+    table = table.append_column(
+        SNAPSHOT_COLUMN,
+        pa.array([START] * table.num_rows, pa.timestamp("s", tz="Asia/Tokyo")),
+    )
+    os.makedirs(os.path.join(store.dir, "date=2024-06-01"))
+    path = "date=2024-06-01/categories_202406012300.parquet"
+    pq.write_table(table, os.path.join(store.dir, path))
+    legacy = {
+        "snapshot": "202406012300",
+        "snapshotTime": START.isoformat(),
+        "path": path,
+        "rows": 2,
+    }
+    store.manifest = {
+        "latest": legacy,
+        "partitions": {"2024-06-01": {"files": [legacy], "rows": 2}},
+    }
+    store._write_manifest()
+
+    store = HistoryStore(str(tmp_path), "categories", CATEGORIES_SCHEMA)
+    df = store.load_latest()
+    assert df["categoryId"].tolist() == ["cat-0", "cat-1"]
+    assert df["categoryCapChg24h"].dtype == np.float32
+
+    store.append(make_categories(3), START + timedelta(hours=1))
+    df = store.query(columns=["categoryId", "categoryCap"])
+    assert df["categoryId"].tolist() == ["cat-0", "cat-1", "cat-0", "cat-1", "cat-2"]
+    assert df[SNAPSHOT_COLUMN].nunique() == 2
+
+
+# 辞書エンコードのキーの列はCategoricalのまま読み込み、型なしで保存した場合よりメモリが減ることを確かめる
+def test_load_latest_keeps_dictionary_keys(tmp_path):
+    n = 2000
+    df = pd.DataFrame(
+        {
+            "symbol": [f"COIN{i}USDT" for i in range(n)],
+            "coin": [f"coin{i % 50}" for i in range(n)],
+            "coinId": [f"coin-id-{i}" for i in range(n)],
+            "coinName": [f"Coin Name {i % 50}" for i in range(n)],
+            "assetPlatformId": [["ethereum", "solana", None][i % 3] for i in range(n)],
+            "buyRatio": np.linspace(0, 1, n),
+        }
+    )
+    typed = HistoryStore(str(tmp_path), "typed", COINS_SCHEMA)
+    typed.append(df, START)
+    untyped = HistoryStore(str(tmp_path), "untyped")
+    untyped.append(df, START)
+
+    df_typed = typed.load_latest()
+    df_untyped = untyped.load_latest()
+    for column in ["symbol", "coin", "coinId", "coinName", "assetPlatformId"]:
+        assert isinstance(df_typed[column].dtype, pd.CategoricalDtype)
+        assert df_untyped[column].dtype == object
+        assert df_typed[column].astype(object).equals(df[column].astype(object))
+    assert len(df_typed["coinName"].cat.categories) == 50
+    assert df_typed["assetPlatformId"].isna().sum() == n // 3
+
+    typed_bytes = df_typed.memory_usage(deep=True).sum()
+    untyped_bytes = df_untyped.memory_usage(deep=True).sum()
+    assert typed_bytes < untyped_bytes * 0.75
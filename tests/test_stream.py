@@ -0,0 +1,119 @@
+import http
+import json
+import threading
+import time
+
+from websockets.exceptions import InvalidStatus
+from websockets.sync.server import serve
+
+from cryptolens.stream import TickerStream, TickerTable
+
+
+# 1回目の接続はハンドシェイクで拒否し、2回目はJSONでないメッセージを送り、3回目からティッカーを送るサーバー
+def make_server():
+    n_connections = []
+
+    def process_request(connection, request):
+        n_connections.append(1)
+        if len(n_connections) == 1:
+            return connection.respond(http.HTTPStatus.FORBIDDEN, "Forbidden\n")
+        return None
+
+    def handler(websocket):
+        websocket.recv()
+        if len(n_connections) == 2:
+            websocket.send("not json")
+        else:
+            message = {
+                "topic": "tickers.BTCUSDT",
+                "ts": 1_700_000_000_000,
+                "data": {"symbol": "BTCUSDT", "lastPrice": "42000.5"},
+            }
+            websocket.send(json.dumps(message))
+        for _ in websocket:
+            pass
+
+    server = serve(handler, "127.0.0.1", 0, process_request=process_request)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ハンドシェイクの拒否と不正なメッセージの後も再接続して受信を続け、最後のエラーを記録することを確かめる
+def test_ticker_stream_reconnects_after_errors():
+    server = make_server()
+    host, port = server.socket.getsockname()[:2]
+    table = TickerTable(["BTCUSDT"])
+    stream = TickerStream(table, url=f"ws://{host}:{port}", max_backoff=0.05).start()
+    try:
+        deadline = time.monotonic() + 10
+        while table.n_messages == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert table.n_messages == 1
+        assert table.snapshot()["currentPrice"].tolist() == [42000.5]
+        assert stream.is_alive()
+        assert stream.connected
+        assert stream.n_connects == 2
+        assert isinstance(stream.last_error, ValueError)
+        assert stream.last_message_time is not None
+    finally:
+        stream.stop()
+        server.shutdown()
+    assert not stream.is_alive()
+
+
+# ハンドシェイクが拒否され続ける間もスレッドは終了せず、エラーを確認できることを確かめる
+def test_ticker_stream_reports_rejected_handshake():
+    def process_request(connection, request):
+        return connection.respond(http.HTTPStatus.FORBIDDEN, "Forbidden\n")
+
+    server = serve(
+        lambda websocket: None, "127.0.0.1", 0, process_request=process_request
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.socket.getsockname()[:2]
+    stream = TickerStream(
+        TickerTable(["BTCUSDT"]), url=f"ws://{host}:{port}", max_backoff=0.05
+    ).start()
+    try:
+        deadline = time.monotonic() + 10
+        while stream.last_error is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert isinstance(stream.last_error, InvalidStatus)
+        assert stream.is_alive()
+        assert not stream.connected
+    finally:
+        stream.stop()
+        server.shutdown()
+
+
+# JSONとして読めてもオブジェクトでないメッセージは読み飛ばし、同じ接続で受信を続けることを確かめる
+def test_ticker_stream_skips_non_object_messages():
+    def handler(websocket):
+        websocket.recv()
+        for raw in ["[1, 2]", "42", "null", '{"topic": null}']:
+            websocket.send(raw)
+        message = {
+            "topic": "tickers.BTCUSDT",
+            "ts": 1_700_000_000_000,
+            "data": {"symbol": "BTCUSDT", "lastPrice": "42000.5"},
+        }
+        websocket.send(json.dumps(message))
+        for _ in websocket:
+            pass
+
+    server = serve(handler, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.socket.getsockname()[:2]
+    table = TickerTable(["BTCUSDT"])
+    stream = TickerStream(table, url=f"ws://{host}:{port}", max_backoff=0.05).start()
+    try:
+        deadline = time.monotonic() + 10
+        while table.n_messages == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert table.n_messages == 1
+        assert stream.is_alive()
+        assert stream.n_connects == 1
+        assert stream.last_error is None
+    finally:
+        stream.stop()
+        server.shutdown()
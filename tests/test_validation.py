@@ -0,0 +1,118 @@
+import json
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cryptolens.validation import Rule, validate
+
+NOW = pd.Timestamp("2024-06-01 12:00", tz="Asia/Tokyo")
+
+
+# ルールごとの違反を確かめるための5行のdf (coin-0はすべてのルールを満たす)
+def make_frame():
+    return pd.DataFrame(
+        {
+            "coinId": [f"coin-{i}" for i in range(5)],
+            "coinPlatforms": [
+                ["ethereum", "solana"],
+                ["ethereum"],
+                [],
+                None,
+                ["solana", "ethereum"],
+            ],
+            "platforms": [
+                ["ethereum", "solana"],
+                ["solana"],
+                None,
+                [],
+                ["ethereum", "solana"],
+            ],
+            "assetPlatformId": ["ethereum", "solana", None, "ethereum", "solana"],
+            "coinName": ["Coin 0", None, "Coin 2", "Coin 3", "Coin 4"],
+            "coinCap": [1e9, 0.0, np.nan, 5e8, -1.0],
+            "currentPrice": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "detailUpdateTime": [
+                NOW - timedelta(hours=1),
+                NOW - timedelta(days=3),
+                pd.NaT,
+                NOW - timedelta(hours=47),
+                NOW,
+            ],
+        }
+    )
+
+
+def run(rule, df=None):
+    report = validate(make_frame() if df is None else df, [rule], now=NOW)
+    (result,) = report.results
+    return result
+
+
+# 2つのリストの列の順序まで比べ、欠損値は空のリストとみなすことを確かめる
+def test_list_equal():
+    result = run(Rule("platforms", "list_equal", ["coinPlatforms", "platforms"]))
+    assert result["checked"] == 5
+    assert list(result["ids"]) == ["coin-1", "coin-4"]
+
+
+# リストの最初の要素と比べ、比べる列が欠損している行は対象外にすることを確かめる
+def test_first_element():
+    result = run(Rule("first", "first_element", ["coinPlatforms", "assetPlatformId"]))
+    assert result["checked"] == 4
+    assert list(result["ids"]) == ["coin-1", "coin-3"]
+
+
+# 欠損値のある行を違反とすることを確かめる
+def test_not_null():
+    result = run(Rule("required", "not_null", ["coinId", "coinName"]))
+    assert list(result["ids"]) == ["coin-1"]
+
+
+# 0以下の値を違反とし、欠損値は違反としないことを確かめる
+def test_positive():
+    result = run(Rule("positive", "positive", ["coinCap", "currentPrice"]))
+    assert list(result["ids"]) == ["coin-1", "coin-4"]
+
+
+# paramより古い日時と欠損値を違反とすることを確かめる
+def test_fresh():
+    result = run(Rule("fresh", "fresh", ["detailUpdateTime"], timedelta(days=2)))
+    assert list(result["ids"]) == ["coin-1", "coin-2"]
+
+
+# Arrowのリストの列 (pd.ArrowDtype) でも同じ結果になることを確かめる
+def test_list_rules_on_arrow_columns():
+    df = make_frame()
+    for column in ["coinPlatforms", "platforms"]:
+        df[column] = pd.Series(
+            pa.array(df[column], pa.list_(pa.string())),
+            dtype=pd.ArrowDtype(pa.list_(pa.string())),
+        )
+    result = run(Rule("platforms", "list_equal", ["coinPlatforms", "platforms"]), df)
+    assert list(result["ids"]) == ["coin-1", "coin-4"]
+    result = run(
+        Rule("first", "first_element", ["coinPlatforms", "assetPlatformId"]), df
+    )
+    assert list(result["ids"]) == ["coin-1", "coin-3"]
+
+
+# dfにない列を使うルールは対象外にし、違反がなければokで、レポートをJSONに保存できることを確かめる
+def test_report(tmp_path):
+    rules = [
+        Rule("missing", "not_null", ["noSuchColumn"]),
+        Rule("price", "positive", ["currentPrice"]),
+        Rule("name", "not_null", ["coinName"]),
+    ]
+    report = validate(make_frame(), rules, now=NOW)
+    assert [result["rule"] for result in report.results] == ["price", "name"]
+    assert not report.ok
+    assert validate(make_frame(), rules[:2], now=NOW).ok
+
+    path = tmp_path / "report.json"
+    report.save(str(path))
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["created"] == NOW.isoformat()
+    assert [rule["ids"] for rule in saved["rules"]] == [[], ["coin-1"]]